@@ -0,0 +1,252 @@
+import os
+import sys
+import json
+import time
+import zlib
+import logging
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+from lightkurve.lightcurve import LightCurve
+
+from protify.classifier import generate_summary_from_raw
+from protify.periodogram import (GLS, GLS_BACKENDS, SCREENED_FLAG, UNC_METHODS, compute_rotation_metrics, load_sector_arrays,
+                                 unc_fit_batch)
+from protify.results import flatten_results, sector_items
+
+logger = logging.getLogger(__name__)
+
+# Cadences of 2-minute targets and of the 10- and 30-minute full-frame images, in minutes
+CADENCES = {"2min": 2., "10min": 10., "30min": 30.}
+SECTOR_DAYS = 27.4
+# A period counts as recovered within this relative error
+RECOVERY_RTOL = 0.05
+
+def synthetic_sector(period, cadence="30min", rng=None, start=0., amplitude=0.01, noise=2e-3, gap=1.,
+                     nan_fraction=0.005):
+    """
+    One TESS-like sector of spot modulation: a fundamental plus first harmonic
+    at ``period`` (days), a slowly evolving amplitude, white noise, a
+    mid-sector downlink gap of ``gap`` days and a few NaN cadences.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    t = np.arange(start, start + SECTOR_DAYS, CADENCES[cadence] / 1440.)
+    t = t[np.abs(t - (start + SECTOR_DAYS / 2)) > gap / 2]
+    phase = rng.uniform(0, 2 * np.pi, 2)
+    envelope = 1 + 0.3 * np.sin(2 * np.pi * t / (4 * SECTOR_DAYS) + phase[1])
+    signal = amplitude * envelope * (np.sin(2 * np.pi * t / period + phase[0]) +
+                                     0.3 * np.sin(4 * np.pi * t / period + 2 * phase[0]))
+    flux = 1 + signal + rng.normal(0, noise, len(t))
+    flux[rng.random(len(t)) < nan_fraction] = np.nan
+    return LightCurve(time=t, flux=flux, flux_err=np.full(len(t), noise))
+
+def synthetic_star(period, n_sectors, cadence="30min", rng=None, **sector_kwds):
+    """Consecutive sectors of one star, returned like ``download_tess_lightcurves``."""
+    rng = np.random.default_rng() if rng is None else rng
+    lcs = [synthetic_sector(period, cadence, rng, start=k * SECTOR_DAYS, **sector_kwds) for k in range(n_sectors)]
+    return lcs, [f"TESS Sector {k + 1:02d}" for k in range(n_sectors)]
+
+def random_periods(n, rng, min_period=0.5, max_period=12.):
+    # Log-uniform over the periods a single sector constrains
+    return np.exp(rng.uniform(np.log(min_period), np.log(max_period), n))
+
+def recovery(prots, periods):
+    prots, periods = np.asarray(prots, dtype=float), np.asarray(periods, dtype=float)
+    rel = np.abs(prots - periods) / periods
+    return {"recovered": float(np.mean(rel <= RECOVERY_RTOL)), "median_rel_err": float(np.nanmedian(rel))}
+
+def case_rng(seed, *case):
+    # Each case draws from its own stream, so its light curves do not depend on which other cases run
+    return np.random.default_rng([seed, zlib.crc32(repr(case).encode())])
+
+def measure(func, repeat=3):
+    """
+    Best and median wall time of ``func`` over ``repeat`` runs, and the peak
+    traced allocation of one further run. Info and debug logs of the timed
+    code are suppressed.
+    """
+    times = []
+    root = logging.getLogger("protify")
+    level = root.level
+    root.setLevel(max(level, logging.WARNING))
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            out = func()
+            times.append(time.perf_counter() - start)
+        # Memory is traced in a separate run so tracing does not slow the timed ones
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    finally:
+        root.setLevel(level)
+    return out, {"seconds": min(times), "seconds_median": float(np.median(times)), "peak_mb": peak / 2**20}
+
+def bench_gls(cadences, backends, n, repeat, seed):
+    rows = []
+    for cadence in cadences:
+        rng = case_rng(seed, "gls", cadence, n)
+        periods = random_periods(n, rng)
+        sectors = [load_sector_arrays(synthetic_sector(p, cadence, rng)) for p in periods]
+        for backend in backends:
+            out, timing = measure(lambda: [GLS(*s, backend=backend) for s in sectors], repeat)
+            rows.append(dict(bench="gls", variant=backend, cadence=cadence, size=n,
+                             npts=int(np.mean([len(s[0]) for s in sectors])), **timing,
+                             per_item=timing["seconds"] / n, **recovery([o[3] for o in out], periods)))
+            logger.info(_progress(rows[-1]))
+    return rows
+
+def bench_unc_fit(cadences, methods, n, repeat, seed):
+    rows = []
+    for cadence in cadences:
+        rng = case_rng(seed, "unc_fit", cadence, n)
+        periods = random_periods(n, rng)
+        peaks = []
+        for p in periods:
+            freq, _, pgramy, prot = GLS(*load_sector_arrays(synthetic_sector(p, cadence, rng)), backend="fast")[:4]
+            peaks.append((freq, pgramy, prot))
+        for method in methods:
+            out, timing = measure(lambda: unc_fit_batch(*zip(*peaks), method=method), repeat)
+            rows.append(dict(bench="unc_fit", variant=method, cadence=cadence, size=n, **timing,
+                             per_item=timing["seconds"] / n, fit_ok=float(np.mean(np.isfinite(out[0]) & (out[0] > 0)))))
+            logger.info(_progress(rows[-1]))
+    return rows
+
+def bench_rotation_metrics(cadences, backends, sector_counts, repeat, seed, compact=False, screen=False):
+    # Compact variants keep no arrays, as in a run with --compact but without --save-lc
+    modes = [("", {})] + ([("+compact", dict(compact=True, periodograms="none", keep_lightcurves=False))]
+                          if compact else [])
+    modes += [(suffix + "+screen", dict(kwds, screen=True)) for suffix, kwds in modes] if screen else []
+    rows = []
+    for cadence in cadences:
+        for n_sectors in sector_counts:
+            rng = case_rng(seed, "rotation_metrics", cadence, n_sectors)
+            period = float(random_periods(1, rng)[0])
+            stars = [("", synthetic_star(period, n_sectors, cadence, rng))]
+            if screen:
+                # Non-rotating stars, which the screen is meant to rule out cheaply
+                stars.append(("/flat", synthetic_star(period, n_sectors, cadence, rng, amplitude=0.)))
+            for backend in backends:
+                for star, (lcs, sectors) in stars:
+                    for suffix, kwds in modes:
+                        out, timing = measure(lambda: compute_rotation_metrics(lcs, sectors, "0", backend=backend,
+                                                                               **kwds), repeat)
+                        items = [r for _, r in sector_items(out["Results"])]
+                        if star:
+                            accuracy = {"screened": float(np.mean([r["peakflag"] == SCREENED_FLAG for r in items]))}
+                        else:
+                            accuracy = recovery([r["prot"] for r in items], [period] * len(items))
+                        rows.append(dict(bench="rotation_metrics", variant=backend + suffix + star, cadence=cadence,
+                                         size=n_sectors, **timing, per_item=timing["seconds"] / n_sectors, **accuracy))
+                        logger.info(_progress(rows[-1]))
+    return rows
+
+def synthetic_raw(n_stars, rng, max_sectors=13, work_dir="."):
+    """
+    Wide raw results of ``n_stars`` stars whose sectors mostly detect the true
+    period (some at a harmonic or as noise), written to a CSV for the summary.
+    """
+    periods = random_periods(n_stars, rng)
+    rows = []
+    for tic, period in enumerate(periods, start=1):
+        n = int(rng.integers(1, max_sectors + 1))
+        factor = rng.choice([1., 1., 1., 1., 0.5, 2.], n)
+        noise = rng.random(n) < 0.15
+        prot = np.where(noise, rng.uniform(0.1, 20, n), period * factor * rng.normal(1, 0.01, n))
+        results = {str(i): {"sector": f"TESS Sector {i + 1:02d}", "prot": prot[i], "uncsec": 0.03 * prot[i],
+                            "power": 0.2 if noise[i] else 0.6, "medpower": 0.01, "peakflag": 1} for i in range(n)}
+        rows.append(flatten_results({"TIC": tic, "gmag": 12.}, results))
+    path = os.path.join(work_dir, f"bench_raw_{n_stars}.csv")
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path, periods
+
+def bench_summary(star_counts, repeat, seed, work_dir="."):
+    rows = []
+    for n_stars in star_counts:
+        raw, periods = synthetic_raw(n_stars, case_rng(seed, "summary", n_stars), work_dir=work_dir)
+        summary = os.path.join(work_dir, f"bench_summary_{n_stars}.csv")
+        _, timing = measure(lambda: generate_summary_from_raw(raw, summary, autoval_only=False), repeat)
+        out = pd.read_csv(summary)
+        rows.append(dict(bench="summary", variant="default", cadence=None, size=n_stars, **timing,
+                         per_item=timing["seconds"] / n_stars,
+                         **recovery(out["FinalProt"], periods[out["TIC"].to_numpy() - 1])))
+        logger.info(_progress(rows[-1]))
+        for path in (raw, summary):
+            os.remove(path)
+    return rows
+
+def _progress(row):
+    accuracy = f" recovered {row['recovered']:.0%}" if "recovered" in row else ""
+    accuracy += f" screened {row['screened']:.0%}" if "screened" in row else ""
+    return (f"  {row['bench']:<16} {row['variant']:<12} {row['cadence'] or '':<6} size {row['size']:<6} "
+            f"{row['seconds']:.4f}s ({row['per_item'] * 1e3:.2f} ms/item) peak {row['peak_mb']:.1f} MB{accuracy}")
+
+def run_benchmarks(output="bench_results.json", benches=("gls", "unc_fit", "rotation_metrics", "summary"),
+                   cadences=tuple(CADENCES), backends=GLS_BACKENDS, unc_methods=UNC_METHODS, n=8,
+                   sector_counts=(1, 4, 13), star_counts=(1000, 10000), repeat=3, seed=42, compare=None, compact=False,
+                   screen=False):
+    """
+    Time the period-finding hot path on synthetic light curves with known
+    periods, fully offline, and save the results as JSON. ``compare`` is a
+    previous results file; matching cases are printed with their speed ratio.
+    ``compact`` adds compact-mode variants to the rotation_metrics benchmark,
+    ``screen`` variants with the coarse screen plus non-rotating stars.
+    """
+    for cadence in cadences:
+        if cadence not in CADENCES:
+            raise ValueError(f"Unknown cadence '{cadence}'. Use one of {tuple(CADENCES)}.")
+    work_dir = os.path.dirname(os.path.abspath(output))
+
+    rows = []
+    for bench in benches:
+        logger.info("Benchmark: %s", bench)
+        if bench == "gls":
+            rows += bench_gls(cadences, backends, n, repeat, seed)
+        elif bench == "unc_fit":
+            rows += bench_unc_fit(cadences, unc_methods, n, repeat, seed)
+        elif bench == "rotation_metrics":
+            rows += bench_rotation_metrics(cadences, backends, sector_counts, repeat, seed, compact, screen)
+        elif bench == "summary":
+            rows += bench_summary(star_counts, repeat, seed, work_dir)
+        else:
+            raise ValueError(f"Unknown benchmark '{bench}'.")
+
+    report = {
+        "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                 "numpy": np.__version__, "platform": platform.platform(), "processor": platform.processor(),
+                 "cpus": os.cpu_count(), "seed": seed, "repeat": repeat},
+        "results": rows,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=1)
+    logger.info("Saved benchmark results to %s", output)
+
+    if compare:
+        compare_benchmarks(compare, report)
+    return report
+
+def _load_report(report):
+    if isinstance(report, dict):
+        return report
+    with open(report) as f:
+        return json.load(f)
+
+def compare_benchmarks(baseline, current):
+    """Print the speed ratio (baseline / current) of cases present in both result files."""
+    key = ["bench", "variant", "cadence", "size"]
+    old = pd.DataFrame(_load_report(baseline)["results"]).fillna({"cadence": ""})
+    new = pd.DataFrame(_load_report(current)["results"]).fillna({"cadence": ""})
+    merged = old.merge(new, on=key, suffixes=("_old", "_new"))
+    if merged.empty:
+        logger.warning("No matching benchmark cases to compare.")
+        return merged
+    merged["speedup"] = merged["seconds_old"] / merged["seconds_new"]
+    columns = key + ["seconds_old", "seconds_new", "speedup", "peak_mb_old", "peak_mb_new"]
+    columns += [c for c in ("recovered_old", "recovered_new", "screened_old", "screened_new") if c in merged.columns]
+    logger.info("Comparison with %s:\n%s", baseline if isinstance(baseline, str) else "baseline",
+                merged[columns].to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+    return merged
@@ -1,12 +1,98 @@
+import os
+import json
+import logging
+import hashlib
 import pandas as pd
 import numpy as np
-from sklearn.ensemble import RandomForestClassifier
 
+from protify.metrics import count, stage
+from protify.results import ResumeIndex, read_raw_results
 
-def run_classifier(input_file, train_file, output_file, use_autoval=True):
-    df = pd.read_csv(input_file)
+logger = logging.getLogger(__name__)
+
+
+MODEL_PARAMS = dict(n_estimators=450, max_depth=15)
+
+def _training_key(train, feature_cols, params):
+    # Hash of the rows and settings the forest is fit on, plus the scikit-learn
+    # version so artifacts pickled by another release are not reused
+    import sklearn
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(train[feature_cols + ['rotate?']], index=False).to_numpy().tobytes())
+    digest.update(json.dumps({"features": feature_cols, "params": params, "sklearn": sklearn.__version__},
+                             sort_keys=True).encode())
+    return digest.hexdigest()
+
+def train_classifier(train_file, model_file=None, cache_dir=None, n_jobs=None, **params):
+    """
+    Fit the rotator random forest on ``train_file`` and return the model
+    artifact, a dict with the fitted ``model``, its ``feature_cols`` and the
+    training ``key``.
+
+    With ``cache_dir`` the artifact is stored as ``rf-<key>.joblib`` and reused
+    while the training rows, features and hyperparameters are unchanged.
+    ``model_file`` additionally writes the artifact to that path.
+    """
+    params = dict(MODEL_PARAMS, **params)
     train = pd.read_csv(train_file)
 
+    # Determine feature columns from training set
+    feature_cols = [col for col in train.columns if col not in ['rotate?', 'TIC', 'provenance', 'cluster', 'source_id']]
+    train = train.dropna(subset=feature_cols + ['rotate?'])
+    key = _training_key(train, feature_cols, params)
+
+    cached = os.path.join(cache_dir, f"rf-{key[:16]}.joblib") if cache_dir else None
+    if cached and os.path.exists(cached):
+        artifact = load_model(cached, n_jobs=n_jobs)
+        logger.info("Loaded cached classifier from %s", cached)
+    else:
+        # scikit-learn is only imported to train, so summaries and cached models load quickly
+        from sklearn.ensemble import RandomForestClassifier
+        rf = RandomForestClassifier(n_jobs=n_jobs, **params)
+        with stage("train"):
+            rf.fit(train[feature_cols], train['rotate?'])
+        count("training_rows", len(train))
+        artifact = {"model": rf, "feature_cols": feature_cols, "key": key, "params": params}
+        if cached:
+            save_model(artifact, cached)
+            logger.info("Cached classifier to %s", cached)
+
+    if model_file:
+        save_model(artifact, model_file)
+        logger.info("Saved classifier to %s", model_file)
+    return artifact
+
+def save_model(artifact, model_file):
+    import joblib
+    if os.path.dirname(model_file):
+        os.makedirs(os.path.dirname(model_file), exist_ok=True)
+    joblib.dump(artifact, model_file + ".tmp")
+    os.replace(model_file + ".tmp", model_file)
+
+def load_model(model_file, n_jobs=None):
+    import joblib
+    with stage("load_model"):
+        artifact = joblib.load(model_file)
+    if not isinstance(artifact, dict) or "model" not in artifact or "feature_cols" not in artifact:
+        raise ValueError(f"{model_file} is not a protify classifier artifact.")
+    artifact["model"].n_jobs = n_jobs
+    return artifact
+
+def run_classifier(input_file, train_file=None, output_file="rotation_classified.csv", use_autoval=True,
+                   model_file=None, cache_dir=None, n_jobs=None):
+    """
+    Classify the stars of a summary CSV as rotators. The forest is loaded from
+    ``model_file`` when given (see ``protify train``), otherwise trained on
+    ``train_file``, reusing a cached model from ``cache_dir`` when possible.
+    """
+    if model_file:
+        artifact = load_model(model_file, n_jobs=n_jobs)
+    elif train_file:
+        artifact = train_classifier(train_file, cache_dir=cache_dir, n_jobs=n_jobs)
+    else:
+        raise ValueError("run_classifier needs either a model_file or a train_file.")
+    df = pd.read_csv(input_file)
+
     # If requested, filter to AutoVal? == 1 stars
     if use_autoval and 'AutoVal?' in df.columns:
         df = df[df['AutoVal?'] == 1]
@@ -21,46 +107,75 @@ def run_classifier(input_file, train_file, output_file, use_autoval=True):
     if 'Sectors' in df.columns and 'mpower' not in df.columns:
         df['mpower'] = df['Sectors']  # crude proxy fallback
 
-    # Determine feature columns from training set
-    feature_cols = [col for col in train.columns if col not in ['rotate?', 'TIC', 'provenance', 'cluster', 'source_id']]
-    train = train.dropna(subset=feature_cols + ['rotate?'])
+    feature_cols = artifact["feature_cols"]
     test = df.dropna(subset=feature_cols)
 
     if test.empty:
-        print("Warning: no valid rows to classify after filtering.")
+        logger.warning("Warning: no valid rows to classify after filtering.")
         df.to_csv(output_file, index=False)
         return
 
-    X_train = train[feature_cols]
-    y_train = train['rotate?']
     X_test = test[feature_cols]
 
-    rf = RandomForestClassifier(n_estimators=450, max_depth=15)
-    rf.fit(X_train, y_train)
-    y_pred = rf.predict(X_test)
-    y_prob = rf.predict_proba(X_test)[:, 1]  # Probability of being rotator
+    rf = artifact["model"]
+    with stage("predict"):
+        y_pred = rf.predict(X_test)
+        y_prob = rf.predict_proba(X_test)[:, 1]  # Probability of being rotator
+    count("classified", len(X_test))
 
     df.loc[test.index, 'rotate?'] = y_pred
     df.loc[test.index, 'rotation_prob'] = y_prob
 
-    # Print debug info
-    print("\nClassification results (rotate? = 1 means rotator):")
-    for i in test.index:
-        tid = df.loc[i, "TIC"] if "TIC" in df.columns else i
-        flag = df.loc[i, "rotate?"]
-        prob = df.loc[i, "rotation_prob"]
-        print(f"TIC {tid} | rotate?: {flag} | Prob: {prob:.3f}")
-        if flag == 0:
-            print(f"  ⚠️  Not flagged as rotator. Features:")
-            print(df.loc[i, feature_cols])
+    logger.info("Classified %d stars: %d rotators.", len(test), int(np.sum(y_pred == 1)))
+    # Per-star debug info; the rows are not visited at all unless it is shown
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Classification results (rotate? = 1 means rotator):")
+        for i in test.index:
+            tid = df.loc[i, "TIC"] if "TIC" in df.columns else i
+            flag = df.loc[i, "rotate?"]
+            prob = df.loc[i, "rotation_prob"]
+            logger.debug("TIC %s | rotate?: %s | Prob: %.3f", tid, flag, prob)
+            if flag == 0:
+                logger.debug("  ⚠️  Not flagged as rotator. Features:\n%s", df.loc[i, feature_cols])
 
     df.to_csv(output_file, index=False)
 
-def generate_summary_from_raw(raw_csv_path, out_csv_path="rotation_summary.csv", autoval_only=True):
+def _sector_matrix(df, key, n, coerce=True):
+    # Stack the {i}_<key> columns into a (stars x sectors) float array; without
+    # coercion, non-numeric columns count as missing
+    columns = []
+    for i in range(n):
+        col = df[f"{i}_{key}"]
+        if coerce:
+            col = pd.to_numeric(col, errors="coerce")
+        elif not pd.api.types.is_numeric_dtype(col):
+            col = pd.Series(np.nan, index=df.index)
+        columns.append(col.to_numpy(dtype=np.float64))
+    return np.column_stack(columns) if columns else np.empty((len(df), 0))
+
+def _masked_rows(values, mask, func):
+    # func over each row's masked entries (NaN for rows without any). Rows are
+    # grouped by their number of entries, so numpy reduces the same sequences
+    # in the same order as it would for a per-row list.
+    out = np.full(len(values), np.nan)
+    counts = mask.sum(axis=1)
+    for k in np.unique(counts[counts > 0]):
+        rows = counts == k
+        out[rows] = func(values[rows][mask[rows]].reshape(-1, k), axis=1)
+    return out
+
+def _int_if_complete(values):
+    return values.astype(int) if not np.isnan(values).any() else values
+
+def generate_summary_from_raw(raw_csv_path, out_csv_path="rotation_summary.csv", autoval_only=True, tics=None):
+    """
+    Per-star summary of the raw results. With ``tics`` only those stars are
+    summarized and their rows replace theirs in an existing summary.
+    """
     import pandas as pd
     import numpy as np
 
-    cc = pd.read_csv(raw_csv_path)
+    cc = read_raw_results(raw_csv_path, tics)
     snr = 40
 
     n_obs = max(int(col.split("_")[0]) for col in cc.columns if "_power" in col and col.split("_")[0].isdigit())
@@ -74,105 +189,76 @@ def generate_summary_from_raw(raw_csv_path, out_csv_path="rotation_summary.csv",
         cc[labels[6]] = pd.to_numeric(cc[labels[4]], errors="coerce") / pd.to_numeric(cc[labels[5]], errors="coerce")
         cc[labels[7]] = (cc[labels[0]] >= snr) & (cc[labels[6]] <= 0.25)
 
-    fprots, funcs, avals, match_counts, counts, sector_counts = [], [], [], [], [], []
-
-    for j in cc.index:
-        row = cc.loc[j]
-        nanprots, nanuncs, allprots, alluncs = [], [], [], []
-        count = 0
-        sector_count = 0
-        for i in range(min(n_obs + 1, 25)):
-            if row.get(f"{i}_detect") == 1:
-                nanprots.append(row.get(f"{i}_prot"))
-                nanuncs.append(row.get(f"{i}_uncsec"))
-                count += 1
-            if isinstance(row.get(f"{i}_sector"), str):
-                sector_count += 1
-                allprots.append(row.get(f"{i}_prot"))
-                alluncs.append(row.get(f"{i}_uncsec"))
-
-        counts.append(count)
-        sector_counts.append(sector_count)
-
-        if count > 1:
-            median = np.median(nanprots)
-            median_unc = np.median(nanuncs)
-            match_count, fprot_init, func_init = 0, [], []
-
-            for prot_n, unc_n in zip(nanprots, nanuncs):
-                frac = prot_n / median
-                unci = np.sqrt((unc_n / prot_n) ** 2 + (median_unc / median) ** 2)
-                unc = frac * unci
-
-                if (frac - 2 * unc < 0.5 < frac + 2 * unc or
-                    frac - 2 * unc < 2 < frac + 2 * unc or
-                    (frac - 2 * unc < 1 < frac + 2 * unc) or
-                    (round(frac, 0) == 1 and unci < 0.05)):
-                    match_count += 1
-                    fprot_init.append(median)
-                    func_init.append(median_unc)
-                else:
-                    fprot_init.append(np.nan)
-                    func_init.append(np.nan)
-
-            match_counts.append(match_count)
-            avals.append(int(match_count >= (2 / 3) * count))
-
-            if np.all(np.isnan(fprot_init)):
-                fprot = np.nan
-                func = np.nan
-                print(f"[WARN] All sector matches rejected for TIC {row.get('TIC', j)}")
-            else:
-                fprot = np.nanmax(fprot_init)
-                func = func_init[np.nanargmax(fprot_init)]
-
-        elif count == 1:
-            fprot = nanprots[0]
-            func = nanuncs[0]
-            avals.append(0)
-            match_counts.append(np.nan)
-
-        else:
-            fprot = np.median(allprots)
-            func = np.median(alluncs)
-            avals.append(np.nan)
-            match_counts.append(np.nan)
-
-        fprots.append(fprot)
-        funcs.append(func)
+    # Per-sector columns as (stars x sectors) arrays
+    n_cap = min(n_obs + 1, 25)
+    prots = _sector_matrix(cc, "prot", n_cap)
+    uncs = _sector_matrix(cc, "uncsec", n_cap)
+    detected = np.column_stack([cc[f"{i}_detect"].to_numpy(dtype=bool) for i in range(n_cap)])
+    has_sector = np.column_stack([
+        cc[f"{i}_sector"].notna().to_numpy() & (not pd.api.types.is_numeric_dtype(cc[f"{i}_sector"]))
+        if f"{i}_sector" in cc.columns else np.zeros(len(cc), dtype=bool)
+        for i in range(n_cap)
+    ])
+
+    counts = detected.sum(axis=1)
+    sector_counts = has_sector.sum(axis=1)
+    median = _masked_rows(prots, detected, np.median)
+    median_unc = _masked_rows(uncs, detected, np.median)
+
+    # Harmonic matching of each detection against the star's median period
+    with np.errstate(all="ignore"):
+        frac = prots / median[:, None]
+        unci = np.sqrt((uncs / prots) ** 2 + (median_unc / median)[:, None] ** 2)
+        unc = frac * unci
+        matched = detected & (
+            ((frac - 2 * unc < 0.5) & (0.5 < frac + 2 * unc)) |
+            ((frac - 2 * unc < 2) & (2 < frac + 2 * unc)) |
+            ((frac - 2 * unc < 1) & (1 < frac + 2 * unc)) |
+            ((np.round(frac, 0) == 1) & (unci < 0.05))
+        )
+    match_count = matched.sum(axis=1)
+
+    multi, single, none = counts > 1, counts == 1, counts == 0
+    rejected = cc.index[multi & (match_count == 0)]
+    if len(rejected):
+        logger.info("All sector matches rejected for %d stars", len(rejected))
+    if logger.isEnabledFor(logging.DEBUG):
+        for j in rejected:
+            logger.debug("[WARN] All sector matches rejected for TIC %s", cc.loc[j].get('TIC', j))
+
+    fprots = np.where(single | (multi & (match_count > 0)), median, np.nan)
+    funcs = np.where(single | (multi & (match_count > 0)), median_unc, np.nan)
+    fprots[none] = _masked_rows(prots, has_sector, np.median)[none]
+    funcs[none] = _masked_rows(uncs, has_sector, np.median)[none]
+
+    avals = np.where(multi, (match_count >= (2 / 3) * counts).astype(float), np.nan)
+    avals[single] = 0
+    match_counts = np.where(multi, match_count, np.nan)
 
     cc["FinalProt"] = fprots
     cc["FinalUnc"] = funcs
-    cc["AutoVal?"] = avals
+    cc["AutoVal?"] = _int_if_complete(avals)
     cc["Detect"] = counts
-    cc["Matches"] = match_counts
+    cc["Matches"] = _int_if_complete(match_counts)
     cc["Sectors"] = sector_counts
     cc["ReliableDetection"] = cc["AutoVal?"] == 1  # ✅ New column
 
     valid_df = cc[cc["AutoVal?"] == 1] if autoval_only else cc.copy()
 
     # Add final mean metrics (renamed funcs → mean_funcs)
-    snrs, powers, mpowers, mean_funcs = [], [], [], []
-    for _, row in valid_df.iterrows():
-        detects = []
-        for i in range(n_obs + 1):
-            try:
-                if (row.get(f"{i}_power") / row.get(f"{i}_medpower", 1) >= snr and
-                        row.get(f"{i}_fracuncsec", 1) <= 0.25):
-                    detects.append(i)
-            except:
-                continue
-
-        try:
-            snrs.append(np.mean([row.get(f"{i}_power") / row.get(f"{i}_medpower", 1) for i in detects]) if detects else np.nan)
-            powers.append(np.mean([row.get(f"{i}_power") for i in detects]) if detects else np.nan)
-            mpowers.append(np.mean([row.get(f"{i}_medpower") for i in detects]) if detects else np.nan)
-            mean_funcs.append(np.mean([row.get(f"{i}_fracuncsec") for i in detects]) if detects else np.nan)
-        except:
-            snrs.append(np.nan)
-            powers.append(np.nan)
-            mpowers.append(np.nan)
-            mean_funcs.append(np.nan)
+    powers_i = _sector_matrix(valid_df, "power", n_obs + 1, coerce=False)
+    medpowers_i = _sector_matrix(valid_df, "medpower", n_obs + 1, coerce=False)
+    fracuncs_i = _sector_matrix(valid_df, "fracuncsec", n_obs + 1, coerce=False)
+    with np.errstate(all="ignore"):
+        ratios = powers_i / medpowers_i
+        # A zero median power counts as no detection (it raised ZeroDivisionError
+        # when rows were iterated as Python floats)
+        detects = (ratios >= snr) & (fracuncs_i <= 0.25) & (medpowers_i != 0)
+
+    snrs = _masked_rows(ratios, detects, np.mean)
+    powers = _masked_rows(powers_i, detects, np.mean)
+    mpowers = _masked_rows(medpowers_i, detects, np.mean)
+    mean_funcs = _masked_rows(fracuncs_i, detects, np.mean)
 
     valid_df["snr"] = snrs
     valid_df["power"] = powers
@@ -188,15 +274,56 @@ def generate_summary_from_raw(raw_csv_path, out_csv_path="rotation_summary.csv",
 
     out_df = valid_df.dropna(subset=summary_cols)
 
-    print("\nFinal summary per star:")
-    for idx, row in out_df.iterrows():
-        star_id = row.get("TIC", idx)
-        try:
-            print(f"{star_id} | Prot: {row['prot']:.3f} | SNR: {row['snr']:.2f} | "
-                  f"Power: {row['power']:.2f} | MedPower: {row['mpower']:.2f} | "
-                  f"FracUnc: {row['func']:.3f}")
-        except Exception as e:
-            print(f"{star_id} | Incomplete data: {e}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Final summary per star:")
+        for idx, row in out_df.iterrows():
+            star_id = row.get("TIC", idx)
+            try:
+                logger.debug("%s | Prot: %.3f | SNR: %.2f | Power: %.2f | MedPower: %.2f | FracUnc: %.3f",
+                             star_id, row['prot'], row['snr'], row['power'], row['mpower'], row['func'])
+            except Exception as e:
+                logger.debug("%s | Incomplete data: %s", star_id, e)
+
+    if tics is not None and os.path.exists(out_csv_path):
+        out_df = _merge_summary(pd.read_csv(out_csv_path, float_precision="round_trip"), out_df, tics)
 
     out_df.to_csv(out_csv_path, index=False)
-    print(f"Saved summary to {out_csv_path}")
+    logger.info("Saved summary of %d stars to %s", len(out_df), out_csv_path)
+
+def _merge_summary(previous, updated, tics):
+    # Stars keep their place in the summary; stars new to it go at the end
+    changed = ResumeIndex(tics).isin(pd.to_numeric(previous['TIC'], errors='coerce').fillna(0).to_numpy(dtype=np.int64))
+    merged = pd.concat([previous[~changed], updated], ignore_index=True)
+    order = pd.concat([previous['TIC'], updated['TIC']]).drop_duplicates()
+    rank = pd.Series(np.arange(len(order)), index=order.to_numpy())
+    # Column order of the widest frame, as a full summary of the merged stars would have
+    wide, other = (updated, previous) if len(updated.columns) >= len(previous.columns) else (previous, updated)
+    columns = list(wide.columns) + [c for c in other.columns if c not in wide.columns]
+    merged = merged.iloc[np.argsort(merged['TIC'].map(rank).to_numpy(), kind="stable")][columns]
+    # Sector columns only one side has are NaN in the other's rows; a full
+    # summary computes their detection flag as False there
+    for col in columns:
+        if col.endswith("_detect") and col.split("_")[0].isdigit() and merged[col].isna().any():
+            merged[col] = merged[col].astype(object).where(merged[col].notna(), False).astype(bool)
+    return merged
+
+def update_summary_from_raw(raw_csv_path, out_csv_path="rotation_summary.csv", journal_path=None, autoval_only=True):
+    """
+    Bring a summary up to date with raw results grown by ``run --update``:
+    only the stars the run journal records as written after the summary
+    was saved are summarized again.
+    """
+    from protify.journal import RunJournal
+
+    if not os.path.exists(out_csv_path):
+        return generate_summary_from_raw(raw_csv_path, out_csv_path, autoval_only)
+    journal = RunJournal(journal_path or raw_csv_path.rstrip("/") + ".journal")
+    try:
+        changed = journal.written_since(os.path.getmtime(out_csv_path))
+    finally:
+        journal.close()
+    if not len(changed):
+        logger.info("Summary %s is up to date with %s", out_csv_path, raw_csv_path)
+        return
+    logger.info("Updating the summary of %d changed stars", len(changed))
+    generate_summary_from_raw(raw_csv_path, out_csv_path, autoval_only, tics=changed)
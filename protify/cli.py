@@ -1,58 +1,315 @@
 import argparse
-from protify.runner import run_period_pipeline
-from protify.classifier import run_classifier, generate_summary_from_raw
+import logging
+from protify.log import setup_logging
+
+# Each subcommand imports its modules when it runs, so it only loads the dependencies it uses
+# (lightkurve and astropy for run, scikit-learn for classify and train, matplotlib for plot)
 
 def main():
     parser = argparse.ArgumentParser(prog="protify")
+
+    # Logging options shared by every subcommand
+    common = argparse.ArgumentParser(add_help=False)
+    verbosity = common.add_mutually_exclusive_group()
+    verbosity.add_argument("-q", "--quiet", action="store_true", help="Only log warnings and errors")
+    verbosity.add_argument("-v", "--verbose", action="store_true", help="Also log per-sector and per-star details")
+    common.add_argument("--log-json", action="store_true", help="Log one JSON object per line")
     subparsers = parser.add_subparsers(dest="command", required=True)
 
     # Subcommand: run
-    run_parser = subparsers.add_parser("run", help="Run period-finding pipeline")
+    run_parser = subparsers.add_parser("run", help="Run period-finding pipeline", parents=[common])
     run_parser.add_argument("--input", required=True, help="CSV file with TICs")
-    run_parser.add_argument("--raw", required=True, help="Output CSV for raw sector-level metrics")
-    run_parser.add_argument("--save-lc", action="store_true", help="Save light curves as pickles")
+    run_parser.add_argument("--raw", required=True,
+                            help="Output for raw sector-level metrics (CSV, or a .parquet directory for --raw-format long)")
+    run_parser.add_argument("--raw-format", choices=["wide", "long"], default=None,
+                            help="Legacy wide CSV, or one row per (TIC, sector); default is long for .parquet paths")
+    run_parser.add_argument("--journal", default=None,
+                            help="SQLite checkpoint journal of star statuses (default: <raw>.journal)")
+    run_parser.add_argument("--retry-failed", action="store_true", help="Only rerun the stars the journal records as failed")
+    run_parser.add_argument("--metrics", default=None, help="Append per-star stage timings and run throughput to this JSON-lines file")
+    run_parser.add_argument("--profile-dir", default=None, help="Write a cProfile dump per star (TIC<id>.prof) to this directory")
+    run_parser.add_argument("--save-lc", action="store_true", help="Save light curves and periodograms to the light curve store")
     run_parser.add_argument("--save-plots", action="store_true", help="Save light curve plots")
+    run_parser.add_argument("--plot-workers", type=int, default=1,
+                            help="Processes rendering plots while the pipeline runs (0 plots after the run)")
+    run_parser.add_argument("--workers", type=int, default=1, help="Number of stars processed in parallel")
+    run_parser.add_argument("--download-threads", type=int, default=4, help="Concurrent sector downloads")
+    run_parser.add_argument("--prefetch", type=int, default=2,
+                            help="Stars downloaded ahead while the current one is analysed (serial and --handoff runs)")
+    run_parser.add_argument("--handoff", action="store_true",
+                            help="With --workers, download in this process and pass light curves to the workers as memory-mapped arrays")
+    run_parser.add_argument("--retries", type=int, default=3, help="Retries with exponential backoff per archive request")
+    run_parser.add_argument("--local-archive", default=None,
+                            help="Read FITS files from <dir>/TIC<id>/<author>_sector<NN>.fits instead of MAST")
+    run_parser.add_argument("--product-index", default=None,
+                            help="SQLite index of each star's light curve products, resolved in bulk before downloading")
+    run_parser.add_argument("--manifest", default=None,
+                            help="Product manifest (tic, sector, author, uri; CSV or Parquet) to build --product-index from")
+    run_parser.add_argument("--index-batch-size", type=int, default=500, help="Stars resolved per MAST query")
+    run_parser.add_argument("--cache-dir", default=None, help="Directory of the persistent light curve cache")
+    run_parser.add_argument("--cache-max-gb", type=float, default=None, help="Evict least recently used light curves above this size")
+    run_parser.add_argument("--offline", action="store_true", help="Only use cached light curves; fail on a cache miss")
+    run_parser.add_argument("--gls-backend", choices=["pyastronomy", "numpy", "fast"], default="pyastronomy",
+                            help="Periodogram engine: PyAstronomy per sector, batched NumPy GLS, or FFT-based fast GLS")
+    run_parser.add_argument("--fft-oversampling", type=int, default=10,
+                            help="FFT grid oversampling for --gls-backend fast (higher is more accurate)")
+    run_parser.add_argument("--stitch", action="store_true",
+                            help="Also search the longest run of consecutive sectors as one joined light curve")
+    run_parser.add_argument("--stitch-min-sectors", type=int, default=2, help="Fewest consecutive sectors to stitch")
+    run_parser.add_argument("--stitch-max-gap", type=float, default=10., help="Largest gap (days) between stitched sectors")
+    run_parser.add_argument("--stitch-max-period", type=float, default=100., help="Longest period searched when stitching (days)")
+    run_parser.add_argument("--unc-method", choices=["fast", "astropy"], default="fast",
+                            help="Peak uncertainty fit: vectorized Gaussian fit, or astropy's LevMarLSQFitter per sector. "
+                                 "Sectors where astropy's fit collapses get a non-zero uncsec with fast instead of 0; "
+                                 "use astropy to reproduce earlier raw output")
+    run_parser.add_argument("--update", action="store_true",
+                            help="Revisit finished stars and analyse only sectors not yet in the raw output. "
+                                 "Sectors are matched by label, so a later product from another author for an "
+                                 "analysed sector is not picked up")
+    run_parser.add_argument("--compact", action="store_true",
+                            help="Hold sector arrays as float32 and keep periodograms only with --save-lc, to cut memory per worker")
+    run_parser.add_argument("--screen", action="store_true",
+                            help="Search each sector on a coarse grid first; sectors that cannot reach a detection skip the fine search")
+    run_parser.add_argument("--screen-decimate", type=int, default=8, help="Coarse grid of --screen: every Nth frequency of the grid, or fewer skipped to keep the step within 0.5 / baseline")
+    run_parser.add_argument("--screen-snr", type=float, default=20.,
+                            help="Coarse peak-to-median power below which --screen rules a sector out (the summary's cut is 40)")
+    run_parser.add_argument("--grid", choices=["fixed", "adaptive"], default="fixed",
+                            help="Frequency grid: legacy fixed grid, or built from each sector's baseline and cadence")
+    run_parser.add_argument("--grid-oversampling", type=float, default=10, help="Adaptive grid points per 1/baseline")
+    run_parser.add_argument("--min-period", type=float, default=0.097, help="Shortest period searched by the adaptive grid (days)")
+    run_parser.add_argument("--max-period", type=float, default=50., help="Longest period searched by the adaptive grid (days)")
+    run_parser.add_argument("--baseline-factor", type=float, default=1.,
+                            help="Adaptive grid searches periods up to this multiple of the sector baseline")
 
     # Subcommand: summarize
-    sum_parser = subparsers.add_parser("summarize", help="Generate summary metrics from raw CSV")
-    sum_parser.add_argument("--raw", required=True, help="Path to raw output CSV")
+    sum_parser = subparsers.add_parser("summarize", help="Generate summary metrics from raw CSV", parents=[common])
+    sum_parser.add_argument("--raw", required=True, help="Path to raw output (wide or long format)")
     sum_parser.add_argument("--summary", default="rotation_summary.csv", help="Output summary CSV")
     sum_parser.add_argument("--no-autoval", action="store_true", help="Include all stars regardless of AutoVal?")
+    sum_parser.add_argument("--update", action="store_true",
+                            help="Only re-summarize stars the run journal wrote since the summary was saved")
+    sum_parser.add_argument("--journal", default=None, help="Run journal of --raw (default: <raw>.journal)")
 
     # Subcommand: classify
-    classify_parser = subparsers.add_parser("classify", help="Classify stars as rotators or not")
+    classify_parser = subparsers.add_parser("classify", help="Classify stars as rotators or not", parents=[common])
     classify_parser.add_argument("--raw", required=True, help="Raw output CSV (for summary)")
     classify_parser.add_argument("--summary", required=True, help="Output summary CSV")
-    classify_parser.add_argument("--train", required=True, help="Training set CSV")
+    classify_parser.add_argument("--train", default=None, help="Training set CSV (trained models are cached in --model-cache)")
+    classify_parser.add_argument("--model", default=None, help="Trained classifier from `protify train`; skips training")
+    classify_parser.add_argument("--model-cache", default="models", help="Directory of cached trained classifiers")
+    classify_parser.add_argument("--n-jobs", type=int, default=None, help="Parallel jobs for training and prediction (-1 uses all cores)")
     classify_parser.add_argument("--output", default="rotation_classified.csv", help="Output CSV for classified results")
+    classify_parser.add_argument("--metrics", default=None, help="Append stage timings to this JSON-lines file")
     classify_parser.add_argument("--no-autoval", action="store_true", help="Include all stars regardless of AutoVal?")
 
+    # Subcommand: train
+    train_parser = subparsers.add_parser("train", help="Train the rotator classifier and save it for `classify --model`",
+                                         parents=[common])
+    train_parser.add_argument("--train", required=True, help="Training set CSV")
+    train_parser.add_argument("--model", required=True, help="Output classifier file (.joblib)")
+    train_parser.add_argument("--model-cache", default=None, help="Reuse or store the trained classifier in this directory")
+    train_parser.add_argument("--n-jobs", type=int, default=None, help="Parallel jobs for training (-1 uses all cores)")
+    train_parser.add_argument("--n-estimators", type=int, default=None, help="Number of trees (default 450)")
+    train_parser.add_argument("--max-depth", type=int, default=None, help="Maximum tree depth (default 15)")
+    train_parser.add_argument("--metrics", default=None, help="Append stage timings to this JSON-lines file")
+
+    # Subcommand: export-wide
+    export_parser = subparsers.add_parser("export-wide", help="Convert long-format raw results to the legacy wide CSV",
+                                          parents=[common])
+    export_parser.add_argument("--raw", required=True, help="Long-format raw results (.csv or .parquet)")
+    export_parser.add_argument("--output", required=True, help="Output wide CSV")
+
+    # Subcommand: index
+    index_parser = subparsers.add_parser("index", help="Resolve the light curve products of a catalogue into a product index",
+                                         parents=[common])
+    index_parser.add_argument("--input", required=True, help="CSV file with TICs")
+    index_parser.add_argument("--index", required=True, help="SQLite product index to create or extend")
+    index_parser.add_argument("--manifest", default=None,
+                              help="Read products from this manifest (tic, sector, author, uri) instead of querying MAST")
+    index_parser.add_argument("--local-archive", default=None, help="Read products from a local FITS archive instead of MAST")
+    index_parser.add_argument("--batch-size", type=int, default=500, help="Stars resolved per MAST query")
+    index_parser.add_argument("--retries", type=int, default=3, help="Retries with exponential backoff per MAST query")
+
+    # Subcommand: plot
+    plot_parser = subparsers.add_parser("plot", help="Render validation plots from the light curve store",
+                                        parents=[common])
+    plot_parser.add_argument("--lc-dir", default="lightcurves", help="Light curve store written by `run --save-lc`")
+    plot_parser.add_argument("--plot-dir", default="plots", help="Output directory of the plots")
+    plot_parser.add_argument("--workers", type=int, default=1, help="Processes rendering plots in parallel")
+    plot_parser.add_argument("--max-points", type=int, default=None,
+                             help="Points drawn per panel (default 5000); denser light curves and periodograms are thinned")
+    plot_parser.add_argument("--overwrite", action="store_true", help="Redraw plots that are newer than their data")
+    plot_parser.add_argument("--combine", action="store_true", help="Also join all plots into one PDF")
+    plot_parser.add_argument("--combined-name", default="protify_rotators.pdf", help="File name of the combined PDF")
+
+    # Subcommand: bench
+    bench_parser = subparsers.add_parser("bench", help="Benchmark period finding on synthetic light curves (offline)",
+                                         parents=[common])
+    bench_parser.add_argument("--output", default="bench_results.json", help="JSON file for the benchmark results")
+    bench_parser.add_argument("--benches", nargs="+", default=["gls", "unc_fit", "rotation_metrics", "summary"],
+                              choices=["gls", "unc_fit", "rotation_metrics", "summary"], help="Benchmarks to run")
+    bench_parser.add_argument("--cadences", nargs="+", default=["2min", "10min", "30min"],
+                              choices=["2min", "10min", "30min"], help="Cadences to simulate")
+    bench_parser.add_argument("--backends", nargs="+", default=["pyastronomy", "numpy", "fast"],
+                              choices=["pyastronomy", "numpy", "fast"], help="GLS backends to time")
+    bench_parser.add_argument("--unc-methods", nargs="+", default=["fast", "astropy"], choices=["fast", "astropy"],
+                              help="unc_fit methods to time")
+    bench_parser.add_argument("--n", type=int, default=8, help="Sectors per gls and unc_fit case")
+    bench_parser.add_argument("--sectors", type=int, nargs="+", default=[1, 4, 13], help="Sectors per star for rotation_metrics")
+    bench_parser.add_argument("--stars", type=int, nargs="+", default=[1000, 10000], help="Stars in the summary benchmark")
+    bench_parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (the best is reported)")
+    bench_parser.add_argument("--seed", type=int, default=42, help="Random seed of the synthetic light curves")
+    bench_parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    bench_parser.add_argument("--compact", action="store_true",
+                              help="Also run rotation_metrics in compact mode (variants named <backend>+compact)")
+    bench_parser.add_argument("--screen", action="store_true",
+                              help="Also run rotation_metrics with the coarse screen (<backend>+screen) and on non-rotating stars (.../flat)")
+
     args = parser.parse_args()
+    setup_logging("quiet" if args.quiet else "verbose" if args.verbose else "info", json_format=args.log_json)
 
     if args.command == "run":
+        from protify.runner import run_period_pipeline
         run_period_pipeline(
             input_csv=args.input,
             raw_output_csv=args.raw,
+            raw_format=args.raw_format,
+            journal_path=args.journal,
+            retry_failed=args.retry_failed,
+            metrics_file=args.metrics,
+            profile_dir=args.profile_dir,
             save_lc_pickle=args.save_lc,
             save_plots=args.save_plots,
+            plot_workers=args.plot_workers,
+            workers=args.workers,
+            download_threads=args.download_threads,
+            prefetch=args.prefetch,
+            retries=args.retries,
+            local_archive=args.local_archive,
+            product_index=args.product_index,
+            manifest=args.manifest,
+            index_batch_size=args.index_batch_size,
+            cache_dir=args.cache_dir,
+            cache_max_gb=args.cache_max_gb,
+            offline=args.offline,
+            gls_backend=args.gls_backend,
+            fft_oversampling=args.fft_oversampling,
+            grid=args.grid,
+            unc_method=args.unc_method,
+            stitch=args.stitch,
+            compact=args.compact,
+            handoff=args.handoff,
+            screen=args.screen,
+            screen_kwds=dict(decimate=args.screen_decimate, min_snr=args.screen_snr),
+            update=args.update,
+            stitch_kwds=dict(
+                min_sectors=args.stitch_min_sectors,
+                max_gap=args.stitch_max_gap,
+                max_period=args.stitch_max_period,
+                oversampling=args.grid_oversampling,
+                min_period=args.min_period,
+            ),
+            grid_kwds=dict(
+                oversampling=args.grid_oversampling,
+                min_period=args.min_period,
+                max_period=args.max_period,
+                baseline_factor=args.baseline_factor,
+            ),
         )
 
-    elif args.command == "summarize":
-        generate_summary_from_raw(
+    elif args.command == "summarize" and args.update:
+        from protify.classifier import update_summary_from_raw
+        update_summary_from_raw(
             raw_csv_path=args.raw,
             out_csv_path=args.summary,
+            journal_path=args.journal,
             autoval_only=not args.no_autoval,
         )
 
-    elif args.command == "classify":
+    elif args.command == "summarize":
+        from protify.classifier import generate_summary_from_raw
         generate_summary_from_raw(
             raw_csv_path=args.raw,
             out_csv_path=args.summary,
             autoval_only=not args.no_autoval,
         )
-        run_classifier(
-            input_file=args.summary,
-            train_file=args.train,
-            output_file=args.output,
-            use_autoval=not args.no_autoval,
+
+    elif args.command == "classify":
+        if not args.train and not args.model:
+            parser.error("classify needs --train or --model")
+        from protify.classifier import generate_summary_from_raw, run_classifier
+        from protify.metrics import collect, stage, write_metrics
+        with collect() as times:
+            with stage("summarize"):
+                generate_summary_from_raw(
+                    raw_csv_path=args.raw,
+                    out_csv_path=args.summary,
+                    autoval_only=not args.no_autoval,
+                )
+            run_classifier(
+                input_file=args.summary,
+                train_file=args.train,
+                output_file=args.output,
+                use_autoval=not args.no_autoval,
+                model_file=args.model,
+                cache_dir=args.model_cache,
+                n_jobs=args.n_jobs,
+            )
+        if args.metrics:
+            write_metrics(args.metrics, "classify", times, raw=args.raw, model=args.model, train=args.train)
+
+    elif args.command == "train":
+        from protify.classifier import train_classifier
+        from protify.metrics import collect, write_metrics
+        params = {key: value for key, value in (("n_estimators", args.n_estimators), ("max_depth", args.max_depth))
+                  if value is not None}
+        with collect() as times:
+            train_classifier(
+                train_file=args.train,
+                model_file=args.model,
+                cache_dir=args.model_cache,
+                n_jobs=args.n_jobs,
+                **params,
+            )
+        if args.metrics:
+            write_metrics(args.metrics, "train", times, train=args.train, model=args.model)
+
+    elif args.command == "plot":
+        from protify.plotting import MAX_POINTS, batch_plot_lightcurves
+        batch_plot_lightcurves(
+            pickle_dir=args.lc_dir,
+            save_dir=args.plot_dir,
+            combine_into_pdf=args.combine,
+            combined_pdf_name=args.combined_name,
+            workers=args.workers,
+            max_points=MAX_POINTS if args.max_points is None else args.max_points,
+            overwrite=args.overwrite,
         )
+
+    elif args.command == "bench":
+        from protify.bench import run_benchmarks
+        run_benchmarks(
+            output=args.output,
+            benches=args.benches,
+            cadences=args.cadences,
+            backends=args.backends,
+            unc_methods=args.unc_methods,
+            n=args.n,
+            sector_counts=args.sectors,
+            star_counts=args.stars,
+            repeat=args.repeat,
+            seed=args.seed,
+            compare=args.compare,
+            compact=args.compact,
+            screen=args.screen,
+        )
+
+    elif args.command == "index":
+        from protify.products import build_product_index
+        build_product_index(args.input, args.index, manifest=args.manifest, local_archive=args.local_archive,
+                            batch_size=args.batch_size, retries=args.retries)
+
+    elif args.command == "export-wide":
+        from protify.results import export_wide_csv
+        export_wide_csv(args.raw, args.output)
+        logging.getLogger("protify").info("Saved wide raw results to %s", args.output)
@@ -1,59 +1,338 @@
+import os
+import re
+import logging
+import time
+import hashlib
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from lightkurve import search_lightcurve
 from lightkurve.lightcurve import LightCurve
 
-def download_tess_lightcurves(tic_id, mission='TESS'):
+from protify.metrics import collect, count, stage
+
+logger = logging.getLogger(__name__)
+
+# Pipelines whose light curves are analysed
+AUTHORS = ("SPOC", "TESS-SPOC", "QLP")
+
+class LocalArchive:
+    """
+    Offline stand-in for ``lightkurve.search_lightcurve`` that serves FITS light
+    curves from disk, laid out as ``<root>/TIC<id>/<author>_sector<NN>.fits``.
+
+    ``latency`` adds a sleep to every download to mimic network I/O when
+    checking download overlap and throughput.
+    """
+    _pattern = re.compile(r"^(?P<author>[A-Za-z-]+)_sector(?P<sector>\d+)\.fits$")
+
+    def __init__(self, root, latency=0.0):
+        self.root = root
+        self.latency = latency
+
+    def __call__(self, target, mission='TESS'):
+        tic_id = str(target).replace("TIC", "").strip()
+        star_dir = os.path.join(self.root, f"TIC{tic_id}")
+        rows = []
+        if os.path.isdir(star_dir):
+            for name in sorted(os.listdir(star_dir)):
+                match = self._pattern.match(name)
+                if match:
+                    rows.append((match["author"], f"{mission} Sector {int(match['sector']):02d}", os.path.join(star_dir, name)))
+        return LocalSearchResult(rows, self.latency)
+
+class LocalSearchResult:
+    """
+    Search result over ``(author, sector label, path or mast: URI)`` rows,
+    as served by ``LocalArchive`` and ``products.ProductIndex``.
+    """
+    def __init__(self, rows, latency=0.0):
+        self.rows = list(rows)
+        self.latency = latency
+
+    @property
+    def author(self):
+        return np.array([r[0] for r in self.rows])
+
+    @property
+    def mission(self):
+        return np.array([r[1] for r in self.rows])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            return LocalSearchResult([self.rows[key]], self.latency)
+        keep = np.arange(len(self.rows))[key]
+        return LocalSearchResult([self.rows[i] for i in keep], self.latency)
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def download(self):
+        from lightkurve import read
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.rows[0][2]
+        if path.startswith("mast:"):
+            path = download_product(path)
+        return read(path)
+
+def download_product(uri, download_dir=None):
+    """Fetch a MAST product by its ``mast:`` data URI into the lightkurve cache and return the local path."""
+    from astroquery.mast import Observations
+    from lightkurve.config import get_cache_dir
+    path = os.path.join(download_dir or get_cache_dir(), "mastDownload", uri.split(":", 1)[1].lstrip("/"))
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        status, message, _ = Observations.download_file(uri, local_path=path + ".part", verbose=False)
+        if status != "COMPLETE":
+            raise ValueError(f"Download of {uri} failed: {message}")
+        os.replace(path + ".part", path)
+    return path
+
+class LightCurveCache:
+    """
+    Persistent on-disk cache of normalized, NaN-stripped light curves keyed by
+    (TIC, sector, author).
+
+    Each light curve is stored once as a (3, N) float64 ``.npy`` blob of time,
+    flux and flux_err, named by the SHA-1 of its contents so it can be
+    memory-mapped and deduplicated. A SQLite manifest maps keys to blobs,
+    records the products of every cached star and drives least-recently-used
+    eviction once the blobs exceed ``max_bytes``. The object only holds paths,
+    so it can be shared with worker processes.
+    """
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries (tic TEXT, sector TEXT, author TEXT, blob TEXT, "
+                "nbytes INTEGER, time_format TEXT, time_scale TEXT, last_used REAL, PRIMARY KEY (tic, sector, author))"
+            )
+            db.execute("CREATE TABLE IF NOT EXISTS stars (tic TEXT, position INTEGER, sector TEXT, author TEXT, "
+                       "PRIMARY KEY (tic, position))")
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.root, "manifest.sqlite"), timeout=60)
+
+    def _blob_path(self, blob):
+        return os.path.join(self.root, "blobs", blob + ".npy")
+
+    def get_star(self, tic_id):
+        tic_id = str(tic_id)
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT s.sector, e.blob, e.time_format, e.time_scale FROM stars s LEFT JOIN entries e "
+                "ON s.tic = e.tic AND s.sector = e.sector AND s.author = e.author WHERE s.tic = ? ORDER BY s.position",
+                (tic_id,)
+            ).fetchall()
+            if not rows or any(blob is None or not os.path.exists(self._blob_path(blob)) for _, blob, _, _ in rows):
+                return None
+            db.execute("UPDATE entries SET last_used = ? WHERE tic = ?", (time.time(), tic_id))
+
+        from astropy.time import Time
+        lcs, sectors = [], []
+        for sector, blob, time_format, time_scale in rows:
+            data = np.load(self._blob_path(blob), mmap_mode='r')
+            lcs.append(LightCurve(time=Time(data[0], format=time_format, scale=time_scale), flux=data[1], flux_err=data[2]))
+            sectors.append(sector)
+        return lcs, sectors
+
+    def put_star(self, tic_id, sectors, authors, lightcurves):
+        tic_id = str(tic_id)
+        now = time.time()
+        records = []
+        for sector, author, lc in zip(sectors, authors, lightcurves):
+            data = np.vstack([
+                np.asarray(getattr(q, "unmasked", q).value, dtype=np.float64)
+                for q in (lc.time, lc.flux, lc.flux_err)
+            ])
+            blob = hashlib.sha1(data.tobytes()).hexdigest()
+            path = self._blob_path(blob)
+            if not os.path.exists(path):
+                np.save(path + ".tmp.npy", data)
+                os.replace(path + ".tmp.npy", path)
+            records.append((tic_id, str(sector), str(author), blob, data.nbytes, lc.time.format, lc.time.scale, now))
+
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", records)
+            db.execute("DELETE FROM stars WHERE tic = ?", (tic_id,))
+            db.executemany("INSERT INTO stars VALUES (?, ?, ?, ?)",
+                           [(tic_id, i, r[1], r[2]) for i, r in enumerate(records)])
+        self.evict()
+
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        with self._connect() as db:
+            total = db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM (SELECT DISTINCT blob, nbytes FROM entries)").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for tic, sector, author, blob, nbytes in db.execute(
+                    "SELECT tic, sector, author, blob, nbytes FROM entries ORDER BY last_used").fetchall():
+                db.execute("DELETE FROM entries WHERE tic = ? AND sector = ? AND author = ?", (tic, sector, author))
+                if db.execute("SELECT COUNT(*) FROM entries WHERE blob = ?", (blob,)).fetchone()[0] == 0:
+                    if os.path.exists(self._blob_path(blob)):
+                        os.remove(self._blob_path(blob))
+                    total -= nbytes
+                if total <= self.max_bytes:
+                    break
+
+def with_retries(func, retries=3, backoff=1.0):
+    for attempt in range(retries + 1):
+        try:
+            return func()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def select_lightcurve(downloaded):
+    if downloaded is None:
+        raise ValueError("Downloaded object is None.")
+
+    tclass = downloaded.__class__.__name__
+    lc = None
+
+    if tclass == "TessLightCurveFile":
+        if hasattr(downloaded, "PDCSAP_FLUX") and downloaded.PDCSAP_FLUX is not None:
+            lc = downloaded.PDCSAP_FLUX
+        elif hasattr(downloaded, "SAP_FLUX") and downloaded.SAP_FLUX is not None:
+            lc = downloaded.SAP_FLUX
+
+    elif isinstance(downloaded, LightCurve):
+        lc = downloaded
+
+    if lc is None and hasattr(downloaded, "flux") and downloaded.flux is not None:
+        lc = downloaded
+
+    if lc is None:
+        raise ValueError("No usable flux (PDCSAP, SAP, or raw flux) found.")
+
+    return lc.remove_nans().normalize()
+
+def download_tess_lightcurves(tic_id, mission='TESS', search_func=None, max_workers=4, retries=3, backoff=1.0,
+                              executor=None, cache=None, offline=False, skip_sectors=None):
+    """
+    Light curves and sector labels of a star's SPOC/QLP products. Sectors in
+    ``skip_sectors`` (labels such as "TESS Sector 05") are not downloaded,
+    whichever author's product they would have been; if that leaves none, two
+    empty lists are returned. Such partial downloads bypass the cache, which
+    holds whole stars.
+    """
+    if skip_sectors:
+        cache = None
     try:
         int(tic_id)
     except ValueError:
-        print(f"Warning: ID '{tic_id}' is not a valid TIC integer. Results may be unreliable.")
+        logger.warning("Warning: ID '%s' is not a valid TIC integer. Results may be unreliable.", tic_id)
+
+    if cache is not None:
+        with stage("cache_read"):
+            cached = cache.get_star(tic_id)
+        if cached is not None:
+            count("cache_hits")
+            return cached
+    if offline:
+        raise ValueError(f"TIC {tic_id} is not in the light curve cache and offline mode is set.")
 
-    search = search_lightcurve(f"TIC {tic_id}", mission=mission)
-    search_filtered = search[
-        (search.author == 'SPOC') |
-        (search.author == 'TESS-SPOC') |
-        (search.author == 'QLP')
-    ]
+    search_func = search_func or search_lightcurve
+    with stage("search"):
+        search = with_retries(lambda: search_func(f"TIC {tic_id}", mission=mission), retries, backoff)
+    search_filtered = search[np.isin(np.asarray(search.author, dtype=str), AUTHORS)]
 
     if len(search_filtered) == 0:
         raise ValueError(f"No SPOC/QLP light curves found for TIC {tic_id}.")
+    if skip_sectors:
+        search_filtered = search_filtered[~np.isin(np.asarray(search_filtered.mission, dtype=str), list(skip_sectors))]
+        if len(search_filtered) == 0:
+            return [], []
 
-    lcs, sectors = [], []
-    for res in search_filtered:
-        try:
-            downloaded = res.download()
-            if downloaded is None:
-                raise ValueError("Downloaded object is None.")
+    def fetch(res):
+        return select_lightcurve(with_retries(res.download, retries, backoff))
 
-            tclass = downloaded.__class__.__name__
-            lc = None
+    # All sectors of a star are fetched concurrently; order follows the search result
+    results = list(search_filtered)
+    pool = executor or ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        futures = [pool.submit(fetch, res) for res in results]
 
-            if tclass == "TessLightCurveFile":
-                if hasattr(downloaded, "PDCSAP_FLUX") and downloaded.PDCSAP_FLUX is not None:
-                    lc = downloaded.PDCSAP_FLUX
-                elif hasattr(downloaded, "SAP_FLUX") and downloaded.SAP_FLUX is not None:
-                    lc = downloaded.SAP_FLUX
+        lcs, sectors, authors = [], [], []
+        for res, future in zip(results, futures):
+            try:
+                # Time spent waiting on the concurrent downloads, not the sum over threads
+                with stage("download"):
+                    lc = future.result()
 
-            elif isinstance(downloaded, LightCurve):
-                lc = downloaded
+                # Handle sector robustly
+                sector = res.mission[0] if hasattr(res, "mission") else None
 
-            if lc is None and hasattr(downloaded, "flux") and downloaded.flux is not None:
-                lc = downloaded
+                lcs.append(lc)
+                sectors.append(sector)
+                authors.append(res.author[0])
 
-            if lc is None:
-                raise ValueError("No usable flux (PDCSAP, SAP, or raw flux) found.")
+            except Exception as e:
+                logger.warning("Failed to download TIC %s: %s", tic_id, e)
+    finally:
+        if executor is None:
+            pool.shutdown()
 
-            lc = lc.remove_nans().normalize()
+    if len(lcs) == 0:
+        raise ValueError(f"No usable light curves found for TIC {tic_id} after filtering.")
+    count("downloads", len(lcs))
 
-            # Handle sector robustly
-            sector = res.mission[0] if hasattr(res, "mission") else None
+    # Stars with failed products are not cached, so the next run retries them
+    if cache is not None and len(lcs) == len(results):
+        with stage("cache_write"):
+            cache.put_star(tic_id, sectors, authors, lcs)
 
-            lcs.append(lc)
-            sectors.append(sector)
+    return lcs, sectors
 
-        except Exception as e:
-            print(f"Failed to download TIC {tic_id}: {e}")
+def prefetch_lightcurves(tic_ids, prefetch=2, max_workers=4, skip_sectors=None, **download_kwds):
+    """
+    Yield ``(tic_id, lightcurves, sectors, error, times)`` in input order while
+    up to ``prefetch`` further stars download in the background. ``times`` is
+    the StageTimes of that star's download. ``skip_sectors`` maps TICs to the
+    sectors not to download; it may be filled while ``tic_ids`` is consumed.
 
-    if len(lcs) == 0:
-        raise ValueError(f"No usable light curves found for TIC {tic_id} after filtering.")
+    Product downloads of all stars in flight share one pool of ``max_workers``
+    threads, which caps concurrent requests to the archive.
+    """
+    products = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    stars = ThreadPoolExecutor(max_workers=max(1, prefetch))
+    queue = deque()
+    tic_ids = iter(tic_ids)
 
-    return lcs, sectors
+    def fetch(tic_id, skip):
+        with collect() as times:
+            try:
+                lcs, sectors = download_tess_lightcurves(tic_id, max_workers=max_workers, executor=products,
+                                                         skip_sectors=skip, **download_kwds)
+                return lcs, sectors, None, times
+            except Exception as e:
+                return None, None, e, times
+
+    def fill():
+        while len(queue) < max(1, prefetch):
+            tic_id = next(tic_ids, None)
+            if tic_id is None:
+                return
+            queue.append((tic_id, stars.submit(fetch, tic_id, (skip_sectors or {}).get(tic_id))))
+
+    try:
+        fill()
+        while queue:
+            tic_id, future = queue.popleft()
+            lcs, sectors, error, times = future.result()
+            fill()
+            yield tic_id, lcs, sectors, error, times
+    finally:
+        for _, future in queue:
+            future.cancel()
+        stars.shutdown(wait=True)
+        products.shutdown(wait=True)
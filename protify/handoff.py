@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+
+from protify.periodogram import sector_buffers
+
+class HandoffDir:
+    """
+    Memory-mapped light curve buffers that carry downloaded stars to analysis
+    worker processes without pickling LightCurve objects.
+
+    ``put`` writes the time, flux and flux_err of a star's sectors once into
+    one (3, N) float64 ``.npy`` file and returns a small record of its path
+    and sector offsets; workers open it with ``open_lightcurves`` as
+    read-only views. The files live in ``/dev/shm`` where it exists, so they
+    stay in memory, and are removed by ``release`` and ``close``.
+    """
+    def __init__(self, root=None):
+        if root is None and os.path.isdir("/dev/shm"):
+            root = "/dev/shm"
+        self.path = tempfile.mkdtemp(prefix="protify_handoff_", dir=root)
+
+    def put(self, tic_id, lightcurves):
+        buffers = []
+        for lc in lightcurves:
+            try:
+                buffers.append(sector_buffers(lc))
+            except Exception:
+                # Opened as None, so the sector fails in analysis as it would have in-process
+                buffers.append(None)
+        sizes = [0 if b is None else len(b[0]) for b in buffers]
+        offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(int).tolist()
+        path = os.path.join(self.path, f"TIC{tic_id}.npy")
+        data = np.lib.format.open_memmap(path, mode="w+", dtype=np.float64, shape=(3, offsets[-1]))
+        for b, start, end in zip(buffers, offsets, offsets[1:]):
+            if b is not None:
+                for row, values in enumerate(b):
+                    data[row, start:end] = values
+        data.flush()
+        del data
+        return path, offsets, [b is not None for b in buffers]
+
+    def release(self, record):
+        if os.path.exists(record[0]):
+            os.remove(record[0])
+
+    def close(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def open_lightcurves(record):
+    """``(time, flux, flux_err)`` views of each sector of a star handed over with ``HandoffDir.put``."""
+    path, offsets, usable = record
+    # A plain ndarray view of the mapping, so arrays derived from it are not memmaps
+    data = np.asarray(np.load(path, mmap_mode="r"))
+    return [(data[0, start:end], data[1, start:end], data[2, start:end]) if ok else None
+            for start, end, ok in zip(offsets, offsets[1:], usable)]
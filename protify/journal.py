@@ -0,0 +1,131 @@
+import os
+import time
+import sqlite3
+import numpy as np
+
+from protify.results import ResumeIndex
+
+STATUSES = ("queued", "downloaded", "analysed", "written", "failed")
+
+class RunJournal:
+    """
+    Append-only checkpoint journal of a pipeline run, kept in SQLite in WAL
+    mode so every status change is an atomic commit that survives a crash.
+
+    ``events`` logs each (TIC, status, time, error); ``stars`` holds every
+    star's latest status and number of attempts. ``sectors`` lists the
+    (TIC, sector index, sector) results on disk, so a later run can analyse
+    only new sectors. ``meta`` records the size of the raw output at the last
+    committed write, so a row left half-written by a crash can be cut off on
+    restart.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS events (tic INTEGER, status TEXT, time REAL, error TEXT)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS stars (tic INTEGER PRIMARY KEY, status TEXT, attempts INTEGER, "
+                            "error TEXT, updated REAL)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS stars_status ON stars (status)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS sectors (tic INTEGER, sector_index INTEGER, sector TEXT, "
+                            "PRIMARY KEY (tic, sector_index))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+
+    def mark(self, tics, status, error=None, raw_size=None, sectors=None):
+        """
+        Record ``status`` for one TIC or a list of TICs in a single commit,
+        with the ``(tic, sector_index, sector)`` rows they wrote if given.
+        """
+        if status not in STATUSES:
+            raise ValueError(f"Unknown journal status '{status}'. Use one of {STATUSES}.")
+        tics = [int(t) for t in (tics if isinstance(tics, (list, tuple, set, np.ndarray)) else [tics])]
+        now = time.time()
+        with self.db:
+            self.db.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", [(t, status, now, error) for t in tics])
+            self.db.executemany(
+                "INSERT INTO stars VALUES (?, ?, ?, ?, ?) ON CONFLICT (tic) DO UPDATE SET status = excluded.status, "
+                "attempts = attempts + excluded.attempts, error = excluded.error, updated = excluded.updated",
+                [(t, status, int(status == "queued"), error, now) for t in tics]
+            )
+            if sectors:
+                self.db.executemany("INSERT OR REPLACE INTO sectors VALUES (?, ?, ?)",
+                                    [(int(t), int(i), str(s)) for t, i, s in sectors])
+            if raw_size is not None:
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('raw_size', ?)", (int(raw_size),))
+
+    def record_sectors(self, sectors):
+        """Record ``(tic, sector_index, sector)`` rows, e.g. read from raw results written without them."""
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO sectors VALUES (?, ?, ?)",
+                                [(int(t), int(i), str(s)) for t, i, s in sectors])
+
+    def sectors(self, tic):
+        """``{sector: sector_index}`` of the results of one star."""
+        return dict(self.db.execute("SELECT sector, sector_index FROM sectors WHERE tic = ?", (int(tic),)).fetchall())
+
+    def has_sectors(self):
+        return self.db.execute("SELECT 1 FROM sectors LIMIT 1").fetchone() is not None
+
+    def written_since(self, since):
+        """TICs written after the time ``since`` (seconds since the epoch)."""
+        rows = self.db.execute("SELECT DISTINCT tic FROM events WHERE status = 'written' AND time > ?", (since,)).fetchall()
+        return np.array([r[0] for r in rows], dtype=np.int64)
+
+    def tics(self, status):
+        rows = self.db.execute("SELECT tic FROM stars WHERE status = ?", (status,)).fetchall()
+        return np.array([r[0] for r in rows], dtype=np.int64)
+
+    def done_ids(self):
+        return ResumeIndex(self.tics("written"))
+
+    def counts(self):
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM stars GROUP BY status").fetchall())
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM stars").fetchone()[0]
+
+    @property
+    def raw_size(self):
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'raw_size'").fetchone()
+        return None if row is None else int(row[0])
+
+    @raw_size.setter
+    def raw_size(self, size):
+        with self.db:
+            if size is None:
+                self.db.execute("DELETE FROM meta WHERE key = 'raw_size'")
+            else:
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('raw_size', ?)", (int(size),))
+
+    def reset(self):
+        with self.db:
+            for table in ("events", "stars", "sectors", "meta"):
+                self.db.execute(f"DELETE FROM {table}")
+
+    def close(self):
+        self.db.close()
+
+def truncate_partial_row(csv_path, size=None):
+    """
+    Cut a CSV back to ``size`` bytes (the journal's last committed size) or,
+    without one, to its last complete line. Returns the new size.
+    """
+    current = os.path.getsize(csv_path)
+    if size is None:
+        size, end = 0, current
+        with open(csv_path, "rb") as f:
+            # Scan back from the end for the last newline
+            while end > 0:
+                start = max(0, end - (1 << 16))
+                f.seek(start)
+                cut = f.read(end - start).rfind(b"\n")
+                if cut >= 0:
+                    size = start + cut + 1
+                    break
+                end = start
+    if size < current:
+        with open(csv_path, "r+b") as f:
+            f.truncate(size)
+    return size
@@ -0,0 +1,125 @@
+import os
+import json
+import shutil
+import numpy as np
+
+from protify.results import sector_items
+
+COLUMNS = ("Times", "Fluxes", "Pgramx", "Pgramy")
+
+class SectorColumn:
+    """
+    Per-sector arrays of one column, indexed by sector result key.
+
+    Backed by a single memory-mapped ``.npy`` file; indexing returns a view of
+    that sector's slice, so only the sectors that are used are read from disk.
+    """
+    def __init__(self, path, offsets):
+        self.path = path
+        self.offsets = {int(k): v for k, v in offsets.items()}
+        self._data = None
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, i):
+        return int(i) in self.offsets
+
+    def __getitem__(self, i):
+        start, stop = self.offsets[int(i)]
+        if self._data is None:
+            self._data = np.load(self.path, mmap_mode='r')
+        return self._data[start:stop]
+
+class StarRecord:
+    """
+    Lazy view of one star in the light curve store.
+
+    Supports the same keys as the ``compute_rotation_metrics`` output
+    (``TIC``, ``Sectors``, ``Results``, ``Times``, ``Fluxes``, ``Pgramx``,
+    ``Pgramy``), with the array columns indexed by sector result key.
+    """
+    def __init__(self, star_dir):
+        self.star_dir = star_dir
+        with open(os.path.join(star_dir, "index.json")) as f:
+            self.index = json.load(f)
+
+    def __getitem__(self, key):
+        if key in COLUMNS:
+            return SectorColumn(os.path.join(self.star_dir, f"{key}.npy"), self.index["offsets"][key])
+        return self.index[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+def _star_dir(store_dir, tic_id):
+    return os.path.join(store_dir, f"TIC{tic_id}")
+
+def save_star(metrics, store_dir):
+    """
+    Write the arrays and results of one ``compute_rotation_metrics`` output.
+
+    Each column is concatenated over sectors into one float64 ``.npy`` file and
+    ``index.json`` records the per-sector offsets, results and sector labels.
+    Compact outputs are stored the same way, with absolute times.
+    """
+    tic_id = metrics['TIC']
+    results = dict(sector_items(metrics['Results']))
+    keys = list(results)
+
+    # Times/Fluxes hold one entry per result; periodograms only exist for
+    # sectors whose GLS succeeded, which are the ones with a finite period,
+    # and not at all if they were not kept
+    with_pgram = [k for k in keys if np.isfinite(results[k]['prot'])] if metrics['Pgramx'] else []
+    owners = {"Times": keys, "Fluxes": keys, "Pgramx": with_pgram, "Pgramy": with_pgram}
+    columns = {column: metrics[column] for column in COLUMNS}
+    if metrics.get('Epochs') is not None:
+        columns["Times"] = [epoch + np.asarray(t, dtype=np.float64) for epoch, t in zip(metrics['Epochs'], metrics['Times'])]
+
+    tmp_dir = _star_dir(store_dir, tic_id) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    offsets = {}
+    for column in COLUMNS:
+        arrays = [np.asarray(a, dtype=np.float64) for a in columns[column]]
+        if len(arrays) != len(owners[column]):
+            raise ValueError(f"TIC {tic_id}: {len(arrays)} {column} arrays for {len(owners[column])} sectors.")
+        offsets[column], start = {}, 0
+        for key, array in zip(owners[column], arrays):
+            offsets[column][key] = [start, start + len(array)]
+            start += len(array)
+        data = np.concatenate(arrays) if arrays else np.empty(0)
+        np.save(os.path.join(tmp_dir, f"{column}.npy"), data)
+
+    index = {
+        "TIC": tic_id,
+        "Sectors": [None if s is None else str(s) for s in metrics['Sectors']],
+        "Results": {
+            k: {name: (v if isinstance(v, str) else float(v)) for name, v in results[k].items()}
+            for k in keys
+        },
+        "offsets": offsets,
+    }
+    with open(os.path.join(tmp_dir, "index.json"), "w") as f:
+        json.dump(index, f)
+
+    star_dir = _star_dir(store_dir, tic_id)
+    shutil.rmtree(star_dir, ignore_errors=True)
+    os.replace(tmp_dir, star_dir)
+    return star_dir
+
+def load_star(store_dir, tic_id):
+    return StarRecord(_star_dir(store_dir, tic_id))
+
+def list_stars(store_dir):
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(
+        name[3:] for name in os.listdir(store_dir)
+        if name.startswith("TIC") and not name.endswith(".tmp")
+        and os.path.exists(os.path.join(store_dir, name, "index.json"))
+    )
@@ -0,0 +1,47 @@
+import sys
+import json
+import logging
+
+LEVELS = {"quiet": logging.WARNING, "info": logging.INFO, "verbose": logging.DEBUG}
+
+# Attributes every LogRecord has; anything else was passed with ``extra=`` and goes into JSON output
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_config = {}
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and any ``extra`` fields."""
+    def format(self, record):
+        entry = {"time": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                 "message": record.getMessage()}
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup_logging(verbosity="info", json_format=False, stream=None):
+    """
+    Send protify's log records to ``stream`` (stdout by default). ``quiet``
+    keeps warnings and errors, ``info`` adds per-star progress and
+    ``verbose`` adds per-sector detail. Calling it again replaces the handler.
+    """
+    if verbosity not in LEVELS:
+        raise ValueError(f"Unknown verbosity '{verbosity}'. Use one of {tuple(LEVELS)}.")
+    logger = logging.getLogger("protify")
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(LEVELS[verbosity])
+    logger.propagate = False
+    _config.update(verbosity=verbosity, json_format=json_format)
+    return logger
+
+def logging_config():
+    """Arguments of the last ``setup_logging`` call, to repeat it in worker processes."""
+    return dict(_config)
+
+def init_worker(config):
+    if config:
+        setup_logging(**config)
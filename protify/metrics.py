@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import cProfile
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+class StageTimes:
+    """
+    Wall-clock seconds and call counts per pipeline stage (``search``,
+    ``download``, ``normalize``, ``gls``, ``unc_fit``, ``write``, ...) plus
+    free-form counters such as sectors or points analysed.
+    """
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other):
+        other = other.as_dict() if isinstance(other, StageTimes) else other
+        for name, seconds in other.get("seconds", {}).items():
+            self.seconds[name] = self.seconds.get(name, 0.) + seconds
+            self.calls[name] = self.calls.get(name, 0) + other.get("calls", {}).get(name, 0)
+        for name, n in other.get("counters", {}).items():
+            self.count(name, n)
+        return self
+
+    def as_dict(self):
+        return {"seconds": {k: round(v, 6) for k, v in self.seconds.items()},
+                "calls": dict(self.calls), "counters": dict(self.counters)}
+
+@contextmanager
+def collect(times=None):
+    """Record the stages timed in this thread into ``times`` (a new StageTimes by default)."""
+    times = StageTimes() if times is None else times
+    outer = getattr(_local, "times", None)
+    _local.times = times
+    try:
+        yield times
+    finally:
+        _local.times = outer
+
+@contextmanager
+def stage(name):
+    # Costs one clock read at each end; nothing is kept outside collect()
+    times = getattr(_local, "times", None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if times is not None:
+            times.add(name, time.perf_counter() - start)
+
+def count(name, n=1):
+    times = getattr(_local, "times", None)
+    if times is not None:
+        times.count(name, n)
+
+@contextmanager
+def profiled(profile_file=None):
+    """Run the block under cProfile and dump the stats to ``profile_file`` (no-op without one)."""
+    if not profile_file:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        if os.path.dirname(profile_file):
+            os.makedirs(os.path.dirname(profile_file), exist_ok=True)
+        profiler.dump_stats(profile_file)
+
+class MetricsWriter:
+    """
+    JSON-lines metrics of one run: a line per star with its stage timings and
+    a closing ``run`` line with the totals and throughput.
+    """
+    def __init__(self, path, **run_info):
+        self.path = path
+        self.start = time.time()
+        self.totals = StageTimes()
+        self.stars = {}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "a")
+        self.write(event="start", **run_info)
+
+    def write(self, **record):
+        record = dict(time=round(time.time(), 3), **record)
+        self.file.write(json.dumps(record, default=str) + "\n")
+        self.file.flush()
+
+    def star(self, tic, status, times=None, **fields):
+        self.stars[status] = self.stars.get(status, 0) + 1
+        times = times.as_dict() if isinstance(times, StageTimes) else (times or {})
+        self.totals.merge(times)
+        self.write(event="star", tic=tic, status=status, **fields, **times)
+
+    def close(self):
+        elapsed = time.time() - self.start
+        n = sum(self.stars.values())
+        self.write(event="run", elapsed=round(elapsed, 3), stars=self.stars,
+                   stars_per_s=round(n / elapsed, 4) if elapsed > 0 else None,
+                   sectors_per_s=round(self.totals.counters.get("sectors", 0) / elapsed, 4) if elapsed > 0 else None,
+                   **self.totals.as_dict())
+        self.file.close()
+
+def write_metrics(path, event, times, **fields):
+    """Append a single JSON-lines record (used by the one-shot commands)."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(dict(time=round(time.time(), 3), event=event, **fields, **times.as_dict()), default=str) + "\n")
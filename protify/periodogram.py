@@ -1,11 +1,350 @@
+import io
+import logging
+import contextlib
+from functools import lru_cache
 import numpy as np
 from scipy.signal import find_peaks
 from astropy import modeling
+from astropy.utils.masked import Masked
 from PyAstronomy.pyTiming import pyPeriod
 
-def GLS(time, flux, error):
-    clp = pyPeriod.Gls((time, flux, error), freq=np.arange(1/50, 1/0.097, 0.001))
-    freq, power = clp.freq, clp.power
+from protify.metrics import count, stage
+from protify.results import result_dtype, sector_items
+
+logger = logging.getLogger(__name__)
+
+GLS_BACKENDS = ("pyastronomy", "numpy", "fast")
+
+GRID_MODES = ("fixed", "adaptive")
+
+# What compute_rotation_metrics keeps of each sector's periodogram
+PGRAM_MODES = ("full", "peaks", "none")
+
+def default_frequency_grid():
+    return np.arange(1/50, 1/0.097, 0.001)
+
+def adaptive_frequency_grid(baseline, cadence, oversampling=10, min_period=0.097, max_period=50., baseline_factor=1.):
+    """
+    Uniform frequency grid built from a light curve's time baseline and cadence.
+
+    The step is 1 / (oversampling * baseline). The search runs from the longest
+    period the data can constrain, min(max_period, baseline_factor * baseline),
+    down to the longer of min_period and twice the cadence (Nyquist).
+    """
+    if baseline <= 0 or cadence <= 0:
+        raise ValueError("Baseline and cadence must be positive to build a frequency grid.")
+    fmin = max(1 / max_period, 1 / (baseline_factor * baseline))
+    fmax = min(1 / min_period, 0.5 / cadence)
+    return np.arange(fmin, fmax, 1 / (oversampling * baseline))
+
+@lru_cache(maxsize=256)
+def _cached_adaptive_grid(baseline_class, cadence_class, oversampling, min_period, max_period, baseline_factor):
+    freq = adaptive_frequency_grid(baseline_class, cadence_class / 1440, oversampling, min_period, max_period, baseline_factor)
+    freq.setflags(write=False)
+    return freq
+
+def frequency_grid(time, grid="fixed", oversampling=10, min_period=0.097, max_period=50., baseline_factor=1.):
+    """
+    Frequency grid for one light curve: the fixed legacy grid, an explicit
+    array, or an adaptive grid (see ``adaptive_frequency_grid``).
+
+    Adaptive grids are cached per (baseline, cadence) class, with the baseline
+    rounded up to whole days and the cadence up to whole minutes, so sectors of
+    the same length and cadence share one read-only grid.
+    """
+    if not isinstance(grid, str):
+        return np.asarray(grid, dtype=np.float64)
+    if grid == "fixed":
+        return default_frequency_grid()
+    if grid != "adaptive":
+        raise ValueError(f"Unknown frequency grid '{grid}'. Use one of {GRID_MODES} or an array.")
+
+    time = np.asarray(time, dtype=np.float64)
+    baseline_class = max(1, int(np.ceil(time.max() - time.min())))
+    cadence_class = max(1, int(np.ceil(np.median(np.diff(time)) * 1440)))
+    return _cached_adaptive_grid(baseline_class, cadence_class, oversampling, min_period, max_period, baseline_factor)
+
+def gls_power(times, fluxes, errors=None, freq=None, max_elements=2**22):
+    """
+    Generalized Lomb-Scargle power for several time series at once, with the
+    same (ZK) normalization as PyAstronomy's Gls.
+
+    Series of different lengths are padded to a common shape with zero weight.
+    Work is split over series groups and frequency blocks so that the
+    intermediate (series x block x points) arrays stay near ``max_elements``.
+
+    Returns:
+        np.ndarray: Power with shape (n_series, n_freq).
+    """
+    freq = default_frequency_grid() if freq is None else np.asarray(freq, dtype=np.float64)
+    if errors is None:
+        errors = [None] * len(times)
+
+    nser = len(times)
+    npts = max(len(t) for t in times)
+    th = np.zeros((nser, npts))
+    w = np.zeros((nser, npts))
+    wy = np.zeros((nser, npts))
+    yy = np.zeros(nser)
+
+    for k, (t, y, e) in enumerate(zip(times, fluxes, errors)):
+        t = np.asarray(t, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        wk = np.ones(len(y)) if e is None else 1 / np.asarray(e, dtype=np.float64) ** 2
+        if not (np.all(np.isfinite(t)) and np.all(np.isfinite(y)) and np.all(np.isfinite(wk))):
+            raise ValueError(f"Series {k} contains invalid values such as NaN or Inf.")
+        wk /= wk.sum()
+
+        dy = y - np.dot(wk, y)
+        m = len(t)
+        th[k, :m] = t - t.min()
+        w[k, :m] = wk
+        wy[k, :m] = wk * dy
+        yy[k] = np.dot(wk, dy ** 2)
+
+    # A uniform grid is factored as freq[a * m] + j * step, so the trig terms need
+    # only (n_blocks + m) evaluations per point and every sum over points becomes
+    # a small complex matrix product. Irregular grids fall back to m = 1.
+    nf = len(freq)
+    step = freq[1] - freq[0] if nf > 1 else 0.
+    uniform = nf > 1 and np.allclose(np.diff(freq), step, rtol=1e-6, atol=0)
+    m = int(np.ceil(np.sqrt(nf))) if uniform else 1
+    m = max(1, min(m, max_elements // (2 * npts)))
+    nblocks = -(-nf // m)
+    rows = max(1, min(nblocks, max_elements // npts - m))
+    ser_step = max(1, max_elements // (npts * (m + rows)))
+
+    power = np.empty((nser, nf))
+    for a in range(0, nser, ser_step):
+        b = min(a + ser_step, nser)
+        inner = np.exp(2j * np.pi * step * np.arange(m)[None, :, None] * th[a:b, None, :]).transpose(0, 2, 1)
+        inner2 = inner * inner
+
+        for r0 in range(0, nblocks, rows):
+            r1 = min(r0 + rows, nblocks)
+            lo, hi = r0 * m, min(r1 * m, nf)
+            outer = np.exp(2j * np.pi * freq[lo:hi:m][None, :, None] * th[a:b, None, :])
+            wz = outer * w[a:b, None, :]
+
+            CS1 = np.matmul(wz, inner).reshape(b - a, -1)[:, :hi - lo]
+            YCS = np.matmul(outer * wy[a:b, None, :], inner).reshape(b - a, -1)[:, :hi - lo]
+            CS2 = np.matmul(wz * outer, inner2).reshape(b - a, -1)[:, :hi - lo]
+
+            C, S = CS1.real, CS1.imag
+            YC, YS = YCS.real, YCS.imag
+            CC = 0.5 * (1. + CS2.real)
+            SS = 1. - CC - S * S
+            CC -= C * C
+            CS = 0.5 * CS2.imag - C * S
+            D = CC * SS - CS * CS
+            power[a:b, lo:hi] = (SS * YC * YC + CC * YS * YS - 2. * CS * YC * YS) / (yy[a:b, None] * D)
+
+    return power
+
+def _extirpolate(x, y, n, m=4):
+    # Spread y(x) onto the integer grid 0..n-1 so that sums of any smooth function
+    # over x are reproduced by the grid (Press & Rybicki 1989, Lagrange weights)
+    result = np.zeros(n, dtype=y.dtype)
+
+    exact = (x % 1 == 0)
+    np.add.at(result, x[exact].astype(int), y[exact])
+    x, y = x[~exact], y[~exact]
+
+    ilo = np.clip((x - m // 2).astype(int), 0, n - m)
+    numerator = y * np.prod(x - ilo - np.arange(m)[:, None], axis=0)
+    denominator = float(np.prod(np.arange(1, m)))
+    for j in range(m):
+        if j > 0:
+            denominator *= j / (j - m)
+        ind = ilo + (m - 1 - j)
+        np.add.at(result, ind, numerator / (denominator * (x - ind)))
+    return result
+
+def _fft_trig_sum(th, h, f0, df, nf, freq_factor=1, oversampling=10, mfft=8):
+    # sum(h * exp(2 pi i f th)) on f = freq_factor * (f0 + df * arange(nf)), th >= 0
+    f0, df = f0 * freq_factor, df * freq_factor
+    nfft = 1 << int(np.ceil(np.log2(nf * oversampling)))
+    if f0 > 0:
+        h = h * np.exp(2j * np.pi * f0 * th)
+    tnorm = (th * nfft * df) % nfft
+    grid = _extirpolate(tnorm, h.astype(complex), nfft, mfft)
+    return nfft * np.fft.ifft(grid)[:nf]
+
+def fast_gls_power(time, flux, error, freq=None, oversampling=10, mfft=8):
+    """
+    O(N log N) generalized Lomb-Scargle power on a uniform frequency grid using
+    extirpolation onto an FFT grid (Press & Rybicki 1989). Normalization matches
+    ``gls_power`` and PyAstronomy's Gls.
+
+    Parameters:
+        oversampling (int): FFT grid size relative to the number of frequencies.
+            Larger values trade speed for accuracy.
+        mfft (int): Number of neighbouring grid points used in the extirpolation.
+    """
+    freq = default_frequency_grid() if freq is None else np.asarray(freq, dtype=np.float64)
+    nf = len(freq)
+    if nf < 2 or not np.allclose(np.diff(freq), freq[1] - freq[0], rtol=1e-6, atol=0):
+        raise ValueError("fast_gls_power needs a uniform frequency grid.")
+    df = freq[1] - freq[0]
+
+    t = np.asarray(time, dtype=np.float64)
+    y = np.asarray(flux, dtype=np.float64)
+    w = np.ones(len(y)) if error is None else 1 / np.asarray(error, dtype=np.float64) ** 2
+    if not (np.all(np.isfinite(t)) and np.all(np.isfinite(y)) and np.all(np.isfinite(w))):
+        raise ValueError("Input contains invalid values such as NaN or Inf.")
+    w /= w.sum()
+
+    th = t - t.min()
+    dy = y - np.dot(w, y)
+    yy = np.dot(w, dy ** 2)
+
+    kwds = dict(oversampling=oversampling, mfft=mfft)
+    CS1 = _fft_trig_sum(th, w, freq[0], df, nf, **kwds)
+    YCS = _fft_trig_sum(th, w * dy, freq[0], df, nf, **kwds)
+    CS2 = _fft_trig_sum(th, w, freq[0], df, nf, freq_factor=2, **kwds)
+
+    C, S = CS1.real, CS1.imag
+    YC, YS = YCS.real, YCS.imag
+    CC = 0.5 * (1. + CS2.real)
+    SS = 1. - CC - S * S
+    CC -= C * C
+    CS = 0.5 * CS2.imag - C * S
+    D = CC * SS - CS * CS
+    return (SS * YC * YC + CC * YS * YS - 2. * CS * YC * YS) / (yy * D)
+
+def GLS(time, flux, error, backend="pyastronomy", fft_oversampling=10, grid="fixed", **grid_kwds):
+    freq = frequency_grid(time, grid, **grid_kwds)
+    if backend == "pyastronomy":
+        clp = pyPeriod.Gls((time, flux, error), freq=np.array(freq))
+        freq, power = clp.freq, clp.power
+    elif backend == "numpy":
+        power = gls_power([time], [flux], [error], freq=freq)[0]
+    elif backend == "fast":
+        power = fast_gls_power(time, flux, error, freq=freq, oversampling=fft_oversampling)
+    else:
+        raise ValueError(f"Unknown GLS backend '{backend}'. Use one of {GLS_BACKENDS}.")
+    return resolve_peak(freq, power)
+
+def GLS_batch(times, fluxes, errors, freq=None, max_elements=2**22):
+    freq = default_frequency_grid() if freq is None else freq
+    powers = gls_power(times, fluxes, errors, freq=freq, max_elements=max_elements)
+    prot, f_power, medpower, lgpeakflag, ifmax, peaks = resolve_peaks(freq, powers, return_peaks=True)
+    pgramx = 1 / freq
+    # resolve_peak reports the whole-number flags as ints, which keeps the raw CSV unchanged
+    flags = [int(f) if float(f).is_integer() else float(f) for f in lgpeakflag]
+    return [
+        (freq, pgramx, powers[k], prot[k], np.flatnonzero(peaks[k]), ifmax[k], f_power[k], medpower[k], flags[k])
+        for k in range(len(powers))
+    ]
+
+# Peakflag of sectors ruled out by the coarse screen, which get no fine search or unc_fit
+SCREENED_FLAG = -1
+
+def screen_grid(freq, decimate=8, baseline=None):
+    """
+    Every ``decimate``-th frequency of a grid, the coarse grid of the
+    screening pass. Given the light curve's ``baseline``, fewer frequencies
+    are skipped where needed to keep the coarse step within 0.5 / baseline.
+    """
+    freq = np.asarray(freq)
+    decimate = max(1, int(decimate))
+    if baseline and len(freq) > 1:
+        decimate = max(1, min(decimate, int(0.5 / (np.max(np.diff(freq)) * baseline))))
+    return freq[::decimate]
+
+def _screened_out(power, min_snr):
+    # A peak is about 1 / baseline wide and the coarse step at most half that,
+    # so the coarse grid samples every peak within a fifth of its height; a
+    # sector whose coarse peak is far below the cut will not pass it either
+    return np.max(power) < min_snr * np.median(power)
+
+def screen_sector(time, flux, error, backend="pyastronomy", fft_oversampling=10, grid="fixed", decimate=8, min_snr=20.,
+                  **grid_kwds):
+    """
+    Coarse first pass of the two-pass search: GLS on every ``decimate``-th
+    frequency of the sector's grid (see ``screen_grid``). Returns the coarse ``GLS`` result if its
+    peak-to-median power is below ``min_snr``, so the sector cannot reach
+    the summary's detection cut (40) on the fine grid, and None otherwise.
+    """
+    freq = screen_grid(frequency_grid(time, grid, **grid_kwds), decimate, baseline=np.ptp(time))
+    # PyAstronomy prints a warning whenever the peak is at the grid edge, as it often is on a coarse grid
+    with contextlib.redirect_stdout(io.StringIO()):
+        coarse = GLS(time, flux, error, backend=backend, fft_oversampling=fft_oversampling, grid=freq)
+    return coarse if _screened_out(coarse[2], min_snr) else None
+
+def _local_maxima(x):
+    """
+    Boolean mask of the local maxima of each row, matching
+    ``scipy.signal.find_peaks``: edges are never peaks and a flat plateau
+    counts once, at its middle sample (rounded down).
+    """
+    n, m = x.shape
+    peaks = np.zeros((n, m), dtype=bool)
+    if m < 3:
+        return peaks
+    d = np.diff(x, axis=1)
+    rising, flat = d > 0, d == 0
+    peaks[:, 1:-1] = rising[:, :-1] & (d[:, 1:] < 0)
+
+    # Plateaus: a rise followed by equal samples, resolved by where the run ends
+    rows, j = np.nonzero(rising[:, :-1] & flat[:, 1:])
+    if len(rows):
+        # Index of the next non-zero difference at or after each position (m - 1 if none)
+        cols = np.where(flat, m - 1, np.arange(m - 1))
+        next_nz = np.minimum.accumulate(cols[:, ::-1], axis=1)[:, ::-1]
+        k = next_nz[rows, j + 1]
+        falls = k < m - 1
+        rows, j, k = rows[falls], j[falls], k[falls]
+        falls = d[rows, k] < 0
+        peaks[rows[falls], (j[falls] + 1 + k[falls]) // 2] = True
+    return peaks
+
+def resolve_peaks(freq, powers, return_peaks=False):
+    """
+    Batched ``resolve_peak`` for a (sectors x freqs) power matrix on a shared
+    frequency grid. Returns ``prot``, ``f_power``, ``medpower`` and
+    ``lgpeakflag`` arrays, plus ``ifmax`` and the boolean peak mask when
+    ``return_peaks`` is set; the decisions are those of ``resolve_peak``.
+    """
+    powers = np.atleast_2d(powers)
+    pgramx = 1 / freq
+    rows = np.arange(len(powers))
+
+    peaks = _local_maxima(powers) & (powers >= 0.5 * powers.max(axis=1, keepdims=True))
+
+    ifmax = np.argmax(powers, axis=1)
+    p_per = 1. / freq[ifmax]
+    max_power = powers[rows, ifmax]
+
+    # Alias handling: first peak (in grid order) within 1.7-2.3x the highest peak's period
+    alias = peaks & (pgramx > 1.7 * p_per[:, None]) & (pgramx < 2.3 * p_per[:, None])
+    has_alias = alias.any(axis=1)
+    first = np.argmax(alias, axis=1)
+    proti, pwri = pgramx[first], powers[rows, first]
+
+    keep_max = ~has_alias | (proti > 18)
+    prot = np.where(keep_max, p_per, proti)
+    f_power = np.where(keep_max, max_power, pwri)
+    lgpeakflag = np.select(
+        [~has_alias, proti > 18, p_per > 28],
+        [1., 1.5, 0.],
+        default=0.5,
+    )
+
+    # Adjust for long-period spurious peaks: take the longest-period peak below 18 days
+    short = peaks & (pgramx < 18)
+    spurious = (p_per > 18) & short.any(axis=1)
+    longest = np.argmax(np.where(short, pgramx, -np.inf), axis=1)
+    prot = np.where(spurious, pgramx[longest], prot)
+    f_power = np.where(spurious, powers[rows, longest], f_power)
+    lgpeakflag = np.where(spurious, 0., lgpeakflag)
+
+    medpower = np.median(powers, axis=1)
+    if return_peaks:
+        return prot, f_power, medpower, lgpeakflag, ifmax, peaks
+    return prot, f_power, medpower, lgpeakflag
+
+def resolve_peak(freq, power):
     pgramx = 1 / freq
     pgramy = power
 
@@ -51,15 +390,20 @@ def GLS(time, flux, error):
 
     return freq, pgramx, pgramy, prot, peaks2, ifmax, f_power, np.median(power), lgpeakflag
 
-def unc_fit(freq, pgramy, prot):
-    try:
-        idp = (np.abs(freq - 1 / prot)).argmin()
-        xunc = freq[idp - 30:idp + 30]
-        yunc = pgramy[idp - 30:idp + 30]
+UNC_METHODS = ("fast", "astropy")
 
-        fitter = modeling.fitting.LevMarLSQFitter()
-        model = modeling.models.Gaussian1D(pgramy[idp], freq[idp], 0.1 * freq[idp])
-        fitted_model = fitter(model, xunc, yunc)
+def _astropy_gaussian(freq, pgramy, prot):
+    idp = (np.abs(freq - 1 / prot)).argmin()
+    xunc = freq[idp - 30:idp + 30]
+    yunc = pgramy[idp - 30:idp + 30]
+
+    fitter = modeling.fitting.LevMarLSQFitter()
+    model = modeling.models.Gaussian1D(pgramy[idp], freq[idp], 0.1 * freq[idp])
+    return xunc, fitter(model, xunc, yunc)
+
+def _unc_fit_astropy(freq, pgramy, prot):
+    try:
+        xunc, fitted_model = _astropy_gaussian(freq, pgramy, prot)
 
         ll = fitted_model.mean.value - fitted_model.stddev.value
         mu = fitted_model.mean.value
@@ -73,92 +417,463 @@ def unc_fit(freq, pgramy, prot):
     except Exception:
         return np.nan, np.nan, np.nan
 
+def _peak_windows(freqs, pgramys, prots, half_width=30):
+    """
+    Stack the +/-half_width bin windows around each period's peak into padded
+    (n, 2 * half_width) arrays, in units of grid steps from the peak bin and of
+    the peak power so every fit is well scaled.
+    """
+    n, width = len(prots), 2 * half_width
+    u, y, w = np.zeros((n, width)), np.zeros((n, width)), np.zeros((n, width))
+    center, step, scale = np.full(n, np.nan), np.ones(n), np.ones(n)
+    for k, (freq, pgramy, prot) in enumerate(zip(freqs, pgramys, prots)):
+        if freq is None or pgramy is None or not np.isfinite(prot) or prot == 0:
+            continue
+        idp = (np.abs(freq - 1 / prot)).argmin()
+        # Same (possibly clipped or empty) slice as the astropy fit
+        xs = np.asarray(freq[idp - half_width:idp + half_width], dtype=np.float64)
+        ys = np.asarray(pgramy[idp - half_width:idp + half_width], dtype=np.float64)
+        if len(xs) < 3 or not np.all(np.isfinite(ys)) or pgramy[idp] <= 0:
+            continue
+        center[k], step[k], scale[k] = freq[idp], (xs[-1] - xs[0]) / (len(xs) - 1), pgramy[idp]
+        u[k, :len(xs)] = (xs - center[k]) / step[k]
+        y[k, :len(xs)] = ys / scale[k]
+        w[k, :len(xs)] = 1.
+    return u, y, w, center, step, scale
+
+def _log_parabola_guess(u, y, w):
+    """Closed-form Gaussian through the log-power of the window maximum and its two neighbours."""
+    n, width = y.shape
+    rows = np.arange(n)
+    j = np.clip(np.argmax(np.where(w > 0, y, -np.inf), axis=1), 1, width - 2)
+    with np.errstate(all="ignore"):
+        l0, l1, l2 = (np.log(y[rows, j + d]) for d in (-1, 0, 1))
+        curvature = l0 - 2 * l1 + l2
+        offset = 0.5 * (l0 - l2) / curvature
+        guess = np.column_stack([
+            np.exp(l1 - 0.25 * (l0 - l2) * offset),
+            u[rows, j] + offset * (u[rows, j + 1] - u[rows, j]),
+            np.sqrt(-1 / curvature) * (u[rows, j + 1] - u[rows, j]),
+        ])
+    usable = (w[rows, j - 1] > 0) & (w[rows, j + 1] > 0) & (curvature < 0) & np.all(np.isfinite(guess), axis=1)
+    return guess, usable
+
+def _fit_gaussians(u, y, w, p, max_iter=100, ftol=1e-10):
+    """
+    Levenberg-Marquardt least-squares fit of a * exp(-(u - m)^2 / (2 s^2)) to
+    every row at once, starting from ``p`` (n, 3). Returns the parameters and
+    a flag for rows that converged.
+    """
+    p = p.copy()
+    n = len(p)
+    eye = np.eye(3)
+
+    def residuals(p):
+        with np.errstate(all="ignore"):
+            z = (u - p[:, 1:2]) / p[:, 2:3]
+            g = np.exp(-0.5 * z ** 2)
+            r = w * (p[:, 0:1] * g - y)
+        return r, g, z, np.sum(r ** 2, axis=1)
+
+    r, g, z, cost = residuals(p)
+    lam = np.full(n, 1e-3)
+    active = np.all(np.isfinite(p), axis=1) & np.isfinite(cost) & (p[:, 2] != 0)
+    converged = np.zeros(n, dtype=bool)
+
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        a, s = p[:, 0:1], p[:, 2:3]
+        jac = w[..., None] * np.stack([g, a * g * z / s, a * g * z ** 2 / s], axis=-1)
+        jtj = np.einsum("nki,nkj->nij", jac, jac)
+        grad = np.einsum("nki,nk->ni", jac, r)
+        lhs = jtj + lam[:, None, None] * (jtj * eye) + 1e-12 * eye
+        lhs[~active], grad[~active] = eye, 0.
+        with np.errstate(all="ignore"):
+            trial = p - np.linalg.solve(lhs, grad[..., None])[..., 0]
+        r_t, g_t, z_t, cost_t = residuals(trial)
+
+        better = active & np.isfinite(cost_t) & (cost_t <= cost)
+        converged |= better & (cost - cost_t <= ftol * cost)
+        p[better], r[better], g[better], z[better] = trial[better], r_t[better], g_t[better], z_t[better]
+        cost[better] = cost_t[better]
+        lam = np.where(better, lam * 0.1, lam * 10)
+
+        # A step that cannot lower the cost even when tiny means the minimum is reached
+        converged |= active & (lam > 1e10)
+        active &= ~converged
+    return p, converged
+
+def unc_fit_batch(freqs, pgramys, prots, method="fast"):
+    """
+    Peak uncertainties of many periodograms at once.
+
+    Fits the same Gaussian as the astropy fit over the +/-30 bin window
+    around each period, but as one vectorized Levenberg-Marquardt solve
+    started from a closed-form log-parabola estimate. Rows where it does not
+    converge fall back to the astropy fit; ``method="astropy"`` uses the
+    astropy fit for every row.
+
+    Returns (unc, mean, stddev, amplitude) arrays.
+    """
+    if method not in UNC_METHODS:
+        raise ValueError(f"Unknown unc_fit method '{method}'. Use one of {UNC_METHODS}.")
+    n = len(prots)
+    mean, stddev, amplitude = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+    fallback = np.ones(n, dtype=bool)
+
+    if method == "fast" and n:
+        u, y, w, center, step, scale = _peak_windows(freqs, pgramys, prots)
+        guess, usable = _log_parabola_guess(u, y, w)
+        # Where the log-parabola is undefined start from the astropy initial guess
+        default = np.column_stack([np.ones(n), np.zeros(n), 0.1 * center / step])
+        guess[~usable] = default[~usable]
+        params, converged = _fit_gaussians(u, y, w, guess)
+
+        ok = converged & np.isfinite(center) & np.all(np.isfinite(params), axis=1)
+        mean[ok] = center[ok] + params[ok, 1] * step[ok]
+        stddev[ok] = params[ok, 2] * step[ok]
+        amplitude[ok] = params[ok, 0] * scale[ok]
+        fallback = ~ok & np.isfinite(np.asarray(prots, dtype=np.float64))
+
+    for k in np.flatnonzero(fallback):
+        try:
+            _, fitted = _astropy_gaussian(freqs[k], pgramys[k], prots[k])
+            mean[k], stddev[k], amplitude[k] = fitted.mean.value, fitted.stddev.value, fitted.amplitude.value
+        except Exception:
+            continue
+
+    with np.errstate(all="ignore"):
+        unc = np.fmax((1 / (mean - stddev)) - (1 / mean), (1 / mean) - (1 / (mean + stddev)))
+    return unc, mean, stddev, amplitude
+
+def unc_fit(freq, pgramy, prot, method="fast"):
+    """
+    Period uncertainty from a Gaussian fit to the periodogram peak at ``prot``.
+    Returns the window frequencies, the fitted curve over them and the
+    uncertainty in days, or NaNs if the fit fails.
+    """
+    if method == "astropy":
+        return _unc_fit_astropy(freq, pgramy, prot)
+    unc, mean, stddev, amplitude = unc_fit_batch([freq], [pgramy], [prot], method=method)
+    if not np.isfinite(unc[0]):
+        return np.nan, np.nan, np.nan
+    idp = (np.abs(freq - 1 / prot)).argmin()
+    xunc = freq[idp - 30:idp + 30]
+    return xunc, amplitude[0] * np.exp(-0.5 * ((xunc - mean[0]) / stddev[0]) ** 2), unc[0]
+
 def get_unmasked_array(q):
+    # No copy when the column is already float64; load_sector_arrays copies on masking anyway
     if isinstance(q, Masked):
-        return q.unmasked.value.astype(np.float64)
+        return np.asarray(q.unmasked.value, dtype=np.float64)
     else:
-        return q.value.astype(np.float64)
+        return np.asarray(q.value, dtype=np.float64)
 
-def compute_rotation_metrics(lightcurves, sectors, tic_id):
-    print(f"Starting TIC {tic_id} with {len(lightcurves)} lightcurves")
-    
-    results = {}
-    pgramx_list, pgramy_list, times, fluxes = [], [], [], []
+def sector_buffers(lc):
+    """Unmasked time, flux and flux_err arrays of a LightCurve, with unit errors if it has none."""
+    time = lc.time.value
+    flux = get_unmasked_array(lc.flux)
+    if hasattr(lc, 'flux_err'):
+        flux_err = get_unmasked_array(lc.flux_err)
+    else:
+        flux_err = np.ones_like(flux)
+    return time, flux, flux_err
 
-    for i, lc in enumerate(lightcurves):
-        print(f"\n--- Sector {i} ---")
+def load_sector_arrays(lc):
+    """
+    Finite time, flux and flux_err of one sector, from a LightCurve or from
+    a ``(time, flux, flux_err)`` tuple of arrays (see ``sector_buffers``).
+    """
+    time, flux, flux_err = lc if isinstance(lc, tuple) else sector_buffers(lc)
 
-        try:
-            time = lc.time.value
-            print(f"  Time array loaded: len={len(time)}")
+    mask = np.isfinite(time) & np.isfinite(flux)
+    return time[mask], flux[mask], flux_err[mask]
 
-            flux = get_unmasked_array(lc.flux)
-            print(f"  Flux array loaded")
+def stitch_segments(segments, max_gap=10.):
+    """
+    Group sector segments ``{key: (time, flux, flux_err)}`` into runs of
+    consecutive sectors, each starting within ``max_gap`` days of the end of
+    the previous one. Segments overlapping an earlier one in time (e.g. the
+    same sector from a second pipeline) are left out. Returns lists of keys in
+    time order.
+    """
+    order = sorted(segments, key=lambda k: (segments[k][0].min(), -len(segments[k][0])))
+    runs, end = [], -np.inf
+    for key in order:
+        t = segments[key][0]
+        if t.min() < end:
+            continue
+        if runs and t.min() - end <= max_gap:
+            runs[-1].append(key)
+        else:
+            runs.append([key])
+        end = t.max()
+    return runs
 
-            if hasattr(lc, 'flux_err'):
-                flux_err = get_unmasked_array(lc.flux_err)
-                print(f"  Flux error loaded from lc")
-            else:
-                flux_err = np.ones_like(flux)
-                print(f"  Flux error defaulted to ones")
+def stitched_periodogram(segments, fft_oversampling=10, oversampling=10, min_period=0.097, max_period=100.,
+                         baseline_factor=0.5):
+    """
+    Fast GLS of several sectors joined into one light curve, each segment
+    divided by its median flux. The uniform grid follows the joined baseline
+    (see ``adaptive_frequency_grid``), so long periods are resolved and the
+    cost stays O(N log N) in the number of points.
+
+    Returns (freq, power, baseline, n_points).
+    """
+    times, fluxes, errors = [], [], []
+    for time, flux, flux_err in segments:
+        med = np.median(flux)
+        times.append(time)
+        fluxes.append(flux / med)
+        errors.append(flux_err / np.abs(med))
+    time, flux, flux_err = np.concatenate(times), np.concatenate(fluxes), np.concatenate(errors)
+
+    baseline = time.max() - time.min()
+    cadence = np.median(np.diff(np.sort(time)))
+    freq = adaptive_frequency_grid(baseline, cadence, oversampling, min_period, max_period, baseline_factor)
+    power = fast_gls_power(time, flux, flux_err, freq=freq, oversampling=fft_oversampling)
+    return freq, power, baseline, len(time)
+
+def stitch_rotation(segments, labels, min_sectors=2, max_gap=10., unc_method="fast", **pgram_kwds):
+    """
+    Rotation period from the longest run of consecutive sectors (most points),
+    searched with ``stitched_periodogram``. The period is the highest peak:
+    the per-sector alias fallbacks for periods above 18 days do not apply to
+    the joined baseline.
+
+    Returns a result dict like the per-sector ones, with ``n_sectors`` and
+    ``baseline`` added, or None if no run has ``min_sectors`` sectors.
+    """
+    runs = [run for run in stitch_segments(segments, max_gap) if len(run) >= min_sectors]
+    if not runs:
+        return None
+    run = max(runs, key=lambda r: sum(len(segments[k][0]) for k in r))
+
+    freq, power, baseline, npts = stitched_periodogram([segments[k] for k in run], **pgram_kwds)
+    logger.debug("Running stitched GLS on %d sectors (%d points, %.1f d, %d frequencies)...",
+                 len(run), npts, baseline, len(freq))
+    ifmax = np.argmax(power)
+    prot = 1. / freq[ifmax]
+    unc = unc_fit_batch([freq], [power], [prot], method=unc_method)[0][0]
+    logger.debug("  Stitched period = %.2f, Unc = %.2f", prot, unc)
 
-            mask = np.isfinite(time) & np.isfinite(flux)
-            time, flux, flux_err = time[mask], flux[mask], flux_err[mask]
-            print(f"  After masking: len(time) = {len(time)}")
+    return {
+        'sector': f"{labels[run[0]]} .. {labels[run[-1]]}",
+        'prot': prot,
+        'uncsec': unc,
+        'power': power[ifmax],
+        'medpower': np.median(power),
+        'peakflag': 1,
+        'n_sectors': len(run),
+        'baseline': baseline,
+    }
+
+def _peak_window(freq, pgramy, prot, half_width=30):
+    # Copy of the bins unc_fit reads around the peak, so the full periodogram can be freed
+    if not np.isfinite(prot) or prot == 0:
+        return freq, pgramy
+    idp = (np.abs(freq - 1 / prot)).argmin()
+    if idp < half_width:
+        # The fit's slice wraps around here; keep everything so it sees the same bins
+        return freq, pgramy
+    return freq[idp - half_width:idp + half_width].copy(), pgramy[idp - half_width:idp + half_width].copy()
+
+def _sector_label(sectors, i):
+    if sectors is None:
+        logger.warning("  ERROR: sectors is None!")
+    elif i >= len(sectors):
+        logger.warning("  ERROR: sector index %d out of bounds for sectors of length %d", i, len(sectors))
+    elif sectors[i] is None:
+        logger.warning("  WARNING: sectors[%d] is None", i)
+    else:
+        return str(sectors[i])
+    return f"UNKNOWN_{i}"
+
+def compute_rotation_metrics(lightcurves, sectors, tic_id, backend="pyastronomy", max_elements=2**22, fft_oversampling=10,
+                             grid="fixed", grid_kwds=None, unc_method="fast", stitch=False, stitch_kwds=None,
+                             compact=False, periodograms="full", keep_lightcurves=True, screen=False, screen_kwds=None):
+    """
+    Per-sector rotation periods of one star.
+
+    With ``screen`` each sector is first searched on a coarse grid (see
+    ``screen_sector``, configured by ``screen_kwds``); sectors that cannot
+    reach a detection keep the coarse result with peakflag
+    ``SCREENED_FLAG`` and skip the fine search and ``unc_fit``.
+
+    With ``compact`` the sector times are float32 offsets from a float64
+    epoch per sector (``Epochs``), fluxes and periodogram powers are float32
+    and ``Results`` is one structured array (see ``results.result_dtype``)
+    instead of a dict of dicts. ``periodograms`` keeps each sector's
+    ``full`` periodogram, only its ``peaks`` or ``none`` of it, and
+    ``keep_lightcurves=False`` leaves ``Times`` and ``Fluxes`` empty.
+    """
+    if backend not in GLS_BACKENDS:
+        raise ValueError(f"Unknown GLS backend '{backend}'. Use one of {GLS_BACKENDS}.")
+    if unc_method not in UNC_METHODS:
+        raise ValueError(f"Unknown unc_fit method '{unc_method}'. Use one of {UNC_METHODS}.")
+    if periodograms not in PGRAM_MODES:
+        raise ValueError(f"Unknown periodograms mode '{periodograms}'. Use one of {PGRAM_MODES}.")
+    grid_kwds = grid_kwds or {}
+    screen_kwds = {"decimate": 8, "min_snr": 20., **(screen_kwds or {})} if screen else None
+    dtype = np.float32 if compact else np.float64
+
+    logger.debug("Starting TIC %s with %d lightcurves", tic_id, len(lightcurves))
+
+    if compact:
+        width = max([len(str(s)) for s in (sectors or []) if s is not None] + [len(f"UNKNOWN_{len(lightcurves)}")])
+        results, rows = np.zeros(len(lightcurves), dtype=result_dtype(width)), {}
+    else:
+        results = {}
+    pgramx_list, pgramy_list, times, fluxes, epochs = [], [], [], [], []
+    peaks, segments = {}, {}
+
+    # The numpy backend evaluates every usable sector in one batched call up front
+    loaded, batched, screened = {}, {}, {}
+    if backend == "numpy":
+        for i, lc in enumerate(lightcurves):
+            try:
+                with stage("normalize"):
+                    loaded[i] = load_sector_arrays(lc)
+            except Exception:
+                continue
+        idx = [i for i, (t, f, e) in loaded.items() if len(t) >= 10 and np.all(np.isfinite(e))]
+        # Sectors are batched together when they share a frequency grid
+        groups = {}
+        for i in idx:
+            try:
+                freq = frequency_grid(loaded[i][0], grid, **grid_kwds)
+            except ValueError:
+                continue
+            groups.setdefault((freq[0], freq[-1], len(freq)), (freq, []))[1].append(i)
+        for freq, members in groups.values():
+            if screen:
+                with stage("screen"):
+                    baseline = max(np.ptp(loaded[i][0]) for i in members)
+                    coarse = GLS_batch(*zip(*[loaded[i] for i in members]), max_elements=max_elements,
+                                       freq=screen_grid(freq, screen_kwds['decimate'], baseline=baseline))
+                screened.update((i, c) for i, c in zip(members, coarse) if _screened_out(c[2], screen_kwds['min_snr']))
+                members = [i for i in members if i not in screened]
+                if not members:
+                    continue
+            logger.debug("Running batched GLS on %d sectors...", len(members))
+            with stage("gls"):
+                batch = GLS_batch(*zip(*[loaded[i] for i in members]), freq=freq, max_elements=max_elements)
+            batched.update(zip(members, batch))
+
+    for i, lc in enumerate(lightcurves):
+        logger.debug("--- Sector %d ---", i)
+
+        try:
+            if i in loaded:
+                time, flux, flux_err = loaded.pop(i)
+            else:
+                with stage("normalize"):
+                    time, flux, flux_err = load_sector_arrays(lc)
+            logger.debug("  After masking: len(time) = %d", len(time))
 
             if len(time) < 10:
-                print(f"  Skipping sector {i}: not enough data points")
+                logger.debug("  Skipping sector %d: not enough data points", i)
                 continue
+            if stitch:
+                segments[str(i)] = (time, flux, flux_err)
+            count("sectors")
+            count("points", len(time))
 
-            print(f"  Running GLS...")
-            freq, pgramx, pgramy, prot, peaks2, ifmax, power, medp, peakflag = GLS(time, flux, flux_err)
-            print(f"  GLS complete. Period = {prot:.2f}")
+            if screen and i not in batched and i not in screened:
+                with stage("screen"):
+                    coarse = screen_sector(time, flux, flux_err, backend=backend, fft_oversampling=fft_oversampling,
+                                           grid=grid, **screen_kwds, **grid_kwds)
+                if coarse is not None:
+                    screened[i] = coarse
 
-            print(f"  Running unc_fit...")
-            _, _, unc = unc_fit(freq, pgramy, prot)
-            print(f"  unc_fit complete. Unc = {unc:.2f}")
+            logger.debug("  Running GLS...")
+            if i in screened:
+                freq, pgramx, pgramy, prot, peaks2, ifmax, power, medp, peakflag = screened.pop(i)
+                peakflag = SCREENED_FLAG
+                count("screened")
+                logger.debug("  Screened out: peak power %.3g, median %.3g", pgramy[ifmax], medp)
+            elif i in batched:
+                freq, pgramx, pgramy, prot, peaks2, ifmax, power, medp, peakflag = batched.pop(i)
+            else:
+                with stage("gls"):
+                    freq, pgramx, pgramy, prot, peaks2, ifmax, power, medp, peakflag = GLS(
+                        time, flux, flux_err, backend=backend, fft_oversampling=fft_oversampling, grid=grid, **grid_kwds
+                    )
+            logger.debug("  GLS complete. Period = %.2f", prot)
+
+            # Peak uncertainties of all sectors are fitted together after the loop
+            if peakflag != SCREENED_FLAG:
+                window = _peak_window(freq, pgramy, prot) if compact else (freq, pgramy)
+                peaks[str(i)] = window + (prot,)
+            unc = np.nan
 
         except Exception as e:
-            print(f"  ERROR in sector {i} for TIC {tic_id}: {e}")
+            logger.warning("  ERROR in sector %d for TIC %s: %s", i, tic_id, e)
             prot, unc, power, medp, peakflag = np.nan, np.nan, np.nan, np.nan, np.nan
             freq, pgramx, pgramy = None, None, None
 
         # Get safe sector label
-        if sectors is None:
-            print(f"  ERROR: sectors is None!")
-            sector_val = f"UNKNOWN_{i}"
-        elif i >= len(sectors):
-            print(f"  ERROR: sector index {i} out of bounds for sectors of length {len(sectors)}")
-            sector_val = f"UNKNOWN_{i}"
-        elif sectors[i] is None:
-            print(f"  WARNING: sectors[{i}] is None")
-            sector_val = f"UNKNOWN_{i}"
+        sector_val = _sector_label(sectors, i)
+
+        if compact:
+            rows[str(i)] = len(rows)
+            results[rows[str(i)]] = (i, sector_val, prot, unc, power, medp, peakflag)
         else:
-            sector_val = str(sectors[i])
+            results[str(i)] = {
+                'sector': sector_val,
+                'prot': prot,
+                'uncsec': unc,
+                'power': power,
+                'medpower': medp,
+                'peakflag': peakflag
+            }
 
-        results[str(i)] = {
-            'sector': sector_val,
-            'prot': prot,
-            'uncsec': unc,
-            'power': power,
-            'medpower': medp,
-            'peakflag': peakflag
-        }
+        if keep_lightcurves and compact:
+            epochs.append(time[0] if len(time) else 0.)
+            times.append((time - epochs[-1]).astype(np.float32))
+            fluxes.append(flux.astype(np.float32))
+        elif keep_lightcurves:
+            times.append(time)
+            fluxes.append(flux)
+        if pgramx is not None and pgramy is not None and periodograms != "none":
+            if periodograms == "peaks":
+                pgramx, pgramy = pgramx[peaks2], pgramy[peaks2]
+            pgramx_list.append(pgramx.astype(dtype, copy=False))
+            pgramy_list.append(pgramy.astype(dtype, copy=False))
 
-        times.append(time)
-        fluxes.append(flux)
-        if pgramx is not None and pgramy is not None:
-            pgramx_list.append(pgramx)
-            pgramy_list.append(pgramy)
+        logger.debug("  Sector %d finished.", i)
 
-        print(f"  Sector {i} finished.")
+    if compact:
+        results = results[:len(rows)]
 
-    print("All sectors processed. Finalizing...")
+    if peaks:
+        logger.debug("Running unc_fit on %d sectors...", len(peaks))
+        with stage("unc_fit"):
+            uncs = unc_fit_batch(*zip(*peaks.values()), method=unc_method)[0]
+        for key, unc in zip(peaks, uncs):
+            if compact:
+                results['uncsec'][rows[key]] = unc
+            else:
+                results[key]['uncsec'] = unc
+            logger.debug("  Sector %s: unc_fit complete. Unc = %.2f", key, unc)
 
-    flat_result = {f"{i}_{k}": v for i, res in results.items() for k, v in res.items()}
+    stitched = None
+    if stitch:
+        labels = dict(sector_items(results))
+        labels = {key: labels[key]['sector'] for key in segments}
+        try:
+            with stage("stitch"):
+                stitched = stitch_rotation(segments, labels, unc_method=unc_method, fft_oversampling=fft_oversampling,
+                                           **(stitch_kwds or {}))
+        except Exception as e:
+            logger.warning("  ERROR in stitched periodogram for TIC %s: %s", tic_id, e)
+
+    logger.debug("All sectors processed. Finalizing...")
+
+    flat_result = {f"{i}_{k}": v for i, res in sector_items(results) for k, v in res.items()}
     flat_result['TIC'] = tic_id
 
-    return {
+    metrics = {
         'TIC': tic_id,
         'Times': times,
         'Fluxes': fluxes,
@@ -166,5 +881,9 @@ def compute_rotation_metrics(lightcurves, sectors, tic_id):
         'Pgramy': pgramy_list,
         'Sectors': sectors,
         'Results': results,
+        'Stitched': stitched,
         'FlatResult': flat_result
     }
+    if compact:
+        metrics['Epochs'] = epochs
+    return metrics
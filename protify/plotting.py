@@ -1,9 +1,45 @@
 import os
 import pickle
+import logging
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
 
+from protify.lcstore import list_stars, load_star
+
+logger = logging.getLogger(__name__)
+
+# Points drawn per panel; denser light curves and periodograms are thinned first
+MAX_POINTS = 5000
+
+def thin(x, y, max_points=MAX_POINTS):
+    """Every k-th point, so at most ``max_points`` remain (for scatter panels)."""
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    step = int(np.ceil(len(x) / max_points))
+    return x[::step], y[::step]
+
+def envelope(x, y, max_points=MAX_POINTS):
+    """
+    Minimum and maximum of ``y`` in each of ``max_points // 2`` bins, in
+    order, so a line plot keeps every peak (for periodograms).
+    """
+    if max_points is None or len(x) <= max_points:
+        return x, y
+    y = np.asarray(y)
+    k = int(np.ceil(len(y) / max(1, max_points // 2)))
+    m = len(y) // k
+    bins = y[:m * k].reshape(m, k)
+    offsets = np.arange(m) * k
+    keep = [offsets + np.argmin(bins, axis=1), offsets + np.argmax(bins, axis=1)]
+    if len(y) > m * k:
+        tail = y[m * k:]
+        keep.append(m * k + np.array([np.argmin(tail), np.argmax(tail)]))
+    keep = np.unique(np.concatenate(keep))
+    return x[keep], y[keep]
+
 def _format_axes(ax):
     ax.tick_params(which='both', direction='in', width=2, bottom=True, top=True, left=True, right=True, pad=5)
     ax.tick_params(which='major', length=10, labelsize=20)
@@ -12,16 +48,15 @@ def _format_axes(ax):
         ax.spines[axis].set_linewidth(2)
     ax.set_rasterization_zorder(0)
 
-def plot_lightcurve_summary(times, fluxes, pgramxs, pgramys, prots, medps, powers, sectors, tic_ids, save_path=None):
+def plot_lightcurve_summary(times, fluxes, pgramxs, pgramys, prots, medps, powers, sectors, tic_ids, save_path=None,
+                            max_points=MAX_POINTS):
     n = len(times)
     gs = gridspec.GridSpec(ncols=3, nrows=n)
     fig = plt.figure(figsize=(25, 5 * n))
 
     for i in range(n):
-        time = times[i]
-        flux = fluxes[i]
-        pgramx = pgramxs[i]
-        pgramy = pgramys[i]
+        time, flux = thin(np.asarray(times[i]), np.asarray(fluxes[i]), max_points)
+        pgramx, pgramy = envelope(np.asarray(pgramxs[i]), np.asarray(pgramys[i]), max_points)
         prot = prots[i]
         medp = medps[i]
         power = powers[i]
@@ -108,48 +143,133 @@ def extract_sector_metrics(star_data, max_sectors=25):
 
     return prots, medps, powers, uncs, snrs, times, fluxes, pgramxs, pgramys, sectors
 
-def batch_plot_lightcurves(pickle_dir, save_dir="plots", max_stars=None, combine_into_pdf=False, combined_pdf_name="protify_rotators.pdf"):
+def init_plot_worker():
+    # Plot processes only write files, so they never need a display
+    matplotlib.use("Agg")
+
+def _star_source(pickle_dir, name):
+    # File whose modification time marks when the star's data last changed
+    if name.endswith(".pkl"):
+        return os.path.join(pickle_dir, name)
+    return os.path.join(pickle_dir, name, "index.json")
+
+def _load_entry(pickle_dir, name):
+    if name.endswith(".pkl"):
+        with open(os.path.join(pickle_dir, name), "rb") as f:
+            return pickle.load(f)
+    return load_star(pickle_dir, name[len("TIC"):])
+
+def plot_star(pickle_dir, name, save_dir="plots", max_points=MAX_POINTS, overwrite=False):
+    """
+    Render ``save_dir/TIC<id>_validation.pdf`` for one star of ``pickle_dir``
+    (``TIC<id>`` in the light curve store, or a legacy ``.pkl`` file name).
+
+    Stars whose plot is newer than their data are left alone unless
+    ``overwrite``. Returns ``(name, path, status)`` with status ``plotted``,
+    ``up-to-date``, ``no valid sectors`` or ``failed: <error>``.
+    """
+    try:
+        star_data = _load_entry(pickle_dir, name)
+        path = os.path.join(save_dir, f"TIC{star_data['TIC']}_validation.pdf")
+        if not overwrite and os.path.exists(path) and \
+                os.path.getmtime(path) >= os.path.getmtime(_star_source(pickle_dir, name)):
+            return name, path, "up-to-date"
+
+        prots, medps, powers, uncs, snrs, times, fluxes, pgramxs, pgramys, sectors = extract_sector_metrics(star_data)
+        if not prots:
+            return name, None, "no valid sectors"
+
+        fig = plot_lightcurve_summary(
+            times=times,
+            fluxes=fluxes,
+            pgramxs=pgramxs,
+            pgramys=pgramys,
+            prots=prots,
+            medps=medps,
+            powers=powers,
+            sectors=sectors,
+            tic_ids=[star_data["TIC"]] * len(prots),
+            max_points=max_points,
+        )
+        # Written under a temporary name so an interrupted render is never taken as up to date
+        fig.savefig(path + ".tmp", format="pdf", bbox_inches='tight')
+        plt.close(fig)
+        os.replace(path + ".tmp", path)
+        return name, path, "plotted"
+    except Exception as e:
+        return name, None, f"failed: {e}"
+
+def log_plot_result(name, path, status):
+    if status.startswith("failed"):
+        logger.warning("Failed to plot %s: %s", name, status[len("failed: "):])
+    elif status == "no valid sectors":
+        logger.info("Skipped %s: no valid sectors.", name)
+    else:
+        logger.debug("%s %s: %s", status.capitalize(), name, path)
+
+def _combine_pdfs(paths, pdf_path):
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        return False
+    writer = PdfWriter()
+    for path in paths:
+        writer.append(path)
+    with open(pdf_path + ".tmp", "wb") as f:
+        writer.write(f)
+    os.replace(pdf_path + ".tmp", pdf_path)
+    return True
+
+def batch_plot_lightcurves(pickle_dir, save_dir="plots", max_stars=None, combine_into_pdf=False,
+                           combined_pdf_name="protify_rotators.pdf", workers=1, max_points=MAX_POINTS, overwrite=False):
+    """
+    Render validation plots for every star in ``pickle_dir``, spread over
+    ``workers`` processes with the Agg backend. Stars whose plot is newer
+    than their data are skipped, and panels are thinned to ``max_points``.
+
+    ``combine_into_pdf`` also joins the per-star plots into one PDF; with
+    pypdf installed the pages are copied, otherwise the figures are drawn
+    again into the combined file.
+    """
     from matplotlib.backends.backend_pdf import PdfPages
 
     os.makedirs(save_dir, exist_ok=True)
-    files = sorted([f for f in os.listdir(pickle_dir) if f.endswith(".pkl")])
-    if max_stars:
-        files = files[:max_stars]
-
-    pdf_path = os.path.join(save_dir, combined_pdf_name)
-    pdf = PdfPages(pdf_path) if combine_into_pdf else None
 
-    for file in files:
-        with open(os.path.join(pickle_dir, file), "rb") as f:
-            star_data = pickle.load(f)
+    # Stars from the light curve store load lazily; legacy pickles are still read
+    names = [f"TIC{tic}" for tic in list_stars(pickle_dir)]
+    names += [f for f in os.listdir(pickle_dir) if f.endswith(".pkl")]
+    names.sort()
+    if max_stars:
+        names = names[:max_stars]
 
-        try:
-            prots, medps, powers, uncs, snrs, times, fluxes, pgramxs, pgramys, sectors = extract_sector_metrics(star_data)
-            if not prots:
-                print(f"Skipped {file}: no valid sectors.")
-                continue
+    args = [(pickle_dir, name, save_dir, max_points, overwrite) for name in names]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_plot_worker) as pool:
+            results = list(pool.map(plot_star, *zip(*args), chunksize=8)) if args else []
+    else:
+        results = [plot_star(*a) for a in args]
 
-            fig = plot_lightcurve_summary(
-                times=times,
-                fluxes=fluxes,
-                pgramxs=pgramxs,
-                pgramys=pgramys,
-                prots=prots,
-                medps=medps,
-                powers=powers,
-                sectors=sectors,
-                tic_ids=[star_data["TIC"]] * len(prots),
-                save_path=None if combine_into_pdf else os.path.join(save_dir, f"TIC{star_data['TIC']}_validation.pdf")
-            )
-            if combine_into_pdf:
-                pdf.savefig(fig)
-                plt.close(fig)
-            else:
-                plt.close(fig)
-
-        except Exception as e:
-            print(f"Failed to plot {file}: {e}")
+    counts = {}
+    for result in results:
+        log_plot_result(*result)
+        status = result[2].split(":")[0]
+        counts[status] = counts.get(status, 0) + 1
+    logger.info("Plots in %s: %s", save_dir, counts)
 
     if combine_into_pdf:
-        pdf.close()
-        print(f"Combined PDF saved to {pdf_path}")
+        pdf_path = os.path.join(save_dir, combined_pdf_name)
+        paths = [path for _, path, status in results if path is not None]
+        if not _combine_pdfs(paths, pdf_path):
+            with PdfPages(pdf_path) as pdf:
+                for name, path, status in results:
+                    if path is None:
+                        continue
+                    star_data = _load_entry(pickle_dir, name)
+                    prots, medps, powers, uncs, snrs, times, fluxes, pgramxs, pgramys, sectors = \
+                        extract_sector_metrics(star_data)
+                    fig = plot_lightcurve_summary(times, fluxes, pgramxs, pgramys, prots, medps, powers, sectors,
+                                                  [star_data["TIC"]] * len(prots), max_points=max_points)
+                    pdf.savefig(fig)
+                    plt.close(fig)
+        logger.info("Combined PDF saved to %s", pdf_path)
+    return results
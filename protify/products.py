@@ -0,0 +1,215 @@
+import os
+import time
+import sqlite3
+import logging
+import numpy as np
+import pandas as pd
+
+from protify.downloader import AUTHORS, LocalArchive, LocalSearchResult, with_retries
+from protify.metrics import stage
+from protify.results import CHUNKSIZE
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_COLUMNS = ("tic", "sector", "author", "uri")
+# Order of the authors in a lightkurve search result, which sets the sector order of a star
+AUTHOR_PRIORITY = {"SPOC": 1, "TESS-SPOC": 2, "QLP": 3}
+# SQLite caps the number of parameters in one statement
+_SQL_BATCH = 900
+
+class ProductIndex:
+    """
+    Local (TIC -> sector, author, product URI) index of the light curve
+    products to download, resolved in bulk before the per-star downloads.
+
+    Stars resolved without any SPOC/QLP product are recorded too, so they
+    fail without a search. Called like ``search_lightcurve``, it returns the
+    indexed products of a star and hands stars that were never resolved to
+    ``fallback`` (a live MAST search by default). The object only holds
+    paths, so it can be shared with worker processes.
+    """
+    def __init__(self, path, fallback=None):
+        self.path = path
+        self.fallback = fallback
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE IF NOT EXISTS stars (tic TEXT PRIMARY KEY, n_products INTEGER, resolved REAL)")
+            db.execute("CREATE TABLE IF NOT EXISTS products (tic TEXT, position INTEGER, sector TEXT, author TEXT, "
+                       "uri TEXT, PRIMARY KEY (tic, position))")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def add(self, tic_ids, products):
+        """
+        Record ``tic_ids`` as resolved with their rows of ``products`` (a
+        frame of ``MANIFEST_COLUMNS``, already filtered and in search order).
+        """
+        tic_ids = [str(t) for t in tic_ids]
+        products = products[products["tic"].isin(tic_ids)]
+        position = products.groupby("tic", sort=False).cumcount()
+        n_products = products["tic"].value_counts()
+        now = time.time()
+        with self._connect() as db:
+            db.executemany("DELETE FROM products WHERE tic = ?", [(t,) for t in tic_ids])
+            db.executemany("INSERT INTO products VALUES (?, ?, ?, ?, ?)",
+                           zip(products["tic"], position.astype(int).tolist(), products["sector"], products["author"],
+                               products["uri"]))
+            db.executemany("INSERT OR REPLACE INTO stars VALUES (?, ?, ?)",
+                           [(t, int(n_products.get(t, 0)), now) for t in tic_ids])
+
+    def resolved(self, tic_ids):
+        """The subset of ``tic_ids`` already in the index."""
+        tic_ids = [str(t) for t in tic_ids]
+        found = set()
+        with self._connect() as db:
+            for start in range(0, len(tic_ids), _SQL_BATCH):
+                batch = tic_ids[start:start + _SQL_BATCH]
+                rows = db.execute(f"SELECT tic FROM stars WHERE tic IN ({','.join('?' * len(batch))})", batch)
+                found.update(r[0] for r in rows)
+        return found
+
+    def products(self, tic_id):
+        """``(author, sector, uri)`` rows of a star in search order, or None if it was never resolved."""
+        tic_id = str(tic_id)
+        with self._connect() as db:
+            if db.execute("SELECT 1 FROM stars WHERE tic = ?", (tic_id,)).fetchone() is None:
+                return None
+            return db.execute("SELECT author, sector, uri FROM products WHERE tic = ? ORDER BY position",
+                              (tic_id,)).fetchall()
+
+    def __call__(self, target, mission='TESS'):
+        rows = self.products(str(target).replace("TIC", "").strip())
+        if rows is None:
+            if self.fallback is None:
+                from lightkurve import search_lightcurve
+                return search_lightcurve(target, mission=mission)
+            return self.fallback(target, mission=mission)
+        return LocalSearchResult(rows)
+
+    def __len__(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM stars").fetchone()[0]
+
+def _normalize(products, mission="TESS"):
+    # TICs as plain integer strings and numeric sectors as search-result labels ("TESS Sector 01")
+    products = products.copy()
+    tics = pd.to_numeric(products["tic"].astype(str).str.replace("TIC", "").str.strip(), errors="coerce")
+    products = products[tics.notna()]
+    products["tic"] = tics[tics.notna()].astype(np.int64).astype(str)
+    sectors = pd.to_numeric(products["sector"], errors="coerce")
+    labels = f"{mission} Sector " + sectors.fillna(0).astype(int).map("{:02d}".format)
+    products["sector"] = np.where(sectors.notna(), labels, products["sector"].astype(str))
+    products["author"] = products["author"].astype(str)
+    products["uri"] = products["uri"].astype(str)
+    return products
+
+def filter_products(products, tic_ids=None):
+    """SPOC, TESS-SPOC and QLP products (of ``tic_ids``), selected in one vectorized pass."""
+    mask = products["author"].isin(AUTHORS)
+    if tic_ids is not None:
+        mask &= products["tic"].isin([str(t) for t in tic_ids])
+    return products[mask]
+
+def read_manifest(path, tic_ids=None, mission="TESS", chunksize=CHUNKSIZE):
+    """
+    Product manifest with ``tic``, ``sector``, ``author`` and ``uri`` columns
+    (CSV or Parquet), keeping the products of ``tic_ids``. ``sector`` is a
+    sector number or label; ``uri`` a local path or a ``mast:`` data URI.
+    Each star's products keep their order in the file.
+    """
+    if path.endswith(".parquet"):
+        chunks = [pd.read_parquet(path, columns=list(MANIFEST_COLUMNS))]
+    else:
+        chunks = pd.read_csv(path, usecols=list(MANIFEST_COLUMNS), dtype={"tic": str, "author": str, "uri": str},
+                             chunksize=chunksize)
+    frames = [filter_products(_normalize(chunk, mission), tic_ids) for chunk in chunks]
+    if not frames:
+        return pd.DataFrame(columns=list(MANIFEST_COLUMNS))
+    return pd.concat(frames, ignore_index=True)[list(MANIFEST_COLUMNS)]
+
+def archive_manifest(root, tic_ids, mission="TESS"):
+    """Products of ``tic_ids`` in a ``LocalArchive`` directory, in the order the archive lists them."""
+    archive = LocalArchive(root)
+    rows = [(str(tic), sector, author, path) for tic in tic_ids
+            for author, sector, path in archive(tic, mission=mission).rows]
+    return pd.DataFrame(rows, columns=list(MANIFEST_COLUMNS))
+
+def query_mast_products(tic_ids, mission="TESS"):
+    """
+    Light curve products of many stars from one MAST observation query and
+    one product-list query. The criteria are those ``search_lightcurve``
+    sends for a TIC (exact target name, ``project``, ``cube``/``timeseries``
+    products), restricted to ``AUTHORS``, and each star's products are
+    ordered as its search result sorts them.
+    """
+    from astropy.time import Time
+    from astroquery.mast import Observations
+    columns = list(MANIFEST_COLUMNS)
+    obs = Observations.query_criteria(target_name=[str(t) for t in tic_ids], project=[mission],
+                                      dataproduct_type=["cube", "timeseries"], provenance_name=list(AUTHORS))
+    if len(obs) == 0:
+        return pd.DataFrame(columns=columns)
+    products = Observations.get_product_list(obs)
+    products = products["obs_id", "productFilename", "dataURI"].to_pandas()
+    names = products["productFilename"].str.lower()
+    products = products[names.str.endswith("lc.fits")]
+    obs = obs["obs_id", "target_name", "project", "provenance_name", "sequence_number", "t_exptime", "t_min"].to_pandas()
+    obs["year"] = np.floor(Time(obs["t_min"].to_numpy(dtype=float), format="mjd").decimalyear).astype(int)
+    products = products.merge(obs, on="obs_id")
+    sectors = pd.to_numeric(products["sequence_number"], errors="coerce")
+    products["label"] = products["project"].astype(str) + " Sector " + sectors.fillna(0).astype(int).map("{:02d}".format)
+    # search_lightcurve's order: author priority, author, year, exposure time, mission label
+    products["priority"] = products["provenance_name"].map(AUTHOR_PRIORITY).fillna(9)
+    products = products.sort_values(["target_name", "priority", "provenance_name", "year", "t_exptime", "label",
+                                     "productFilename"], kind="stable")
+    frame = pd.DataFrame({"tic": products["target_name"], "sector": products["label"],
+                          "author": products["provenance_name"], "uri": products["dataURI"]})
+    return _normalize(frame, mission)[columns]
+
+def resolve_products(index, tic_ids, manifest=None, local_archive=None, mission="TESS", batch_size=500,
+                     retries=3, backoff=1.0):
+    """
+    Add the stars of ``tic_ids`` that are not yet in ``index``, ``batch_size``
+    at a time, from a manifest file, a local archive or MAST queries.
+    Returns the number of stars resolved.
+    """
+    tic_ids = list(dict.fromkeys(str(t) for t in tic_ids))
+    done = index.resolved(tic_ids)
+    pending = [t for t in tic_ids if t not in done]
+    if not pending:
+        return 0
+
+    # A manifest is read once for all pending stars and then split into batches
+    products = read_manifest(manifest, pending, mission) if manifest else None
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        with stage("resolve"):
+            if products is not None:
+                found = products[products["tic"].isin(batch)]
+            elif local_archive:
+                found = filter_products(archive_manifest(local_archive, batch, mission))
+            else:
+                found = filter_products(with_retries(lambda: query_mast_products(batch, mission), retries, backoff))
+            index.add(batch, found)
+        logger.info("Resolved products of %d/%d stars (%d products).", min(start + batch_size, len(pending)),
+                    len(pending), len(found))
+    return len(pending)
+
+def input_tics(chunk):
+    # The TICs of an input catalogue chunk, as the pipeline names the stars
+    tics = pd.to_numeric(chunk["TIC"], errors="coerce") if "TIC" in chunk.columns else pd.Series(dtype=float)
+    return tics[tics.notna() & (tics != 0)].astype(np.int64).astype(str).tolist()
+
+def build_product_index(input_csv, index_path, manifest=None, local_archive=None, mission="TESS", batch_size=500,
+                        retries=3, chunksize=CHUNKSIZE):
+    """Resolve the products of every TIC of ``input_csv`` into the index at ``index_path``."""
+    index = ProductIndex(index_path)
+    n = 0
+    for chunk in pd.read_csv(input_csv, chunksize=chunksize):
+        n += resolve_products(index, input_tics(chunk), manifest=manifest, local_archive=local_archive,
+                              mission=mission, batch_size=batch_size, retries=retries)
+    logger.info("Resolved %d new stars; the index at %s holds %d.", n, index_path, len(index))
+    return index
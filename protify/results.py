@@ -0,0 +1,354 @@
+import io
+import os
+import time
+import numpy as np
+import pandas as pd
+
+SECTOR_FIELDS = ("sector", "prot", "uncsec", "power", "medpower", "peakflag")
+LONG_COLUMNS = ("sector_index",) + SECTOR_FIELDS
+RAW_FORMATS = ("wide", "long")
+# Rows per chunk when scanning large CSVs
+CHUNKSIZE = 100_000
+# Star-level columns of the stitched multi-sector periodogram
+STITCHED_COLUMNS = tuple(f"stitched_{key}" for key in SECTOR_FIELDS + ("n_sectors", "baseline"))
+
+def result_dtype(label_width=32):
+    """Structured dtype of the per-sector results ``compute_rotation_metrics`` returns in compact mode."""
+    return np.dtype([("key", "i4"), ("sector", f"U{label_width}")] + [(key, "f8") for key in SECTOR_FIELDS[1:]])
+
+def sector_items(results):
+    """
+    ``(key, {field: value})`` per sector in sector order, from either a results
+    dict or a compact structured results array.
+    """
+    if not isinstance(results, np.ndarray):
+        return [(i, results[i]) for i in sorted(results.keys(), key=int)]
+    items = []
+    for record in np.sort(results, order="key"):
+        values = {key: record[key].item() for key in SECTOR_FIELDS}
+        # Whole peak flags are ints in the dict results, so they print the same
+        if np.isfinite(values["peakflag"]) and float(values["peakflag"]).is_integer():
+            values["peakflag"] = int(values["peakflag"])
+        items.append((str(record["key"]), values))
+    return items
+
+def shift_sector_keys(results, offset):
+    """The same results with every sector key moved up by ``offset``, to follow a star's earlier sectors."""
+    if isinstance(results, np.ndarray):
+        results = results.copy()
+        results["key"] += offset
+        return results
+    return {str(int(i) + offset): result for i, result in results.items()}
+
+def sector_rows(tic, results):
+    """``(tic, sector_index, sector)`` of each sector of a star's results."""
+    return [(tic, int(i), result['sector']) for i, result in sector_items(results)]
+
+def flatten_results(row, results):
+    """Legacy wide row: the star's input columns plus ``{i}_<field>`` per sector."""
+    result_row = dict(row)
+    for i, result in sector_items(results):
+        for key in SECTOR_FIELDS:
+            result_row[f"{i}_{key}"] = result.get(key, None)
+    return result_row
+
+def wide_column_order(columns):
+    base_cols = ['TIC', 'ID', 'gmag']
+    sector_cols = sorted(
+        [col for col in columns if col not in base_cols],
+        key=lambda c: (int(c.split('_')[0]) if c.split('_')[0].isdigit() else 9999, c)
+    )
+    return base_cols + [col for col in sector_cols if col not in base_cols]
+
+def write_result_row(raw_output_csv, result_row, existing_cols, file_cols):
+    # --- Sync columns and autosort ---
+    for col in existing_cols:
+        result_row.setdefault(col, None)
+    for col in result_row.keys():
+        if col not in existing_cols:
+            existing_cols.append(col)
+
+    sorted_cols = wide_column_order(existing_cols)
+    result_df = pd.DataFrame([result_row], columns=sorted_cols)
+
+    # --- Write file ---
+    # New columns (e.g. a star with more sectors) widen the header of the whole file;
+    # earlier rows are copied as text, so widening only inserts empty cells
+    if os.path.exists(raw_output_csv) and file_cols != sorted_cols:
+        with open(raw_output_csv + ".tmp", "w", newline="") as out:
+            for k, chunk in enumerate(pd.read_csv(raw_output_csv, dtype=str, keep_default_na=False,
+                                                  chunksize=CHUNKSIZE)):
+                chunk.reindex(columns=sorted_cols, fill_value="").to_csv(out, header=k == 0, index=False)
+        os.replace(raw_output_csv + ".tmp", raw_output_csv)
+
+    if os.path.exists(raw_output_csv):
+        result_df.to_csv(raw_output_csv, mode='a', header=False, index=False)
+    else:
+        result_df.to_csv(raw_output_csv, mode='w', header=True, index=False)
+
+    return sorted_cols, sorted_cols
+
+def _is_parquet(path):
+    return str(path).endswith(".parquet")
+
+def _parquet_parts(path):
+    if not os.path.isdir(path):
+        return []
+    return [os.path.join(path, name) for name in sorted(os.listdir(path))
+            if name.startswith("part-") and name.endswith(".parquet")]
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet raw results need pyarrow; install it with `pip install pyarrow` "
+                          "or use a .csv path for the long format.")
+    return pyarrow
+
+def is_long_results(path):
+    if _is_parquet(path):
+        return True
+    if not os.path.exists(path):
+        return False
+    return "sector_index" in pd.read_csv(path, nrows=0).columns
+
+class LongResultWriter:
+    """
+    Streaming writer of raw results in long format, one row per (TIC, sector).
+
+    The schema is fixed when the writer is created: ``TIC``, the remaining
+    input catalogue columns and ``LONG_COLUMNS``. Rows are buffered and
+    written every ``batch_size`` rows, so appending a star never rewrites
+    earlier output. A ``.parquet`` path is a directory that receives one part
+    file per batch (requires pyarrow); any other path is a single CSV that is
+    appended to. Stars without usable sectors get one row with an empty
+    ``sector_index`` so they are still recorded.
+    """
+    def __init__(self, path, input_columns, batch_size=1000, input_dtypes=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.star_columns = ['TIC'] + [c for c in input_columns if c != 'TIC']
+        clashes = set(self.star_columns) & set(LONG_COLUMNS)
+        if clashes:
+            raise ValueError(f"Input columns {sorted(clashes)} clash with the long results schema.")
+        self.columns = self.star_columns + list(LONG_COLUMNS)
+        self._rows = []
+        self._tics = []
+
+        if _is_parquet(path):
+            self._schema = self._parquet_schema(input_dtypes or {})
+            os.makedirs(path, exist_ok=True)
+        elif os.path.exists(path):
+            header = list(pd.read_csv(path, nrows=0).columns)
+            if header != self.columns:
+                raise ValueError(f"{path} has columns {header}, expected the long results schema {self.columns}.")
+
+    def _parquet_schema(self, input_dtypes):
+        pa = _require_pyarrow()
+        fields = [pa.field('TIC', pa.string())]
+        for col in self.star_columns[1:]:
+            dtype = input_dtypes.get(col)
+            if dtype is not None and pd.api.types.is_bool_dtype(dtype):
+                fields.append(pa.field(col, pa.bool_()))
+            elif dtype is not None and pd.api.types.is_integer_dtype(dtype):
+                fields.append(pa.field(col, pa.int64()))
+            elif dtype is not None and pd.api.types.is_float_dtype(dtype):
+                fields.append(pa.field(col, pa.float64()))
+            else:
+                fields.append(pa.field(col, pa.string()))
+        fields.append(pa.field('sector_index', pa.int64()))
+        fields.append(pa.field('sector', pa.string()))
+        fields.extend(pa.field(key, pa.float64()) for key in SECTOR_FIELDS[1:])
+        return pa.schema(fields)
+
+    def write_star(self, row, results):
+        """Buffer one star; returns the TICs written to disk if this filled a batch."""
+        self._tics.append(row.get('TIC'))
+        star = {col: row.get(col) for col in self.star_columns}
+        items = sector_items(results)
+        if not items:
+            self._rows.append(dict(star, sector_index=None))
+        for i, result in items:
+            record = dict(star, sector_index=int(i))
+            for key in SECTOR_FIELDS:
+                record[key] = result.get(key, None)
+            self._rows.append(record)
+        if len(self._rows) >= self.batch_size:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Write the buffered rows and return the TICs they belong to."""
+        if not self._rows:
+            return []
+        batch = pd.DataFrame(self._rows, columns=self.columns)
+        batch['TIC'] = batch['TIC'].astype(str)
+        batch['sector'] = batch['sector'].map(lambda s: None if s is None or pd.isnull(s) else str(s))
+
+        if _is_parquet(self.path):
+            pa = _require_pyarrow()
+            batch['sector_index'] = batch['sector_index'].astype("Int64")
+            for col in self._schema.names:
+                if pa.types.is_string(self._schema.field(col).type):
+                    batch[col] = batch[col].map(lambda v: None if v is None or pd.isnull(v) else str(v))
+            table = pa.Table.from_pandas(batch, schema=self._schema, preserve_index=False)
+            # Parts are named by write time so reading them in name order keeps the write order
+            name = f"part-{time.time_ns():020d}-{os.getpid()}.parquet"
+            tmp = os.path.join(self.path, "." + name + ".tmp")
+            pa.parquet.write_table(table, tmp)
+            os.replace(tmp, os.path.join(self.path, name))
+        else:
+            batch.to_csv(self.path, mode='a', header=not os.path.exists(self.path), index=False)
+        flushed, self._rows, self._tics = self._tics, [], []
+        return flushed
+
+    def close(self):
+        return self.flush()
+
+def read_long_results(path, columns=None):
+    if _is_parquet(path):
+        _require_pyarrow()
+        parts = _parquet_parts(path)
+        if not parts:
+            return pd.DataFrame(columns=columns)
+        return pd.concat([pd.read_parquet(p, columns=columns) for p in parts], ignore_index=True)
+    return pd.read_csv(path, usecols=columns, float_precision="round_trip")
+
+class ResumeIndex:
+    """
+    Set of processed TIC IDs kept as a sorted int64 array, about 8 bytes per
+    star, plus a small set of the IDs added since the last ``consolidate``.
+    """
+    def __init__(self, tics=()):
+        self.tics = np.unique(np.asarray(tics, dtype=np.int64))
+        self.added = set()
+
+    def __contains__(self, tic):
+        tic = int(tic)
+        i = np.searchsorted(self.tics, tic)
+        return (i < len(self.tics) and self.tics[i] == tic) or tic in self.added
+
+    def isin(self, tics):
+        """Vectorized membership test for an int64 array of IDs."""
+        tics = np.asarray(tics, dtype=np.int64)
+        i = np.minimum(np.searchsorted(self.tics, tics), max(len(self.tics) - 1, 0))
+        found = self.tics[i] == tics if len(self.tics) else np.zeros(len(tics), dtype=bool)
+        return found | np.isin(tics, list(self.added))
+
+    def add(self, tic):
+        self.added.add(int(tic))
+
+    def consolidate(self):
+        """Merge the added IDs into the sorted array, e.g. once per input chunk."""
+        if self.added:
+            self.tics = np.union1d(self.tics, np.fromiter(self.added, dtype=np.int64, count=len(self.added)))
+            self.added = set()
+
+    def __len__(self):
+        return len(self.tics) + len(self.added)
+
+def read_done_ids(path):
+    """Resume index of the TIC IDs already present in a raw results file of either format."""
+    if _is_parquet(path):
+        parts = _parquet_parts(path)
+        if parts:
+            _require_pyarrow()
+        chunks = (pd.read_parquet(part, columns=['TIC'])['TIC'] for part in parts)
+    elif os.path.exists(path):
+        chunks = (chunk['TIC'] for chunk in pd.read_csv(path, usecols=['TIC'], chunksize=CHUNKSIZE))
+    else:
+        chunks = ()
+    # Only each chunk's unique IDs are kept while reading
+    tics = [np.unique(pd.to_numeric(c, errors='coerce').dropna().to_numpy(dtype=np.int64)) for c in chunks]
+    return ResumeIndex(np.concatenate(tics) if tics else [])
+
+def long_to_wide(long_df):
+    """
+    Pivot long raw results to the legacy wide layout, one row per star in
+    order of first appearance. A star written more than once keeps its latest
+    results for each sector.
+    """
+    star_cols = [c for c in long_df.columns if c not in LONG_COLUMNS]
+    stars = long_df.drop_duplicates('TIC', keep='last')[star_cols]
+    stars = stars.set_index('TIC').reindex(pd.unique(long_df['TIC'])).reset_index()
+
+    sectors = long_df[long_df['sector_index'].notna()].drop_duplicates(['TIC', 'sector_index'], keep='last')
+    wide = sectors.pivot(index='TIC', columns='sector_index', values=list(SECTOR_FIELDS))
+    # Pivoting the string sector labels with the numeric fields leaves object columns
+    wide = wide.astype({col: float for col in wide.columns if col[0] != 'sector'})
+    wide.columns = [f"{int(i)}_{key}" for key, i in wide.columns]
+
+    wide = stars.merge(wide, left_on='TIC', right_index=True, how='left')
+    return wide.reindex(columns=wide_column_order(list(wide.columns)))
+
+def _wide_sector_columns(columns):
+    return [c for c in columns if c.endswith("_sector") and c.split("_")[0].isdigit()]
+
+def read_raw_results(path, tics=None):
+    """
+    Raw results in the legacy wide layout, whichever format they were written
+    in; only the stars of ``tics`` if given.
+    """
+    if tics is None:
+        if is_long_results(path):
+            return long_to_wide(read_long_results(path))
+        return pd.read_csv(path)
+    tics = ResumeIndex(tics)
+    keep = lambda df: df[tics.isin(pd.to_numeric(df['TIC'], errors='coerce').fillna(0).to_numpy(dtype=np.int64))]
+    if _is_parquet(path):
+        _require_pyarrow()
+        return long_to_wide(pd.concat([keep(pd.read_parquet(p)) for p in _parquet_parts(path)], ignore_index=True))
+    rows = pd.concat([keep(chunk) for chunk in pd.read_csv(path, chunksize=CHUNKSIZE)], ignore_index=True)
+    return long_to_wide(rows) if 'sector_index' in rows.columns else rows
+
+def read_sector_rows(path):
+    """``(TIC, sector_index, sector)`` of every sector in raw results of either format."""
+    if is_long_results(path):
+        rows = read_long_results(path, columns=['TIC', 'sector_index', 'sector'])
+        return rows[rows['sector_index'].notna()].astype({'sector_index': int})
+    columns = _wide_sector_columns(pd.read_csv(path, nrows=0).columns)
+    frames = []
+    for chunk in pd.read_csv(path, usecols=['TIC'] + columns, chunksize=CHUNKSIZE):
+        rows = chunk.melt(id_vars='TIC', var_name='sector_index', value_name='sector').dropna(subset=['sector'])
+        rows['sector_index'] = rows['sector_index'].str.split("_").str[0].astype(int)
+        frames.append(rows)
+    if not frames:
+        return pd.DataFrame(columns=['TIC', 'sector_index', 'sector'])
+    return pd.concat(frames, ignore_index=True)[['TIC', 'sector_index', 'sector']]
+
+def merge_wide_rows(raw_output_csv, rows):
+    """
+    Merge the new sector columns of ``rows`` (flattened result rows of stars
+    already in a wide raw CSV, keyed by TIC) into those stars' rows, in one
+    rewrite of the file. All other values are copied as they are.
+    """
+    # New values are formatted as write_result_row would append them
+    updates = pd.read_csv(io.StringIO(pd.DataFrame(list(rows.values())).to_csv(index=False)), dtype=str,
+                          keep_default_na=False).set_index('TIC')
+    header = list(pd.read_csv(raw_output_csv, nrows=0).columns)
+    columns = wide_column_order(header + [c for c in updates.columns if c not in header])
+    with open(raw_output_csv + ".tmp", "w", newline="") as out:
+        for k, chunk in enumerate(pd.read_csv(raw_output_csv, dtype=str, keep_default_na=False, chunksize=CHUNKSIZE)):
+            chunk = chunk.reindex(columns=columns, fill_value="")
+            hit = chunk['TIC'].isin(updates.index).to_numpy()
+            if hit.any():
+                new = updates.reindex(chunk.loc[hit, 'TIC'])
+                for col in updates.columns:
+                    values = new[col].to_numpy()
+                    chunk.loc[hit, col] = np.where(values != "", values, chunk.loc[hit, col].to_numpy())
+            chunk.to_csv(out, header=k == 0, index=False)
+    os.replace(raw_output_csv + ".tmp", raw_output_csv)
+    return columns
+
+def export_wide_csv(long_path, wide_csv):
+    if not is_long_results(long_path):
+        raise ValueError(f"{long_path} is not long-format raw results.")
+    wide = long_to_wide(read_long_results(long_path))
+    # The wide writer gets whole-number peakflags as ints, e.g. 1 rather than 1.0
+    for col in wide.columns:
+        if col.endswith("_peakflag"):
+            wide[col] = pd.Series([int(v) if float(v).is_integer() else v for v in wide[col]], index=wide.index,
+                                  dtype=object)
+    wide.to_csv(wide_csv, index=False)
+    return wide
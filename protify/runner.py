@@ -1,11 +1,76 @@
 import os
-import pickle
 import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
 import pandas as pd
 
-from protify.downloader import download_tess_lightcurves
+from protify.journal import RunJournal, truncate_partial_row
+from protify.downloader import LightCurveCache, LocalArchive, download_tess_lightcurves, prefetch_lightcurves
+from protify.handoff import HandoffDir, open_lightcurves
+from protify.lcstore import save_star
+from protify.log import init_worker, logging_config
+from protify.metrics import MetricsWriter, StageTimes, collect, profiled, stage
 from protify.periodogram import compute_rotation_metrics
-from protify.plotting import batch_plot_lightcurves
+from protify.plotting import batch_plot_lightcurves, init_plot_worker, log_plot_result, plot_star
+from protify.products import ProductIndex, input_tics, resolve_products
+from protify.results import (CHUNKSIZE, RAW_FORMATS, STITCHED_COLUMNS, LongResultWriter, ResumeIndex, flatten_results,
+                             merge_wide_rows, read_done_ids, read_sector_rows, sector_rows, shift_sector_keys,
+                             write_result_row)
+
+logger = logging.getLogger(__name__)
+
+def count_rows(csv_path):
+    # Data rows of a CSV without parsing it (newlines after the header line)
+    lines, last = 0, b"\n"
+    with open(csv_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return max(0, lines - 1 + (last != b"\n"))
+
+def process_star(star_id, row, save_lc_pickle=False, pickle_dir='lightcurves', metric_kwds=None,
+                 download_kwds=None, lightcurves=None, profile_dir=None, known_sectors=None):
+    """
+    Download and analyse one star. With ``known_sectors`` (``{sector:
+    sector_index}`` of results already on disk) only the other sectors are
+    analysed, numbered after the known ones; the results are None if there
+    are no new sectors.
+    """
+    start = time.time()
+
+    profile_file = os.path.join(profile_dir, f"TIC{star_id}.prof") if profile_dir else None
+    with collect() as times, profiled(profile_file):
+        if lightcurves is None:
+            lcs, sectors = download_tess_lightcurves(star_id, skip_sectors=known_sectors, **(download_kwds or {}))
+        else:
+            lcs, sectors = lightcurves
+        logger.debug("  Found %d sectors.", len(sectors))
+        if known_sectors and not sectors:
+            return dict(row, TIC=star_id), None, round(time.time() - start, 2), 0, times
+        metrics = compute_rotation_metrics(lcs, sectors, star_id, **(metric_kwds or {}))
+        if known_sectors:
+            metrics['Results'] = shift_sector_keys(metrics['Results'], max(known_sectors.values()) + 1)
+
+        if save_lc_pickle:
+            os.makedirs(pickle_dir, exist_ok=True)
+            with stage("save_lc"):
+                save_star(metrics, pickle_dir)
+
+    row = dict(row)
+    row['TIC'] = star_id
+    if metrics.get('Stitched'):
+        row.update({f"stitched_{key}": value for key, value in metrics['Stitched'].items()})
+
+    return row, metrics['Results'], round(time.time() - start, 2), len(sectors), times
+
+def process_handoff(star_id, row, handed, sectors, save_lc_pickle=False, pickle_dir='lightcurves', metric_kwds=None,
+                    profile_dir=None, known_sectors=None):
+    # Analysis side of a handoff run: the star arrives as buffers written by the downloading process
+    return process_star(star_id, row, save_lc_pickle, pickle_dir, metric_kwds,
+                        lightcurves=(open_lightcurves(handed), sectors), profile_dir=profile_dir,
+                        known_sectors=known_sectors)
 
 def run_period_pipeline(
     input_csv,
@@ -14,89 +79,331 @@ def run_period_pipeline(
     pickle_dir='lightcurves',
     save_plots=False,
     plot_dir='plots',
-    failure_log="failures.csv"
+    plot_workers=1,
+    failure_log="failures.csv",
+    gls_backend="pyastronomy",
+    fft_oversampling=10,
+    grid="fixed",
+    grid_kwds=None,
+    unc_method="fast",
+    stitch=False,
+    stitch_kwds=None,
+    compact=False,
+    handoff=False,
+    screen=False,
+    screen_kwds=None,
+    workers=1,
+    download_threads=4,
+    prefetch=2,
+    retries=3,
+    local_archive=None,
+    product_index=None,
+    manifest=None,
+    index_batch_size=500,
+    cache_dir=None,
+    cache_max_gb=None,
+    offline=False,
+    raw_format=None,
+    input_chunksize=CHUNKSIZE,
+    journal_path=None,
+    retry_failed=False,
+    update=False,
+    metrics_file=None,
+    profile_dir=None
 ):
-    df = pd.read_csv(input_csv)
-    total = len(df)
-
-    if os.path.exists(raw_output_csv):
-        existing_df = pd.read_csv(raw_output_csv)
-        done_ids = set(existing_df['TIC'].astype(str))
-        existing_cols = list(existing_df.columns)
-        print(f"Resuming: {len(done_ids)} stars already processed.")
+    # The input catalogue is streamed in chunks; only a sample is read up front for its columns
+    sample = pd.read_csv(input_csv, nrows=1000)
+    total = count_rows(input_csv)
+
+    # Long results go to a .parquet dataset or a fixed-schema CSV; wide is the legacy layout
+    if raw_format is None:
+        raw_format = "long" if raw_output_csv.endswith(".parquet") else "wide"
+    if raw_format not in RAW_FORMATS:
+        raise ValueError(f"Unknown raw_format '{raw_format}'; expected one of {RAW_FORMATS}.")
+    if raw_format == "wide" and raw_output_csv.endswith(".parquet"):
+        raise ValueError("Parquet raw output is only available with raw_format='long'.")
+    if handoff and (workers <= 1 or prefetch <= 0):
+        raise ValueError("handoff needs workers > 1 to analyse and prefetch > 0 to download.")
+    if update and (stitch or save_lc_pickle):
+        raise ValueError("update cannot be combined with stitch or save_lc_pickle; both need every sector of a star.")
+
+    # The journal, not the raw output, is the record of which stars are done
+    journal = RunJournal(journal_path or raw_output_csv.rstrip("/") + ".journal")
+    single_csv = not raw_output_csv.endswith(".parquet")
+    if len(journal) == 0 and os.path.exists(raw_output_csv):
+        # Output written without a journal: drop any half-written last row and record what is there
+        raw_size = truncate_partial_row(raw_output_csv) if single_csv else None
+        journal.mark(read_done_ids(raw_output_csv).tics, "written", raw_size=raw_size)
+    elif len(journal) and not os.path.exists(raw_output_csv):
+        logger.warning("Journal %s has no raw output at %s; starting afresh.", journal.path, raw_output_csv)
+        journal.reset()
+    elif single_csv and os.path.exists(raw_output_csv):
+        # Rows appended after the last committed write belong to stars that are not done
+        truncate_partial_row(raw_output_csv, journal.raw_size)
+
+    done_ids = journal.done_ids()
+    if len(journal):
+        logger.info("Resuming: %d stars already processed. Journal: %s", len(done_ids), journal.counts())
+    if update and len(done_ids) and not journal.has_sectors():
+        # Journals from before sectors were recorded learn them from the raw output once
+        journal.record_sectors(read_sector_rows(raw_output_csv).itertuples(index=False, name=None))
+    # Stars this run has taken up, and the revisited ones in flight with the sectors they already have
+    seen, revisits = ResumeIndex(), {}
+    retry_ids = ResumeIndex(journal.tics("failed")) if retry_failed else None
+    if retry_failed:
+        logger.info("Retrying %d failed stars.", len(retry_ids))
+
+    writer = None
+    if raw_format == "long":
+        columns, dtypes = list(sample.columns), dict(sample.dtypes)
+        if stitch:
+            columns += list(STITCHED_COLUMNS)
+            dtypes.update({col: float for col in STITCHED_COLUMNS if col != 'stitched_sector'})
+        writer = LongResultWriter(raw_output_csv, columns, input_dtypes=dtypes)
+        existing_cols = []
+    elif os.path.exists(raw_output_csv):
+        existing_cols = list(pd.read_csv(raw_output_csv, nrows=0).columns)
     else:
-        done_ids = set()
-        existing_df = pd.DataFrame()
         existing_cols = []
+    file_cols = list(existing_cols)
 
-    failed = []
+    n_failed = 0
+    metrics = MetricsWriter(metrics_file, input=input_csv, raw=raw_output_csv, backend=gls_backend,
+                            workers=workers) if metrics_file else None
+    metric_kwds = dict(backend=gls_backend, fft_oversampling=fft_oversampling, grid=grid, grid_kwds=grid_kwds,
+                       unc_method=unc_method, stitch=stitch, stitch_kwds=stitch_kwds, screen=screen,
+                       screen_kwds=screen_kwds)
+    if compact:
+        # Light curves and periodograms are only needed for the light curve store
+        metric_kwds.update(compact=True, periodograms="full" if save_lc_pickle else "none",
+                           keep_lightcurves=save_lc_pickle)
+    download_kwds = dict(max_workers=download_threads, retries=retries, offline=offline)
+    if cache_dir:
+        max_bytes = None if cache_max_gb is None else int(cache_max_gb * 1e9)
+        download_kwds['cache'] = LightCurveCache(cache_dir, max_bytes=max_bytes)
+    if local_archive:
+        download_kwds['search_func'] = LocalArchive(local_archive)
+    # Products are resolved in bulk per input chunk; downloads then look them up instead of searching
+    products = None
+    if product_index:
+        products = ProductIndex(product_index, fallback=download_kwds.get('search_func'))
+        download_kwds['search_func'] = products
 
-    for index, row in df.iterrows():
-        star_id = str(int(row.get('TIC')) or int(row.get('ID')))
-        if pd.isnull(star_id) or star_id in done_ids:
-            continue
+    # Plots are rendered in background processes as stars are saved, off the analysis path
+    plot_pool, plot_futures = None, []
+    if save_lc_pickle and save_plots and plot_workers > 0:
+        os.makedirs(plot_dir, exist_ok=True)
+        plot_pool = ProcessPoolExecutor(max_workers=plot_workers, initializer=init_plot_worker)
 
-        print(f"\n🔄 Processing {index + 1}/{total}: TIC {star_id}")
+    def pending_stars():
+        for chunk in pd.read_csv(input_csv, chunksize=input_chunksize):
+            seen.consolidate()
+            # Drop already processed stars in one lookup before iterating rows
+            if 'TIC' in chunk.columns and len(done_ids) and not update:
+                tics = pd.to_numeric(chunk['TIC'], errors='coerce')
+                known = tics.notna() & (tics != 0)
+                known[known] = done_ids.isin(tics[known].to_numpy(dtype=np.int64))
+                chunk = chunk[~known]
+            if retry_ids is not None:
+                tics = pd.to_numeric(chunk['TIC'], errors='coerce').fillna(0).to_numpy(dtype=np.int64)
+                chunk = chunk[retry_ids.isin(tics)]
+            if products is not None and not offline:
+                resolve_products(products, input_tics(chunk), manifest=manifest, local_archive=local_archive,
+                                 batch_size=index_batch_size, retries=retries)
+            for index, row in chunk.iterrows():
+                star_id = str(int(row.get('TIC')) or int(row.get('ID')))
+                if pd.isnull(star_id) or star_id in seen or (star_id in done_ids and not update):
+                    continue
+                seen.add(star_id)
+                if star_id in done_ids:
+                    # Stays written in the journal; its new sectors count once they are merged
+                    revisits[star_id] = journal.sectors(star_id)
+                else:
+                    journal.mark(star_id, "queued")
+                yield index, star_id, row.to_dict()
 
-        try:
-            start = time.time()
-
-            lcs, sectors = download_tess_lightcurves(star_id)
-            print(f"  Found {len(sectors)} sectors.")
-            metrics = compute_rotation_metrics(lcs, sectors, star_id)
-
-            if save_lc_pickle:
-                os.makedirs(pickle_dir, exist_ok=True)
-                with open(os.path.join(pickle_dir, f"TIC{star_id}.pkl"), "wb") as f:
-                    pickle.dump(metrics, f)
-
-            # Flatten sector-wise results
-            flat_results = {}
-            for i in sorted(metrics['Results'].keys(), key=int):
-                sector_data = metrics['Results'][i]
-                for key in ['sector', 'prot', 'uncsec', 'power', 'medpower', 'peakflag']:
-                    colname = f"{i}_{key}"
-                    flat_results[colname] = sector_data.get(key, None)
-
-            result_row = {col: row[col] for col in row.index}
-            result_row['TIC'] = star_id
-            result_row.update(flat_results)
-
-            # --- Sync columns and autosort ---
-            for col in existing_cols:
-                result_row.setdefault(col, None)
-            for col in result_row.keys():
-                if col not in existing_cols:
-                    existing_cols.append(col)
-
-            base_cols = ['TIC', 'ID', 'gmag']
-            sector_cols = sorted(
-                [col for col in existing_cols if col not in base_cols],
-                key=lambda c: (int(c.split('_')[0]) if c[0].isdigit() else 9999, c)
-            )
-            sorted_cols = base_cols + [col for col in sector_cols if col not in base_cols]
+    unflushed_sectors, wide_updates = {}, {}
 
-            result_df = pd.DataFrame([result_row], columns=sorted_cols)
-            existing_cols = sorted_cols  # keep updating column order
+    def flush(tics):
+        if tics:
+            sectors = [r for tic in tics for r in unflushed_sectors.pop(str(tic), [])]
+            journal.mark(tics, "written", raw_size=os.path.getsize(raw_output_csv) if single_csv else None,
+                         sectors=sectors)
 
-            # --- Write file ---
-            if os.path.exists(raw_output_csv):
-                result_df.to_csv(raw_output_csv, mode='a', header=False, index=False)
-            else:
-                result_df.to_csv(raw_output_csv, mode='w', header=True, index=False)
+    # Only this process writes to raw_output_csv and failure_log; workers return rows
+    def record(star_id, outcome, times=None):
+        nonlocal existing_cols, file_cols, n_failed
+        # Stages timed outside process_star, e.g. prefetched downloads
+        times = times or StageTimes()
+        try:
+            row, results, duration, n_sectors, star_times = outcome()
+            times.merge(star_times)
+            if results is None:
+                logger.info("  No new sectors for TIC %s", star_id, extra={"tic": star_id})
+                if metrics:
+                    metrics.star(star_id, "unchanged", times, duration=duration)
+                return
+            if star_id not in revisits:
+                journal.mark(star_id, "analysed")
+            with collect(times), stage("write"):
+                if writer is not None:
+                    # Buffered stars count as written once their batch is on disk
+                    unflushed_sectors[star_id] = sector_rows(star_id, results)
+                    flush(writer.write_star(row, results))
+                elif star_id in revisits:
+                    # New sectors of stars already in the wide file are merged in one rewrite at the end
+                    wide_updates[star_id] = flatten_results(row, results)
+                    unflushed_sectors[star_id] = sector_rows(star_id, results)
+                else:
+                    result_row = flatten_results(row, results)
+                    if any(col not in existing_cols for col in result_row):
+                        # Widening rewrites the file, so the committed size no longer marks a row boundary
+                        journal.raw_size = None
+                    existing_cols, file_cols = write_result_row(raw_output_csv, result_row, existing_cols, file_cols)
+                    journal.mark(star_id, "written", raw_size=os.path.getsize(raw_output_csv),
+                                 sectors=sector_rows(star_id, results))
+            if metrics:
+                metrics.star(star_id, "ok", times, duration=duration, n_sectors=n_sectors)
 
-            print(f"  ✅ Saved TIC {star_id} to {raw_output_csv}")
+            logger.info("  ✅ Saved TIC %s to %s", star_id, raw_output_csv,
+                        extra={"tic": star_id, "duration": duration, "n_sectors": n_sectors})
 
-            duration = round(time.time() - start, 2)
-            if len(sectors) > 0:
-                print(f"  Done in {duration}s (~{duration/len(sectors):.2f} s/sector)")
+            if n_sectors > 0:
+                logger.debug("  Done in %ss (~%.2f s/sector)", duration, duration / n_sectors)
             else:
-                print(f"  Done in {duration}s.")
+                logger.debug("  Done in %ss.", duration)
+
+            if plot_pool is not None:
+                plot_futures.append(plot_pool.submit(plot_star, pickle_dir, f"TIC{star_id}", plot_dir))
 
         except Exception as e:
-            print(f"❌ Failed on TIC {star_id}: {e}")
-            failed.append({"TIC": star_id, "error": str(e)})
-            pd.DataFrame(failed).to_csv(failure_log, index=False)
+            logger.error("❌ Failed on TIC %s: %s", star_id, e, extra={"tic": star_id})
+            # The log is started afresh by this run's first failure and appended to after that
+            pd.DataFrame([{"TIC": star_id, "error": str(e)}]).to_csv(
+                failure_log, mode='a' if n_failed else 'w', header=not n_failed, index=False
+            )
+            n_failed += 1
+            if star_id not in revisits:
+                journal.mark(star_id, "failed", error=str(e))
+            if metrics:
+                metrics.star(star_id, "failed", times, error=str(e))
+        finally:
+            revisits.pop(star_id, None)
+
+    try:
+        if workers <= 1 and prefetch > 0:
+            # Next stars download in background threads while this one is analysed
+            queued = deque()
+
+            def queued_ids():
+                for item in pending_stars():
+                    queued.append(item)
+                    yield item[1]
+
+            for star_id, lcs, sectors, error, times in prefetch_lightcurves(queued_ids(), prefetch=prefetch,
+                                                                            skip_sectors=revisits, **download_kwds):
+                index, star_id, row = queued.popleft()
+                logger.info("🔄 Processing %d/%d: TIC %s", index + 1, total, star_id)
+                if error is None and star_id not in revisits:
+                    journal.mark(star_id, "downloaded")
+
+                def outcome():
+                    if error is not None:
+                        raise error
+                    return process_star(star_id, row, save_lc_pickle, pickle_dir, metric_kwds,
+                                        lightcurves=(lcs, sectors), profile_dir=profile_dir,
+                                        known_sectors=revisits.get(star_id))
+                record(star_id, outcome, times)
+        elif handoff:
+            logger.info("Downloading in this process and analysing with %d worker processes.", workers)
+            queued, running = deque(), {}
+            buffers = HandoffDir()
+
+            def queued_ids():
+                for item in pending_stars():
+                    queued.append(item)
+                    yield item[1]
+
+            def finish(futures):
+                for future in futures:
+                    star_id, handed, times = running.pop(future)
+                    record(star_id, future.result, times)
+                    buffers.release(handed)
+
+            try:
+                with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                         initargs=(logging_config(),)) as pool:
+                    for star_id, lcs, sectors, error, times in prefetch_lightcurves(
+                            queued_ids(), prefetch=prefetch, skip_sectors=revisits, **download_kwds):
+                        index, star_id, row = queued.popleft()
+                        if error is not None:
+                            def outcome(error=error):
+                                raise error
+                            record(star_id, outcome, times)
+                            continue
+                        if star_id not in revisits:
+                            journal.mark(star_id, "downloaded")
+                        with collect(times), stage("handoff"):
+                            handed = buffers.put(star_id, lcs)
+                        del lcs
+                        logger.info("🔄 Queued %d/%d: TIC %s", index + 1, total, star_id)
+                        future = pool.submit(process_handoff, star_id, row, handed, sectors, save_lc_pickle, pickle_dir,
+                                             metric_kwds, profile_dir=profile_dir, known_sectors=revisits.get(star_id))
+                        running[future] = (star_id, handed, times)
+                        # Analysis backlog is bounded like the worker path; downloads stay prefetch stars ahead
+                        if len(running) >= 2 * workers:
+                            finish(wait(running, return_when=FIRST_COMPLETED)[0])
+                        finish([f for f in list(running) if f.done()])
+                    while running:
+                        finish(wait(running, return_when=FIRST_COMPLETED)[0])
+            finally:
+                buffers.close()
+        elif workers <= 1:
+            for index, star_id, row in pending_stars():
+                logger.info("🔄 Processing %d/%d: TIC %s", index + 1, total, star_id)
+                record(star_id, lambda: process_star(star_id, row, save_lc_pickle, pickle_dir, metric_kwds, download_kwds,
+                                                     profile_dir=profile_dir, known_sectors=revisits.get(star_id)))
+        else:
+            logger.info("Processing with %d worker processes.", workers)
+            stars = pending_stars()
+            running = {}
+            # Workers log with the same verbosity and format as this process
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(logging_config(),)) as pool:
+                while True:
+                    # Keep a bounded number of stars in flight so large catalogues are not queued at once
+                    for index, star_id, row in stars:
+                        logger.info("🔄 Queued %d/%d: TIC %s", index + 1, total, star_id)
+                        future = pool.submit(
+                            process_star, star_id, row, save_lc_pickle, pickle_dir, metric_kwds, download_kwds,
+                            profile_dir=profile_dir, known_sectors=revisits.get(star_id)
+                        )
+                        running[future] = star_id
+                        if len(running) >= 2 * workers:
+                            break
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record(running.pop(future), future.result)
+    finally:
+        # Buffered long-format rows are written even if the run is interrupted
+        if writer is not None:
+            flush(writer.close())
+        if wide_updates:
+            logger.info("Merging new sectors of %d stars into %s", len(wide_updates), raw_output_csv)
+            merge_wide_rows(raw_output_csv, wide_updates)
+            flush(list(wide_updates))
+        journal.close()
+        if metrics:
+            metrics.close()
+            logger.info("Saved run metrics to %s", metrics_file)
+        if plot_pool is not None:
+            logger.info("Waiting for %d plots...", sum(not f.done() for f in plot_futures))
+            plot_pool.shutdown(wait=True)
 
-    if save_lc_pickle and save_plots:
+    if plot_pool is not None:
+        for future in plot_futures:
+            log_plot_result(*future.result())
+    elif save_lc_pickle and save_plots:
         batch_plot_lightcurves(pickle_dir=pickle_dir, save_dir=plot_dir)
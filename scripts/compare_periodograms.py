@@ -0,0 +1,67 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+from protify.downloader import LocalArchive, download_tess_lightcurves
+from protify.periodogram import GLS, load_sector_arrays, unc_fit
+
+parser = argparse.ArgumentParser(description="Accuracy report of the fast GLS backend against the exact GLS")
+parser.add_argument("--input", default="examples/sample_input.csv", help="Input CSV with TIC IDs")
+parser.add_argument("--reference", default="pyastronomy", choices=["pyastronomy", "numpy"], help="Exact GLS backend")
+parser.add_argument("--local-archive", default=None, help="Read light curves from a local archive instead of MAST")
+parser.add_argument("--oversampling", type=int, nargs="+", default=[5, 10, 20], help="FFT oversampling factors to test")
+parser.add_argument("--output", default=None, help="Optional CSV for the per-sector report")
+
+args = parser.parse_args()
+search_func = LocalArchive(args.local_archive) if args.local_archive else None
+
+rows = []
+for tic in pd.read_csv(args.input)["TIC"]:
+    lcs, sectors = download_tess_lightcurves(str(int(tic)), search_func=search_func)
+    for sector, lc in zip(sectors, lcs):
+        t, f, e = load_sector_arrays(lc)
+        if len(t) < 10:
+            continue
+
+        start = time.time()
+        ref = GLS(t, f, e, backend=args.reference)
+        ref_time = time.time() - start
+        ref_unc = unc_fit(ref[0], ref[2], ref[3])[2]
+
+        for ov in args.oversampling:
+            start = time.time()
+            fast = GLS(t, f, e, backend="fast", fft_oversampling=ov)
+            fast_time = time.time() - start
+
+            rows.append({
+                "TIC": tic,
+                "sector": sector,
+                "npts": len(t),
+                "oversampling": ov,
+                "max_rel_power_err": np.max(np.abs(fast[2] - ref[2])) / np.max(ref[2]),
+                "prot_ref": ref[3],
+                "prot_fast": fast[3],
+                "snr_ref": ref[6] / ref[7],
+                "snr_fast": fast[6] / fast[7],
+                "peakflag_match": ref[8] == fast[8],
+                "unc_ref": ref_unc,
+                "unc_fast": unc_fit(fast[0], fast[2], fast[3])[2],
+                "speedup": ref_time / fast_time,
+            })
+
+report = pd.DataFrame(rows)
+pd.set_option("display.width", 200)
+print(report.to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+
+print("\nSummary per oversampling factor:")
+print(report.groupby("oversampling").agg(
+    max_rel_power_err=("max_rel_power_err", "max"),
+    prot_mismatches=("prot_ref", lambda s: int(np.sum(~np.isclose(s, report.loc[s.index, "prot_fast"])))),
+    peakflag_mismatches=("peakflag_match", lambda s: int(np.sum(~s))),
+    median_speedup=("speedup", "median"),
+).to_string())
+
+if args.output:
+    report.to_csv(args.output, index=False)
+    print(f"Saved report to {args.output}")
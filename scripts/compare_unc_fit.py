@@ -0,0 +1,68 @@
+import argparse
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+from protify.downloader import LocalArchive, download_tess_lightcurves
+from protify.periodogram import GLS, load_sector_arrays, unc_fit_batch
+
+parser = argparse.ArgumentParser(description="Tolerance report of the vectorized unc_fit against astropy's LevMarLSQFitter")
+parser.add_argument("--input", default="examples/sample_input.csv", help="Input CSV with TIC IDs")
+parser.add_argument("--backend", default="pyastronomy", choices=["pyastronomy", "numpy", "fast"], help="GLS backend")
+parser.add_argument("--local-archive", default=None, help="Read light curves from a local archive instead of MAST")
+parser.add_argument("--rtol", type=float, default=1e-4, help="Relative tolerance counted as agreement")
+parser.add_argument("--output", default=None, help="Optional CSV for the per-sector report")
+
+args = parser.parse_args()
+search_func = LocalArchive(args.local_archive) if args.local_archive else None
+
+keys, freqs, pgramys, prots = [], [], [], []
+for tic in pd.read_csv(args.input)["TIC"]:
+    lcs, sectors = download_tess_lightcurves(str(int(tic)), search_func=search_func)
+    for sector, lc in zip(sectors, lcs):
+        t, f, e = load_sector_arrays(lc)
+        if len(t) < 10:
+            continue
+        freq, _, pgramy, prot = GLS(t, f, e, backend=args.backend)[:4]
+        keys.append((tic, sector))
+        freqs.append(freq)
+        pgramys.append(pgramy)
+        prots.append(prot)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    start = time.time()
+    ref = unc_fit_batch(freqs, pgramys, prots, method="astropy")
+    ref_time = time.time() - start
+
+start = time.time()
+fast = unc_fit_batch(freqs, pgramys, prots, method="fast")
+fast_time = time.time() - start
+
+report = pd.DataFrame({
+    "TIC": [k[0] for k in keys],
+    "sector": [k[1] for k in keys],
+    "prot": prots,
+    "unc_astropy": ref[0],
+    "unc_fast": fast[0],
+    "stddev_astropy": ref[2],
+    "stddev_fast": fast[2],
+})
+report["rel_unc_err"] = np.abs(report["unc_fast"] - report["unc_astropy"]) / np.abs(report["unc_astropy"])
+# LevMarLSQFitter can collapse the width to its lower bound, which reports an uncertainty of zero
+report["astropy_collapsed"] = np.abs(report["stddev_astropy"]) < 1e-30
+
+pd.set_option("display.width", 200)
+print(report.to_string(index=False, float_format=lambda x: f"{x:.4g}"))
+
+converged = ~report["astropy_collapsed"] & report["unc_astropy"].notna()
+print(f"\nSectors: {len(report)}")
+print(f"astropy fit collapsed or failed: {int((~converged).sum())}")
+print(f"Max relative unc error where astropy converged: {report.loc[converged, 'rel_unc_err'].max():.3g}")
+print(f"Within rtol={args.rtol:g}: {int((report.loc[converged, 'rel_unc_err'] <= args.rtol).sum())}/{int(converged.sum())}")
+print(f"Time: astropy {ref_time:.3f}s, vectorized {fast_time:.3f}s ({ref_time / max(fast_time, 1e-9):.1f}x)")
+
+if args.output:
+    report.to_csv(args.output, index=False)
+    print(f"Saved report to {args.output}")
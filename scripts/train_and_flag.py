@@ -1,4 +1,5 @@
 import argparse
+from protify.log import setup_logging
 import pandas as pd
 from protify.classifier import run_classifier, generate_summary_from_raw
 
@@ -10,6 +11,7 @@ parser.add_argument("--train", default="protify/data/RotatorTrainingSet.csv", he
 parser.add_argument("--no_autoval", action="store_true", help="Disable filtering to AutoVal? == 1")
 
 args = parser.parse_args()
+setup_logging()
 
 # Step 1: Generate the summary CSV from raw output
 generate_summary_from_raw(
@@ -14,6 +14,10 @@ setup(
         'astropy',
         'PyAstronomy'
     ],
+    extras_require={
+        'parquet': ['pyarrow'],
+        'plots': ['pypdf'],
+    },
     author='Rayna Rampalli',
     description='Protify: Rotation period detection and vetting using TESS light curves.',
     include_package_data=True,
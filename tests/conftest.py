@@ -0,0 +1,21 @@
+import os
+
+import lightkurve as lk
+import numpy as np
+import pytest
+
+
+def _write_sector(root, tic, sector, rng):
+    # A synthetic SPOC sector of a star rotating in 2-11 days, laid out as a --local-archive
+    t = np.sort(rng.uniform(1400 + 27 * sector, 1427 + 27 * sector, 1300))
+    flux = 1 + 0.01 * np.sin(2 * np.pi * t / (2 + tic % 10)) + rng.normal(0, 0.003, len(t))
+    lc = lk.LightCurve(time=t, flux=flux, flux_err=np.full(len(t), 0.003))
+    path = os.path.join(root, f"TIC{tic}", f"SPOC_sector{sector:02d}.fits")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    lc.to_fits(path, overwrite=True, TELESCOP="TESS", MISSION="TESS", SECTOR=sector,
+               OBJECT=f"TIC {tic}", TICID=tic)
+
+
+@pytest.fixture
+def write_sector():
+    return _write_sector
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import subprocess
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter: time the subcommand from `import protify.cli` and list the top-level modules it loaded
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+from protify.cli import main
+sys.argv = ["protify"] + sys.argv[1:]
+try:
+    main()
+except SystemExit:
+    pass
+modules = {m.split(".")[0] for m in sys.modules} | {m for m in sys.modules if m.startswith("protify.")}
+print(json.dumps({"seconds": time.perf_counter() - start, "modules": sorted(modules)}))
+"""
+
+HEAVY = ["lightkurve", "astropy", "matplotlib", "sklearn", "scipy", "PyAstronomy"]
+
+# (subcommand arguments, modules it must not import); paths are relative to the work directory
+CHECKS = [
+    (["--help"], HEAVY + ["pandas"]),
+    (["summarize", "-q", "--raw", "raw.csv", "--summary", "summary.csv"], HEAVY),
+    (["export-wide", "-q", "--raw", "long.csv", "--output", "wide.csv"], HEAVY),
+    (["train", "-q", "--train", os.path.join(ROOT, "protify", "data", "RotatorTrainingSet.csv"),
+      "--model", "train.joblib", "--n-estimators", "10"], ["lightkurve", "astropy", "matplotlib", "PyAstronomy"]),
+    (["classify", "-q", "--raw", "raw.csv", "--summary", "summary.csv", "--model", "model.joblib",
+      "--output", "out.csv"], ["lightkurve", "astropy", "matplotlib", "PyAstronomy"]),
+    # lightkurve imports scikit-learn itself (lightkurve.correctors), so run is checked for protify's classifier
+    (["run", "-q", "--input", "input.csv", "--raw", "run_raw.csv", "--local-archive", "archive", "--prefetch", "0"],
+     ["protify.classifier"]),
+]
+
+
+def probe(argv, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", PROBE] + argv, capture_output=True, text=True, cwd=cwd, env=env)
+    lines = result.stdout.strip().splitlines()
+    assert lines, f"{argv[0]} did not run:\n{result.stderr}"
+    return json.loads(lines[-1])
+
+
+@pytest.fixture(scope="module")
+def work(tmp_path_factory):
+    work = tmp_path_factory.mktemp("imports")
+    pd.DataFrame({"TIC": [1, 2], "gmag": [12., 13.], "0_sector": ["TESS Sector 01"] * 2, "0_prot": [3.1, 5.2],
+                  "0_uncsec": [0.1, 0.2], "0_power": [0.6, 0.5], "0_medpower": [0.01, 0.01], "0_peakflag": [1, 1],
+                  "1_sector": ["TESS Sector 02"] * 2, "1_prot": [3.0, 5.3], "1_uncsec": [0.1, 0.2],
+                  "1_power": [0.6, 0.5], "1_medpower": [0.01, 0.01], "1_peakflag": [1, 1]}).to_csv(work / "raw.csv",
+                                                                                                   index=False)
+    pd.DataFrame({"TIC": [1, 1], "gmag": [12., 12.], "sector_index": [0, 1],
+                  "sector": ["TESS Sector 01", "TESS Sector 02"], "prot": [3.1, 3.0], "uncsec": [0.1, 0.1],
+                  "power": [0.6, 0.6], "medpower": [0.01, 0.01], "peakflag": [1, 1]}).to_csv(work / "long.csv",
+                                                                                          index=False)
+    pd.DataFrame({"TIC": [1]}).to_csv(work / "input.csv", index=False)
+    (work / "archive").mkdir()
+    # classify needs a summary and a model of its own
+    probe(["summarize", "-q", "--raw", "raw.csv", "--summary", "summary.csv"], work)
+    probe(["train", "-q", "--train", os.path.join(ROOT, "protify", "data", "RotatorTrainingSet.csv"),
+           "--model", "model.joblib", "--n-estimators", "10"], work)
+    return work
+
+
+@pytest.mark.parametrize("argv, forbidden", CHECKS, ids=[argv[0] for argv, _ in CHECKS])
+def test_subcommand_imports(work, argv, forbidden):
+    result = probe(argv, work)
+    loaded = sorted(set(forbidden) & set(result["modules"]))
+    assert not loaded, f"{argv[0]} imports {', '.join(loaded)} ({result['seconds']:.2f}s)"
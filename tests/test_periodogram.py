@@ -0,0 +1,11 @@
+import numpy as np
+import pytest
+
+from protify.periodogram import fast_gls_power
+
+
+@pytest.mark.parametrize("freq", [[], [0.1], [0.1, 0.2, 0.4]])
+def test_fast_gls_power_rejects_non_uniform_grids(freq):
+    t = np.linspace(0, 27, 200)
+    with pytest.raises(ValueError, match="uniform frequency grid"):
+        fast_gls_power(t, np.sin(t), np.ones_like(t), freq=freq)
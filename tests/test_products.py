@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+from astropy.table import Table
+
+from protify.downloader import AUTHORS
+from protify.products import build_product_index
+
+# Recorded shape of the MAST observation table for two stars: SPOC 2-minute and
+# 20-second products, TESS-SPOC and QLP HLSPs from full-frame images, and a
+# CDIPS HLSP the pipeline does not use
+OBSERVATIONS = [
+    # obs_id, target, collection, project, author, sector, exptime, t_min
+    ("tess2018206045859-s0001-0000000000000100-0120-s", "100", "TESS", "TESS", "SPOC", 1, 120., 58324.8),
+    ("tess2018234235059-s0002-0000000000000100-0121-s", "100", "TESS", "TESS", "SPOC", 2, 120., 58353.1),
+    ("tess2018234235059-s0002-0000000000000100-0121-a_fast", "100", "TESS", "TESS", "SPOC", 2, 20., 58353.1),
+    ("hlsp_qlp_tess_ffi_s0001-0000000000000100", "100", "HLSP", "TESS", "QLP", 1, 1800., 58324.8),
+    ("hlsp_qlp_tess_ffi_s0030-0000000000000100", "100", "HLSP", "TESS", "QLP", 30, 600., 59114.9),
+    ("hlsp_tess-spoc_tess_phot_0000000000000100-s0030", "100", "HLSP", "TESS", "TESS-SPOC", 30, 600., 59114.9),
+    ("hlsp_cdips_tess_ffi_gaiatwo0001-s0001-cam1-ccd1", "100", "HLSP", "TESS", "CDIPS", 1, 1800., 58324.8),
+    ("hlsp_qlp_tess_ffi_s0005-0000000000000200", "200", "HLSP", "TESS", "QLP", 5, 1800., 58437.5),
+    ("hlsp_tess-spoc_tess_phot_0000000000000200-s0005", "200", "HLSP", "TESS", "TESS-SPOC", 5, 1800., 58437.5),
+    ("hlsp_cdips_tess_ffi_gaiatwo0002-s0005-cam1-ccd1", "300", "HLSP", "TESS", "CDIPS", 5, 1800., 58437.5),
+]
+
+def recorded_observations():
+    rows = [dict(obsid=str(9000 + k), obs_id=o, target_name=t, obs_collection=c, project=p, provenance_name=a,
+                 sequence_number=s, t_exptime=e, t_min=m, dataproduct_type="timeseries")
+            for k, (o, t, c, p, a, s, e, m) in enumerate(OBSERVATIONS)]
+    return Table(rows=rows)
+
+def recorded_products(obs):
+    # A light curve and a target pixel file per observation
+    rows = []
+    for o in obs:
+        for suffix in ("lc.fits", "tp.fits"):
+            name = f"{o['obs_id']}_{suffix}"
+            rows.append(dict(obsID=o["obsid"], obs_id=o["obs_id"], productFilename=name, dataURI=f"mast:TESS/product/{name}",
+                             description="Light curves" if suffix == "lc.fits" else "Target pixel files"))
+    return Table(rows=rows)
+
+class RecordedMast:
+    def __init__(self):
+        self.table = recorded_observations()
+
+    def query_criteria(self, objectname=None, radius=None, **criteria):
+        obs = self.table
+        if objectname is not None:
+            # Cone searches find nothing beyond the exact target names
+            obs = obs[:0]
+        for column, values in criteria.items():
+            if column in obs.colnames:
+                obs = obs[np.isin(obs[column], np.atleast_1d(values))]
+        obs = obs.copy()
+        if objectname is not None:
+            obs["distance"] = np.zeros(0)
+        return obs
+
+    def get_product_list(self, observations):
+        obsids = observations["obsid"] if isinstance(observations, Table) else observations
+        return recorded_products(self.table[np.isin(self.table["obsid"], np.asarray(obsids, dtype=str))])
+
+@pytest.fixture
+def mast(monkeypatch):
+    from astroquery.mast import Observations
+    recorded = RecordedMast()
+    monkeypatch.setattr(Observations, "query_criteria", recorded.query_criteria)
+    monkeypatch.setattr(Observations, "get_product_list", recorded.get_product_list)
+    return recorded
+
+def searched_products(tic):
+    # The products the pipeline downloads from a lightkurve search
+    from lightkurve import search_lightcurve
+    search = search_lightcurve(f"TIC {tic}", mission="TESS")
+    table = search.table[np.isin(np.asarray(search.author, dtype=str), AUTHORS)]
+    return [(str(r["author"]), str(r["mission"]), str(r["dataURI"])) for r in table]
+
+def test_build_product_index_matches_search(mast, tmp_path):
+    catalogue = tmp_path / "input.csv"
+    pd.DataFrame({"TIC": [100, 200, 300]}).to_csv(catalogue, index=False)
+    index = build_product_index(str(catalogue), str(tmp_path / "products.sqlite"))
+
+    assert len(index) == 3
+    for tic in (100, 200):
+        assert index.products(tic) == searched_products(tic)
+    assert [r[0] for r in index.products(100)] == ["SPOC"] * 3 + ["TESS-SPOC", "QLP", "QLP"]
+    # Resolved without SPOC/QLP products, so it fails without a search
+    assert index.products(300) == []
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from scipy.signal import find_peaks
+
+from protify.periodogram import _local_maxima, resolve_peak, resolve_peaks
+
+
+def random_powers(rng, n, m):
+    # Few distinct levels give plateaus, including ones at the grid edges
+    powers = rng.integers(0, rng.integers(2, 8), size=(n, m)).astype(float) * rng.uniform(0.1, 1)
+    smooth = rng.random(n) < 0.3
+    powers[smooth] = rng.random((smooth.sum(), m))
+    for k in range(n):
+        draw = rng.random()
+        if draw < 0.1:
+            powers[k] = np.nan
+        elif draw < 0.2:
+            powers[k, rng.choice([0, m - 1])] = powers[k].max() + 1
+        elif draw < 0.3:
+            powers[k] = powers[k, 0]
+    return powers
+
+
+def random_grid(rng, m):
+    # Periods across the 18- and 28-day thresholds, with harmonics in the 1.7-2.3x window
+    return np.sort(1 / rng.uniform(0.2, 40, m))
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_resolve_peaks_matches_resolve_peak(seed):
+    rng = np.random.default_rng(seed)
+    m = int(rng.choice([1, 2, 3, rng.integers(4, 12), rng.integers(12, 200)]))
+    freq = random_grid(rng, m)
+    powers = random_powers(rng, int(rng.integers(1, 8)), m)
+
+    prot, f_power, medpower, lgpeakflag, ifmax, peaks = resolve_peaks(freq, powers, return_peaks=True)
+    for k, power in enumerate(powers):
+        _, _, _, prot_k, peaks_k, ifmax_k, f_power_k, medpower_k, flag_k = resolve_peak(freq, power)
+        np.testing.assert_array_equal(np.flatnonzero(peaks[k]), peaks_k)
+        assert ifmax[k] == ifmax_k
+        np.testing.assert_array_equal([prot[k], f_power[k], medpower[k], lgpeakflag[k]],
+                                      [prot_k, f_power_k, medpower_k, flag_k])
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_local_maxima_matches_find_peaks(seed):
+    rng = np.random.default_rng(seed)
+    m = int(rng.choice([1, 2, 3, rng.integers(4, 12), rng.integers(12, 200)]))
+    x = random_powers(rng, int(rng.integers(1, 8)), m)
+    mask = _local_maxima(x)
+    for k, row in enumerate(x):
+        np.testing.assert_array_equal(np.flatnonzero(mask[k]), find_peaks(row)[0])
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from protify.results import ResumeIndex, export_wide_csv, write_result_row
+from protify.runner import run_period_pipeline
+
+
+def sector(i, prot, power, peakflag):
+    return {f"{i}_sector": f"TESS Sector {i + 1:02d}", f"{i}_prot": prot, f"{i}_uncsec": None,
+            f"{i}_power": power, f"{i}_medpower": 0.00023238804394480356, f"{i}_peakflag": peakflag}
+
+
+def test_widening_keeps_earlier_rows(tmp_path):
+    raw = str(tmp_path / "raw.csv")
+    cols, file_cols = [], []
+    for row in ({"TIC": 1, "ID": "", "gmag": 12.0, **sector(0, 3.0000000000000004, 0.21463472900765056, 1)},
+                {"TIC": 2, "ID": "", "gmag": 13.5, **sector(0, float("nan"), 0.5, 0.5)}):
+        cols, file_cols = write_result_row(raw, row, cols, file_cols)
+    before = pd.read_csv(raw, dtype=str, keep_default_na=False)
+
+    write_result_row(raw, {"TIC": 3, "ID": "", "gmag": 11.0, **sector(0, 2.0, 0.3, 1), **sector(1, 2.1, 0.3, 1)},
+                     cols, file_cols)
+    after = pd.read_csv(raw, dtype=str, keep_default_na=False)
+
+    assert list(after.columns) == list(before.columns[:3]) + sorted(
+        after.columns[3:], key=lambda c: (int(c.split("_")[0]), c))
+    pd.testing.assert_frame_equal(after.loc[:1, before.columns], before)
+    assert (after.loc[:1, [c for c in after.columns if c.startswith("1_")]] == "").all(axis=None)
+    assert before.loc[0, "0_medpower"] == "0.00023238804394480356"
+    assert before.loc[0, "0_peakflag"] == "1"
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_export_wide_matches_wide_output(tmp_path, write_sector):
+    rng = np.random.default_rng(0)
+    pd.DataFrame({"TIC": [100, 101, 102], "gmag": 12.0}).to_csv(tmp_path / "input.csv", index=False)
+    # Stars with one to three sectors, so exported rows have empty trailing sectors
+    for tic in (100, 101, 102):
+        for number in range(1, tic % 3 + 2):
+            write_sector(tmp_path / "archive", tic, number, rng)
+    for raw, raw_format in (("wide.csv", "wide"), ("long.csv", "long")):
+        run_period_pipeline(str(tmp_path / "input.csv"), str(tmp_path / raw), gls_backend="fast",
+                            local_archive=str(tmp_path / "archive"), failure_log=str(tmp_path / "failures.csv"),
+                            raw_format=raw_format)
+
+    export_wide_csv(str(tmp_path / "long.csv"), str(tmp_path / "exported.csv"))
+    assert (tmp_path / "exported.csv").read_text() == (tmp_path / "wide.csv").read_text()
+
+
+def test_resume_index_consolidate():
+    index = ResumeIndex([5, 1, 3])
+    for tic in (4, 2, 9):
+        index.add(tic)
+    index.consolidate()
+    assert index.added == set()
+    assert index.tics.tolist() == [1, 2, 3, 4, 5, 9]
+    assert index.isin(np.arange(11)).tolist() == [i in (1, 2, 3, 4, 5, 9) for i in range(11)]
+    assert 4 in index and 6 not in index and len(index) == 6
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from protify.periodogram import GLS, GLS_BACKENDS, frequency_grid, screen_grid, screen_sector
+
+
+def sector(amplitude, offset=0.5, seed=1):
+    # A 27-day, 2-minute sector with a sinusoid between two samples of the default coarse grid
+    rng = np.random.default_rng(seed)
+    t = np.arange(0, 27, 2 / 1440.)
+    freq = frequency_grid(t, "adaptive", oversampling=5)
+    f0 = freq[8 * 20] + offset * (freq[8 * 21] - freq[8 * 20])
+    flux = 1 + amplitude * np.sin(2 * np.pi * f0 * t) + rng.normal(0, 0.01, len(t))
+    return t, flux, np.full(len(t), 0.01)
+
+
+def test_coarse_step_within_half_peak_width():
+    t = sector(0)[0]
+    for oversampling in (2, 5, 10, 20):
+        freq = frequency_grid(t, "adaptive", oversampling=oversampling)
+        assert np.diff(screen_grid(freq, 8, baseline=np.ptp(t)))[0] <= 0.5 / np.ptp(t)
+    assert len(screen_grid(np.arange(1, 2, 0.5), 8, baseline=27.)) == 2
+
+
+@pytest.mark.parametrize("backend", GLS_BACKENDS)
+def test_off_grid_detection_is_not_screened(backend):
+    t, flux, err = sector(0.0012)
+    full = GLS(t, flux, err, backend=backend, grid="adaptive", oversampling=5)
+    assert full[6] / full[7] >= 40
+    assert screen_sector(t, flux, err, backend=backend, grid="adaptive", oversampling=5) is None
+
+
+@pytest.mark.parametrize("backend", GLS_BACKENDS)
+def test_noise_is_screened(backend):
+    t, flux, err = sector(0)
+    assert screen_sector(t, flux, err, backend=backend, grid="adaptive", oversampling=5) is not None
+
+
+def test_screen_is_silent(capsys):
+    # A trend peaks at the lowest frequency, on which PyAstronomy warns
+    t, flux, err = sector(0)
+    screen_sector(t, flux + 0.01 * t, err, grid="adaptive", oversampling=5)
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,170 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from protify.classifier import generate_summary_from_raw
+
+
+def reference_summary(cc, autoval_only=True):
+    # generate_summary_from_raw as it was before it was vectorized, without its printing
+    snr = 40
+
+    n_obs = max(int(col.split("_")[0]) for col in cc.columns if "_power" in col and col.split("_")[0].isdigit())
+
+    for i in range(n_obs + 1):
+        labels = (
+            f"frac_{i}h", f"{i}_power", f"{i}_medpower", f"{i}_sig",
+            f"{i}_uncsec", f"{i}_prot", f"{i}_fracuncsec", f"{i}_detect", f"{i}_sector"
+        )
+        cc[labels[0]] = pd.to_numeric(cc[labels[1]], errors="coerce") / pd.to_numeric(cc[labels[2]], errors="coerce")
+        cc[labels[6]] = pd.to_numeric(cc[labels[4]], errors="coerce") / pd.to_numeric(cc[labels[5]], errors="coerce")
+        cc[labels[7]] = (cc[labels[0]] >= snr) & (cc[labels[6]] <= 0.25)
+
+    fprots, funcs, avals, match_counts, counts, sector_counts = [], [], [], [], [], []
+
+    for j in cc.index:
+        row = cc.loc[j]
+        nanprots, nanuncs, allprots, alluncs = [], [], [], []
+        count = 0
+        sector_count = 0
+        for i in range(min(n_obs + 1, 25)):
+            if row.get(f"{i}_detect") == 1:
+                nanprots.append(row.get(f"{i}_prot"))
+                nanuncs.append(row.get(f"{i}_uncsec"))
+                count += 1
+            if isinstance(row.get(f"{i}_sector"), str):
+                sector_count += 1
+                allprots.append(row.get(f"{i}_prot"))
+                alluncs.append(row.get(f"{i}_uncsec"))
+
+        counts.append(count)
+        sector_counts.append(sector_count)
+
+        if count > 1:
+            median = np.median(nanprots)
+            median_unc = np.median(nanuncs)
+            match_count, fprot_init, func_init = 0, [], []
+
+            for prot_n, unc_n in zip(nanprots, nanuncs):
+                frac = prot_n / median
+                unci = np.sqrt((unc_n / prot_n) ** 2 + (median_unc / median) ** 2)
+                unc = frac * unci
+
+                if (frac - 2 * unc < 0.5 < frac + 2 * unc or
+                    frac - 2 * unc < 2 < frac + 2 * unc or
+                    (frac - 2 * unc < 1 < frac + 2 * unc) or
+                    (round(frac, 0) == 1 and unci < 0.05)):
+                    match_count += 1
+                    fprot_init.append(median)
+                    func_init.append(median_unc)
+                else:
+                    fprot_init.append(np.nan)
+                    func_init.append(np.nan)
+
+            match_counts.append(match_count)
+            avals.append(int(match_count >= (2 / 3) * count))
+
+            if np.all(np.isnan(fprot_init)):
+                fprot = np.nan
+                func = np.nan
+            else:
+                fprot = np.nanmax(fprot_init)
+                func = func_init[np.nanargmax(fprot_init)]
+
+        elif count == 1:
+            fprot = nanprots[0]
+            func = nanuncs[0]
+            avals.append(0)
+            match_counts.append(np.nan)
+
+        else:
+            fprot = np.median(allprots)
+            func = np.median(alluncs)
+            avals.append(np.nan)
+            match_counts.append(np.nan)
+
+        fprots.append(fprot)
+        funcs.append(func)
+
+    cc["FinalProt"] = fprots
+    cc["FinalUnc"] = funcs
+    cc["AutoVal?"] = avals
+    cc["Detect"] = counts
+    cc["Matches"] = match_counts
+    cc["Sectors"] = sector_counts
+    cc["ReliableDetection"] = cc["AutoVal?"] == 1
+
+    valid_df = cc[cc["AutoVal?"] == 1] if autoval_only else cc.copy()
+
+    snrs, powers, mpowers, mean_funcs = [], [], [], []
+    for _, row in valid_df.iterrows():
+        detects = []
+        for i in range(n_obs + 1):
+            try:
+                if (row.get(f"{i}_power") / row.get(f"{i}_medpower", 1) >= snr and
+                        row.get(f"{i}_fracuncsec", 1) <= 0.25):
+                    detects.append(i)
+            except:
+                continue
+
+        try:
+            snrs.append(np.mean([row.get(f"{i}_power") / row.get(f"{i}_medpower", 1) for i in detects]) if detects else np.nan)
+            powers.append(np.mean([row.get(f"{i}_power") for i in detects]) if detects else np.nan)
+            mpowers.append(np.mean([row.get(f"{i}_medpower") for i in detects]) if detects else np.nan)
+            mean_funcs.append(np.mean([row.get(f"{i}_fracuncsec") for i in detects]) if detects else np.nan)
+        except:
+            snrs.append(np.nan)
+            powers.append(np.nan)
+            mpowers.append(np.nan)
+            mean_funcs.append(np.nan)
+
+    valid_df["snr"] = snrs
+    valid_df["power"] = powers
+    valid_df["mpower"] = mpowers
+    valid_df["func"] = mean_funcs
+    valid_df["prot"] = valid_df["FinalProt"]
+
+    if "gmag" not in valid_df.columns:
+        valid_df["gmag"] = valid_df.get("phot_g_mean_mag", np.nan)
+
+    summary_cols = ["gmag", "prot", "snr", "power", "mpower", "func"]
+    summary_cols = [col for col in summary_cols if col in valid_df.columns]
+
+    return valid_df.dropna(subset=summary_cols)
+
+
+def random_raw(rng, n_stars=60, n_sectors=6):
+    rows = []
+    for k in range(n_stars):
+        period = rng.uniform(0.3, 25)
+        n = int(rng.integers(0, n_sectors + 1))
+        row = {"TIC": 1000 + k, "ID": "", "gmag": rng.uniform(8, 16)}
+        for i in range(n):
+            # Harmonics of the star's period, unrelated periods and failed fits
+            prot = period * rng.choice([0.5, 1, 1, 1, 2, rng.uniform(0.2, 5)])
+            medpower = rng.choice([0., rng.uniform(1e-4, 1e-2)], p=[0.1, 0.9])
+            row.update({
+                f"{i}_medpower": medpower,
+                f"{i}_peakflag": rng.choice([0, 0.5, 1, 1.5]),
+                f"{i}_power": medpower * rng.uniform(10, 120) if medpower else rng.uniform(0, 1),
+                f"{i}_prot": np.nan if rng.random() < 0.1 else prot,
+                f"{i}_sector": f"TESS Sector {i + 1:02d}",
+                f"{i}_uncsec": prot * rng.choice([rng.uniform(0.001, 0.05), rng.uniform(0.05, 0.5)]),
+            })
+        rows.append(row)
+    columns = ["TIC", "ID", "gmag"] + [f"{i}_{key}" for i in range(n_sectors)
+                                       for key in ("medpower", "peakflag", "power", "prot", "sector", "uncsec")]
+    return pd.DataFrame(rows).reindex(columns=columns)
+
+
+@pytest.mark.filterwarnings("ignore")
+@pytest.mark.parametrize("autoval_only", [True, False])
+@pytest.mark.parametrize("seed", range(10))
+def test_summary_matches_reference(tmp_path, seed, autoval_only):
+    raw, out = tmp_path / "raw.csv", tmp_path / "summary.csv"
+    random_raw(np.random.default_rng(seed)).to_csv(raw, index=False)
+
+    generate_summary_from_raw(str(raw), str(out), autoval_only=autoval_only)
+    expected = reference_summary(pd.read_csv(raw), autoval_only=autoval_only)
+    assert len(expected)
+    assert out.read_text() == expected.to_csv(index=False)
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from protify.classifier import generate_summary_from_raw, update_summary_from_raw
+from protify.runner import run_period_pipeline
+
+TICS = (100, 101, 102)
+
+
+def run(tmp_path, raw, update=False):
+    run_period_pipeline(str(tmp_path / "input.csv"), str(raw), gls_backend="fast",
+                        local_archive=str(tmp_path / "archive"), failure_log=str(tmp_path / "failures.csv"),
+                        update=update)
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_summary_update_matches_full_summary(tmp_path, write_sector):
+    rng = np.random.default_rng(0)
+    pd.DataFrame({"TIC": TICS, "gmag": 12.0}).to_csv(tmp_path / "input.csv", index=False)
+    archive = tmp_path / "archive"
+    for tic in TICS:
+        for sector in (1, 2):
+            write_sector(archive, tic, sector, rng)
+    raw, summary, full = tmp_path / "raw.csv", tmp_path / "summary.csv", tmp_path / "full.csv"
+
+    run(tmp_path, raw)
+    generate_summary_from_raw(str(raw), str(summary), autoval_only=False)
+    # A sector released after the first run, for one star only
+    write_sector(archive, TICS[0], 3, rng)
+    run(tmp_path, raw, update=True)
+    update_summary_from_raw(str(raw), str(summary), autoval_only=False)
+    generate_summary_from_raw(str(raw), str(full), autoval_only=False)
+
+    updated = pd.read_csv(summary)
+    assert "2_detect" in updated.columns
+    assert not updated["2_detect"].isna().any()
+    assert summary.read_text() == full.read_text()
+
+
+@pytest.mark.filterwarnings("ignore")
+def test_update_with_repeated_stars(tmp_path, write_sector):
+    rng = np.random.default_rng(0)
+    # Stars repeated across input chunks are analysed once, in the first run and in the update
+    pd.DataFrame({"TIC": TICS + TICS[::-1], "gmag": 12.0}).to_csv(tmp_path / "input.csv", index=False)
+    for tic in TICS:
+        write_sector(tmp_path / "archive", tic, 1, rng)
+    raw = tmp_path / "raw.csv"
+    kwds = dict(gls_backend="fast", local_archive=str(tmp_path / "archive"),
+                failure_log=str(tmp_path / "failures.csv"), input_chunksize=2)
+
+    run_period_pipeline(str(tmp_path / "input.csv"), str(raw), **kwds)
+    write_sector(tmp_path / "archive", TICS[1], 2, rng)
+    run_period_pipeline(str(tmp_path / "input.csv"), str(raw), update=True, **kwds)
+
+    result = pd.read_csv(raw)
+    assert result["TIC"].tolist() == list(TICS)
+    assert result["1_sector"].notna().tolist() == [tic == TICS[1] for tic in TICS]